@@ -3,20 +3,122 @@
     By: Alex Piazza
     Encapsulate two string symbols, left and right contexts
     Used to support context-sensitive grammars.
+
+    A context is either the universal selector ("/*"), which matches anything, a literal string of symbols, or a
+    regular expression (as recognized by Python's 're' module), which is matched against a single neighbor.
+    Literal contexts are compared to the nearest neighbors of a token, e.g. the left context "AB" matches if the
+    neighbor to the left is 'B' and the one to the left of that is 'A'.
+
+    Contexts are compiled once into matchers; a regular expression is evaluated at most once per symbol.
+
+    A context may also hold the condition of a parametric rule (see classes/symbol.py), which is compiled by the
+    ruleset that uses it, since it depends on the formal parameters of the rule's variable.
 """
 
+import re   # For matching context-sensitive tokens
+
+from util.expand import tokenize
+
+UNIVERSAL = "/*"
+REGEX_CHARS = set( ".^$*?{}()|\\" )     # Characters that make a context a regular expression
+
+class ContextMatcher(object):
+    """ Helper class which tests the neighbors of a token against one side of a context. """
+
+    def __init__(self, string, reverse):
+        """ Constructor
+
+        Args:
+            string: One side of a context, a literal string of symbols or a regular expression
+            reverse: True for a left context, whose nearest neighbor is the last symbol of the string
+        """
+        self.regex = None
+        self.matches = dict()
+        self.symbols = tuple( tokenize( string ) )
+
+        if any( char in REGEX_CHARS for char in string ) or string.startswith("["):
+            self.regex = re.compile( string )
+            self.length = 1
+        else:
+            if reverse:
+                self.symbols = self.symbols[::-1]
+            self.length = len(self.symbols)
+
+    def accepts(self, neighbors):
+        """ Check whether the neighbors of a token satisfy this context.
+
+        Args:
+            neighbors: A sequence of neighboring symbols, nearest first, at least 'length' long if available
+        Returns:
+            True if the neighbors match. False otherwise.
+        """
+        if len(neighbors) < self.length:
+            return False
+
+        if self.regex is None:
+            return tuple( neighbors[:self.length] ) == self.symbols
+
+        symbol = neighbors[0]
+        result = self.matches.get( symbol )
+        if result is None:
+            result = self.matches[symbol] = self.regex.fullmatch( symbol ) is not None
+        return result
+
 class Context(object):
 
-    def __init__(self, left="/*", right="/*"):
+    def __init__(self, left=UNIVERSAL, right=UNIVERSAL, condition=None):
         """ Constructor.
-        
+
         Args:
             left: The left token.
             right: The right token.
+            condition: The condition on the parameters of a parametric token, or None.
         """
         assert isinstance(left, str)
         assert isinstance(right, str)
 
         self.right = right
         self.left = left
+        self.condition = condition
+        self.leftMatcher = None if left == UNIVERSAL else ContextMatcher( left, True )
+        self.rightMatcher = None if right == UNIVERSAL else ContextMatcher( right, False )
 
+    def __eq__(self, other):
+        return isinstance( other, Context ) and self.left == other.left and self.right == other.right and \
+            self.condition == other.condition
+
+    def __hash__(self):
+        return hash( ( self.left, self.right, self.condition ) )
+
+    def __repr__(self):
+        """ String representation.
+
+        Returns:
+            A console-friendly string representation.
+        """
+        return "{} < _ > {}{}".format( self.left, self.right, "" if self.condition is None else " : " + self.condition )
+
+    def isUniversal(self):
+        """ Return whether this context matches every token. """
+        return self.leftMatcher is None and self.rightMatcher is None and self.condition is None
+
+    def isContextSensitive(self):
+        """ Return whether this context depends on the neighbors of a token. """
+        return self.leftMatcher is not None or self.rightMatcher is not None
+
+    def getLength(self):
+        """ Return the number of (left, right) neighbors needed to test this context. """
+        return ( 0 if self.leftMatcher is None else self.leftMatcher.length,
+                 0 if self.rightMatcher is None else self.rightMatcher.length )
+
+    def matches(self, left, right):
+        """ Check whether the neighbors of a token satisfy this context.
+
+        Args:
+            left: Sequence of symbols to the left of the token, nearest first
+            right: Sequence of symbols to the right of the token, nearest first
+        Returns:
+            True if both sides match. False otherwise.
+        """
+        return ( self.leftMatcher is None or self.leftMatcher.accepts( left ) ) and \
+               ( self.rightMatcher is None or self.rightMatcher.accepts( right ) )
@@ -32,6 +32,17 @@ produce fractal images. L-Systems have:
         Where 'symbol' is a variable symbol and 'rule' is a rule object (see rule.py):
 """
 
+from util.expand import iterTokens, iterCommands, decode   # For lazily expanding lsys objects
+from util.ruletable import RuleTable                # For compiling rulesets
+from util.growth import predict                     # For predicting the size of expansions
+from util.access import RandomAccess                # For random access into expansions
+from util.bounds import Bounds                      # For bounding expansions without drawing them
+from util.generation import iterGenerations         # For rewriting generations from one another
+from classes.symbol import parseModules             # For the alphabet of parametric lsys objects
+from util.probmask import SEED                      # For seeding the random choices of stochastic lsys objects
+from util.stream import getRootKey                  # For keying the random choices of stochastic lsys objects
+from util.profiler import PROFILER, profiled        # For instrumenting expansions
+
 class Lsys( object ):
 
 
@@ -65,6 +76,10 @@ class Lsys( object ):
         self.ruleset = ruleset
         self.vars = []
         self.alphabet = self.genAlphabet()
+        self.table = None
+        self.access = None
+        self.bounds = None
+        self.seed = SEED
 
     def __repr__( self ):
         """ Create and return the string representation of an lsys object.
@@ -77,17 +92,18 @@ class Lsys( object ):
         rule_string = ""
         for var in self.ruleset.keys():
             rule = self.ruleset[var]
-            for context in rule.productions.keys():
+            signature = "{}({})".format( var, ",".join( rule.params ) ) if rule.params else var
+            for ( context, cases ) in rule.getProductions():
                 left_context = ("" if context.left == "/*" else "{} < ".format(context.left))
                 right_context = ("" if context.right == "/*" else " > {}".format(context.right))
+                condition = ("" if context.condition is None else " : {}".format(context.condition))
 
-                cases = rule.productions[context]
                 case_string = ""
-                for i in range(len(cases.results)):
-                    probability_string = "" if cases.probabilities[i] == 1 else "({}%) ".format(round(cases.probabilities[i] * 100, 2))
-                    case_string += "{}{}; ".format( probability_string, cases.results[i])
+                for case in cases.mask:
+                    probability_string = "" if case.prob == 1 else "({}%) ".format(round(case.prob * 100, 2))
+                    case_string += "{}{}; ".format( probability_string, case.elem )
 
-                rule_string += "{0}{1}{2} -> {3}\n".format(left_context, var, right_context, case_string)
+                rule_string += "{0}{1}{2}{3} -> {4}\n".format(left_context, signature, right_context, condition, case_string)
 
 
         if len(self.alphabet) == 0:
@@ -106,6 +122,43 @@ class Lsys( object ):
                 self.vars += var
         return self.vars
 
+    def compile(self):
+        """ Compile the ruleset of this lsys into a lookup table. Must be called again if the ruleset changes.
+
+        Returns:
+            The compiled RuleTable, see util/ruletable.py
+        """
+        self.table = RuleTable( self.ruleset )
+        return self.table
+
+    def getDefinition(self):
+        """ Return everything the expansion of this lsys depends on: its angle, axiom, seed and ruleset, but not its
+        name. Two lsys objects w/ the same definition draw the same thing.
+
+        Returns:
+            A tuple of strings and numbers, whose repr() is stable across sessions.
+        """
+        rules = []
+        for var in sorted( self.ruleset.keys() ):
+            rule = self.ruleset[var]
+            productions = tuple( ( context.left, context.right, context.condition,
+                                   tuple( ( case.elem, case.prob ) for case in cases.mask ) )
+                                 for ( context, cases ) in rule.getProductions() )
+            rules.append( ( var, tuple( rule.params ), productions ) )
+        return ( self.angle, self.axiom, self.seed, tuple( rules ) )
+
+    def getKey(self):
+        """ Return the root key of the random choices of this lsys, derived from its 'seed' field.
+        Choices are a function of the seed and the position of each token, so runs w/ the same seed are reproducible.
+        """
+        return getRootKey( self.seed )
+
+    def getRuleTable(self):
+        """ Return the compiled ruleset of this lsys, compiling it if needed. """
+        if self.table is None:
+            self.compile()
+        return self.table
+
     def genAlphabet(self):
         """ Create and return the alphabet of this lsys.
         
@@ -116,10 +169,9 @@ class Lsys( object ):
         for var in self.ruleset.keys():
             if var not in result:
                 result.append(var)
-            for context in self.ruleset[var].productions.keys():
-                cases = self.ruleset[var].productions[context]
-                for string in cases.results:
-                    for symbol in string:
+            for cases in self.ruleset[var].productions.values():
+                for case in cases.mask:
+                    for ( symbol, args ) in parseModules( case.elem ):
                         if symbol not in result:
                             result.append(symbol)
         return result
@@ -142,6 +194,172 @@ class Lsys( object ):
         """
         return self.ruleset[var].getResult( left_token, right_token )
 
+    @profiled( "expand" )
+    def expand( self, depth ):
+        """ Build the full string of this lsys after a given number of iterations.
+        Context-free lsys objects w/o size modifiers are rewritten a whole generation at a time.
+
+        Args:
+            depth: Number of iterations
+        Returns:
+            The final-depth string. Its length grows exponentially with the depth.
+        """
+        table = self.getRuleTable()
+        if table.hasFastPath() or table.isBatched():
+            keys = table.getChildKeys( self.axiom, self.getKey() )
+            string = table.expand( self.axiom, depth, keys ).replace(" ", "")
+        else:
+            string = "".join( self.iterTokens( depth ) )
+        PROFILER.countString( string )
+        return string
+
+    def iterGenerations( self, first=0, last=None ):
+        """ Generate the generations of this lsys, each rewritten from the one before instead of from the axiom.
+        Long generations are kept in temporary files, see util/generation.py.
+
+        Args:
+            first: Number of iterations of the first generation
+            last: Number of iterations of the last generation, or None to go on forever
+        Returns:
+            A generator of Generation objects; each is closed once the next one is generated.
+        Raises:
+            ValueError: If the generations of this lsys can't be rewritten one at a time
+        """
+        return iterGenerations( self, first, last )
+
+    def predict( self, depth ):
+        """ Predict the size of this lsys after a given number of iterations, without expanding it.
+        Stochastic rules give expected values.
+
+        Args:
+            depth: Number of iterations
+        Returns:
+            A map with the number of 'tokens', the number of 'segments' drawn, and the 'histogram' of symbols.
+        Raises:
+            ValueError: If this lsys is parametric or context-sensitive
+        """
+        return predict( self, depth )
+
+    def iterTokens( self, depth ):
+        """ Lazily generate the tokens of this lsys after a given number of iterations.
+        The full string is never built, so memory use does not grow with the length of the result.
+
+        Args:
+            depth: Number of iterations
+        Returns:
+            A generator of string tokens, see util/expand.py
+        """
+        return iterTokens( self, depth )
+
+    def iterCommands( self, depth, size=1, start=0, stop=None ):
+        """ Lazily generate the turtle commands of this lsys after a given number of iterations.
+        A range of tokens may be given to generate the commands of only part of a deterministic lsys.
+
+        Args:
+            depth: Number of iterations
+            size: Unit length of a forward step
+            start: Index of the first token to interpret
+            stop: Index after the last token to interpret, or None for the end of the string
+        Returns:
+            A generator of (token, arg) tuples, see util/expand.py
+        """
+        if start == 0 and stop is None:
+            return iterCommands( self, depth, size )
+
+        access = self.getRandomAccess()
+        if stop is None:
+            stop = access.getTotalLength( self.axiom, depth )
+        return decode( access.walk( self.axiom, depth, size, start, stop ), self.angle )
+
+    def getRandomAccess( self ):
+        """ Return the random access tables of this lsys, rebuilding them if the ruleset or angle changed.
+
+        Raises:
+            ValueError: If this lsys is not deterministic
+        """
+        table = self.getRuleTable()
+        if self.access is None or self.access.table is not table or self.access.angle != self.angle:
+            self.access = RandomAccess( table, self.angle )
+        return self.access
+
+    def getLength( self, depth ):
+        """ Get the number of tokens of this (deterministic) lsys after a given number of iterations. """
+        return self.getRandomAccess().getTotalLength( self.axiom, depth )
+
+    def getToken( self, depth, k ):
+        """ Get a single token of this lsys after a given number of iterations, without expanding the rest.
+
+        Args:
+            depth: Number of iterations
+            k: Index of the token
+        Returns:
+            The k-th token
+        Raises:
+            ValueError: If this lsys is not deterministic
+            IndexError: If k is out of range
+        """
+        return self.getRandomAccess().getToken( self.axiom, depth, k )
+
+    def getSlice( self, depth, start, stop ):
+        """ Get the tokens [start, stop) of this lsys after a given number of iterations, without expanding the rest.
+        Subtrees inside the range are rewritten a whole generation at a time, where the ruleset allows it.
+
+        Args:
+            depth: Number of iterations
+            start: Index of the first token
+            stop: Index after the last token
+        Returns:
+            The slice, as a string
+        Raises:
+            ValueError: If this lsys is not deterministic
+            IndexError: If start is out of range
+        """
+        access = self.getRandomAccess()
+        if self.getRuleTable().hasFastPath():
+            return access.getString( self.axiom, depth, start, stop )
+        pairs = access.walk( self.axiom, depth, 1, start, stop )
+        return "".join( token for ( token, size ) in pairs )
+
+    def getTurtleState( self, depth, k, size=1 ):
+        """ Get the state of the turtle just before it reads the k-th token, without drawing anything before it.
+
+        Args:
+            depth: Number of iterations
+            k: Index of the token
+            size: Unit length of a forward step
+        Returns:
+            A TurtleState, see util/access.py
+        Raises:
+            ValueError: If this lsys is not deterministic
+            IndexError: If k is out of range
+        """
+        return self.getRandomAccess().getTurtleState( self.axiom, depth, size, k )
+
+    def getBounds( self, depth, size=1 ):
+        """ Get a bounding box of the drawing of this lsys after a given number of iterations, without drawing it.
+        The box is exact for deterministic lsys objects whose angle divides a full circle, and may be larger otherwise.
+
+        Args:
+            depth: Number of iterations
+            size: Unit length of a forward step
+        Returns:
+            A tuple of (xmin, ymin, xmax, ymax), or None if nothing is drawn.
+        Raises:
+            ValueError: If this lsys is parametric, or may turn to too many headings to be bounded
+        """
+        return self.getBoundsTable().getBounds( self.axiom, depth, size )
+
+    def getBoundsTable( self ):
+        """ Return the bounds of the subtrees of this lsys, rebuilding them if the ruleset or angle changed.
+
+        Raises:
+            ValueError: If this lsys is parametric
+        """
+        table = self.getRuleTable()
+        if self.bounds is None or self.bounds.table is not table or self.bounds.angle != self.angle:
+            self.bounds = Bounds( table, self.angle )
+        return self.bounds
+
 def getEmptyLsys():
     """ Create and return an lsys with default params """
     return Lsys( str(), int(), str(), dict() )
@@ -25,16 +25,19 @@
 
 
 - Context-Sensitive -
-:NOTE: This has yet to be implemented :NOTE:
 
     This is also an extension on Stochastic L-Systems. A variable will map to many result strings, but the result will
     be chosen depending on the variable's neighboring symbols. Consider the axiom 'ABC'. Given a rule for 'B', say
     'B' -> 'A' only if 'A < B > C' will map the variable 'B' to 'A' if, and only if, 'A' is a symbol to the left of 'B',
-    and 'C' is a symbol to the right of 'B', otherwise 'B' implicitly maps to nothing.
+    and 'C' is a symbol to the right of 'B', otherwise 'B' falls back on its context-free cases, if it has any, or is
+    left unchanged.
     Ex. 'B' -> 'A' only if 'A < B > C'
 
+    Neighbors are found the way a turtle would see them: branches are skipped, so in 'A[+C]B' the left neighbor of
+    'B' is 'A' and the left neighbor of 'C' is also 'A'. The symbol before a ']' has no right neighbor. Turns, color
+    codes and size modifiers are ignored.
+
 - Parametrically -
-:NOTE: This has yet to be implemented :NOTE:
 
     This is by far the most complex L-System grammar. In it, some variables can be assigned parameters. 'A' with
     parameters 'x' and 'y' would resemble 'A(x,y)'. The rules would then map variables with specific parameters to
@@ -47,29 +50,37 @@
         A(6,6), etc.
 
 
+    Parametric rules are implemented as described in classes/symbol.py. The condition of a case is kept in its
+    context, so a rule may have several productions w/ different conditions; the first whose condition holds
+    is used. A token whose number of parameters doesn't match the rule is left unchanged.
+
     In this implementation, a rule has 'productions', which map 'context' objects to 'cases' objects.
     Context objects encapsulate two string, which correspond to the left/right contexts of a given token.
     Cases objects encapsulate a list of result strings and it's respective probability mask.
 
 """
 
-import re   # For matching context-sensitive tokens
 from util.probmask import ProbabilityMask
+from classes.context import Context
+from classes.symbol import isParametric
 
 DEFAULT_RESULT_STRING = ""
 
 class Rule( object ):
 
-    def __init__(self, token=str() ):
+    def __init__(self, token=str(), params=() ):
         """ Constructor. 
 
         Args:
             token: The token that this rule will transform.
+            params: The names of the formal parameters of the token, if it is parametric.
         """
         assert isinstance( token, str )
 
         self.token = token
+        self.params = tuple( params )
         self.mask = ProbabilityMask()
+        self.productions = { Context(): self.mask }     # The context-free cases are the universal context
 
     def __repr__(self):
         """ String representation.
@@ -79,6 +90,29 @@ class Rule( object ):
         """
         return f"{self.token} -> " + self.mask.asPrintString()
 
+    def addProduction(self, context, mask):
+        """ Add (or replace) the cases used when the neighbors of the token match a context.
+
+        Args:
+            context: A Context object
+            mask: The ProbabilityMask of cases for that context
+        """
+        if context.isUniversal():
+            self.mask = mask
+        self.productions[context] = mask
+
+    def getProductions(self):
+        """ Get the productions of this rule, in the order in which they are tried.
+
+        Returns:
+            A list of (context, mask) tuples; context-sensitive productions first, in the order they were added,
+            then the context-free cases.
+        """
+        result = [ ( context, mask ) for ( context, mask ) in self.productions.items() if not context.isUniversal() ]
+        if not self.mask.isEmpty():
+            result.append( ( Context(), self.mask ) )
+        return result
+
     def getResult(self, left_token="", right_token=""):
         """ Get the string output (result) associated with this rule 
         
@@ -88,7 +122,12 @@ class Rule( object ):
         Returns:
             The result of applying this rule to the token, relative to the adjacent tokens.
         """
-        return self.mask.roll()
+        if len(self.productions) == 1:
+            return self.mask.roll()
+        for ( context, mask ) in self.getProductions():
+            if context.matches( [ left_token ] if left_token else [], [ right_token ] if right_token else [] ):
+                return mask.roll()
+        return self.token
                         
     def isStochastic(self):
         """ Check whether this rule is stochastic or not.
@@ -96,9 +135,10 @@ class Rule( object ):
         Returns:
             True if this rule has a properly populated probability mask. False otherwise
         """
-        result = not self.mask.isEmpty()
-        result &= len(self.mask) != 1       # Deterministic rules have only one outcome.
-        return result
+        for mask in self.productions.values():
+            if not mask.isEmpty() and len(mask) != 1:   # Deterministic rules have only one outcome.
+                return True
+        return False
 
     def isContextSensitive(self):
         """ Check whether this rule is context-sensitive or not.
@@ -106,5 +146,23 @@ class Rule( object ):
         Returns:
             True if this rule is context-sensitive. False otherwise.
         """
-        # TODO
+        for ( context, mask ) in self.productions.items():
+            if context.isContextSensitive() and not mask.isEmpty():
+                return True
+        return False
+
+    def isParametric(self):
+        """ Check whether this rule transforms a parametric token, or has conditions or parametric results.
+
+        Returns:
+            True if this rule is parametric. False otherwise.
+        """
+        if len(self.params) > 0:
+            return True
+        for ( context, mask ) in self.productions.items():
+            if context.condition is not None and not mask.isEmpty():
+                return True
+            for item in mask.mask:
+                if isParametric( item.elem ):
+                    return True
         return False
@@ -1,50 +1,189 @@
 """
     symbol.py
-    template for inevitable switch from informal string symbols to a formal
-    object-oriented symbol definition when
+    Parametric symbols (modules)
 
-    symbol params should map string variables to integer
+    A parametric symbol is a token with a list of numeric parameters, e.g. 'A(1,2.5)'. Rules of parametric
+    L-Systems are written with formal parameters, e.g. var="A(x,y)", and their cases may have a condition
+    (cond="x < 3") and a result whose parameters are arithmetic expressions (result="A(x+1,y*2)F(x)").
 
-    Also funcitons as a Parametric Module
+    Conditions and results are compiled once, when the lsys is loaded, into python functions of the formal
+    parameters; a result compiles to a function returning a tuple of (token, parameters) modules.
+    Expressions are python expressions, w/ '^' accepted for exponentiation, and may use the functions of the
+    'math' module.
 
-    Fields
-    token - A string token representing the symbol
-    bools - A collection of boolean expressions, all of which must be
-        evaluated true for the parametric to be considered true
-    params - A map of string variable names to integer/float values
+    A module is represented as a tuple of its token and a tuple of its parameter values, e.g. ('A', (1, 2.5)).
+    Color codes ('#1') and size modifiers ('@0.5') are tokens without parameters.
+"""
 
+import math
 
-NOTE: Unused?
-"""
+from util.expand import readOperand, COLOR_TOKEN, SIZE_TOKEN
+
+# Errors raised by evaluating an expression, e.g. a division by zero or an unknown name
+EVALUATION_ERRORS = ( ArithmeticError, NameError, TypeError, ValueError )
+
+# Names available to expressions
+NAMESPACE = { name: getattr( math, name ) for name in dir( math ) if not name.startswith("_") }
+NAMESPACE["__builtins__"] = { "abs": abs, "min": min, "max": max, "round": round, "int": int, "float": float }
+
+def splitArguments( string ):
+    """ Split a parameter list on its top-level commas.
+
+    Args:
+        string: The text between the parentheses of a module, e.g. 'x+1,max(y,2)'
+    Returns:
+        A list of the argument strings.
+    """
+    result = []
+    depth = 0
+    start = 0
+    for ( i, char ) in enumerate( string ):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            result.append( string[start:i] )
+            start = i + 1
+    if string[start:].strip() != "" or len(result) > 0:
+        result.append( string[start:] )
+    return result
+
+def parseModules( string ):
+    """ Split a string of parametric symbols into tokens and their (unevaluated) arguments.
+
+    Args:
+        string: A string of symbols, e.g. 'A(x+1,y)F(x)[+B]'
+    Returns:
+        A list of (token, [argument strings]) tuples.
+    Raises:
+        ValueError: If a parameter list isn't closed.
+    """
+    result = []
+    i = 0
+    while i < len(string):
+        char = string[i]
+        i += 1
+        if char == COLOR_TOKEN:
+            ( operand, i ) = readOperand( string, i, "0123456789" )
+            result.append( ( char + operand, [] ) )
+        elif char == SIZE_TOKEN:
+            ( operand, i ) = readOperand( string, i, "0123456789.QI" )
+            result.append( ( char + operand, [] ) )
+        elif char == " ":
+            pass
+        elif i < len(string) and string[i] == "(":
+            depth = 0
+            for j in range( i, len(string) ):
+                if string[j] == "(":
+                    depth += 1
+                elif string[j] == ")":
+                    depth -= 1
+                    if depth == 0:
+                        break
+            if depth != 0:
+                raise ValueError( "Unclosed parameter list in '{}'".format( string ) )
+            result.append( ( char, splitArguments( string[i+1:j] ) ) )
+            i = j + 1
+        else:
+            result.append( ( char, [] ) )
+    return result
+
+def isParametric( string ):
+    """ Return whether a string has any parametric symbols. """
+    return "(" in string
+
+def toPython( expression ):
+    """ Translate an expression to python syntax. """
+    return expression.replace( "^", "**" ).replace( "&&", " and " ).replace( "||", " or " )
 
 class symbol(object):
 
-    def __init__( self, token, bools=[], params=dict() ):
+    def __init__( self, token, params=() ):
         """ Constructor
-        
+
         Args:
             token: The string token that uniquely identifies this symbol.
-            bools: Boolean expressions that should be evaluated to true 
-            params: Map of tokens that parameterize this symbol.
+            params: The names of the formal parameters of this symbol.
         """
         self.token = token
-        self.bools = bools
-        self.params = params
+        self.params = tuple( params )
+
+    def __repr__( self ):
+        return "{}({})".format( self.token, ",".join( self.params ) ) if self.params else self.token
+
+    def describe( self ):
+        """ Return where the expressions of this symbol come from, for error messages. """
+        return "rule {}".format( self ) if self.token else "the axiom"
 
-    def evalBools( self ):
-        """ Evaluate this symbol's boolean expressions.
+    def compile( self, source, expression=None ):
+        """ Compile a lambda over the formal parameters of this symbol.
 
+        Args:
+            source: The body of the lambda, a python expression
+            expression: The expression 'source' was translated from, for error messages
+        Returns:
+            The function
+        Raises:
+            ValueError: If the expression isn't valid python
+        """
+        try:
+            return eval( "lambda {}: {}".format( ",".join( self.params ), source ), NAMESPACE )
+        except SyntaxError as e:
+            raise ValueError( "invalid expression '{}' in {}: {}".format(
+                source if expression is None else expression, self.describe(), e.msg ) )
+
+    def compileCondition( self, condition ):
+        """ Compile a condition into a function of the formal parameters.
+
+        Args:
+            condition: A boolean expression, e.g. 'x < 3'
         Returns:
-            True if all the boolean expressions evaluate to true.
+            A function returning a truthy value when the condition holds.
         """
+        return self.compile( "({})".format( toPython( condition ) ), condition )
+
+    def compileResult( self, result ):
+        """ Compile a result string into a function of the formal parameters.
+
+        Args:
+            result: A string of parametric symbols, e.g. 'A(x+1,y*2)F(x)'
+        Returns:
+            A function returning a tuple of (token, parameter values) modules.
+        Raises:
+            ValueError: If an expression isn't valid, or a parameter list isn't closed
+        """
+        modules = []
+        for ( token, args ) in parseModules( result ):
+            values = "".join( "({}),".format( toPython( arg ) ) for arg in args )
+            modules.append( "({!r}, ({}))".format( token, values ) )
+        return self.compile( "({},)".format( ",".join( modules ) ) if modules else "()", result )
+
+def parseSignature( signature ):
+    """ Parse the variable of a parametric rule.
 
-        # Variables must be cast from params before being evaluated
-        for var in self.params.keys():
-            exec( "{0} = {1}".format( var, self.params[var] ) )
+    Args:
+        signature: e.g. 'A(x,y)' or 'A'
+    Returns:
+        A symbol object
+    """
+    if not isParametric( signature ):
+        return symbol( signature )
+    ( ( token, params ), ) = parseModules( signature )
+    return symbol( token, [ param.strip() for param in params ] )
 
-        # Evaluate booleans
-        for b in self.bools:
-            if eval( b ):
-                return False
+def evaluateModules( string ):
+    """ Evaluate a string of parametric symbols whose arguments are constants, e.g. an axiom.
 
-        return True
+    Args:
+        string: e.g. 'A(1,2)F(0.5)'
+    Returns:
+        A tuple of (token, parameter values) modules.
+    Raises:
+        ValueError: If an expression is invalid, or can't be evaluated (e.g. a division by zero)
+    """
+    function = symbol( "" ).compileResult( string )
+    try:
+        return function()
+    except EVALUATION_ERRORS as e:
+        raise ValueError( "invalid expression in the axiom '{}': {}".format( string, e ) )
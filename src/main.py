@@ -3,9 +3,14 @@ Main frontend for lsys
 Prompts for in-file, read and construct lsys objects
     Then prompt for # of iterations
     Draw, wait
-Prompt to save the image (defaults to scalable vector img)
+Prompt to save the image (as a scalable vector img, redrawn w/o the turtle)
 Goto 1
 
+Or, w/o any prompt, render many lsys objects to image files at once (see util/batch.py for every option):
+    python3 src/main.py batch src/data/all.xml --names all --depths 1-6 --formats svg,png --workers 8
+Or benchmark them, and compare the results to an earlier run (see util/benchmark.py):
+    python3 src/main.py bench src/data/all.xml --output bench.json --baseline baseline.json
+
 The alphabet has preset tokens that automatically correspond to turtle actions:
     'F' 'G' 'H' 'I' 'J' - Forward by a given unit (Draw)
     'f' 'g' 'h' 'i' 'j' - Forward by a given unit (Do not draw)
@@ -18,14 +23,26 @@ The alphabet has preset tokens that automatically correspond to turtle actions:
     '#' - Change the color of the pen; MUST be followed by a six digit hex string, which indicates the color
     Unlisted capital letters have no associated action (A, B, C, X, Y, Z are conevention).
 
+In parametric lsys objects, the first parameter of a forward token scales its length, e.g. 'F(0.5)', and the first
+parameter of a turn is its angle, e.g. '+(30)'. See classes/symbol.py.
+
 Following commands are:
     'load [file]' or 'l [file]'                     -   Read and parse lsys objects from a given data file
     'display'                                       -   Print all currently loaded lsys objects
     'run [lsys_name]'                               -   Run recursions on a loaded lsys object, uses python's turtle
     'runthru [lsys_name] [first_itr] [final_itr]'   -   Run a sequence of recursions on a lsys object
-    'mod [lsys_name] [lsys_attr] [new_attr_val]'    -   Modify a field of an lsys (angle or axiom)
+    'predict [lsys_name] [itr]'                     -   Predict the number of tokens & segments of a run, w/o running it
+    'mod [lsys_name] [lsys_attr] [new_attr_val]'    -   Modify a field of an lsys (angle, axiom or seed)
     'dump'                                          -   Unload all currently loaded lsys objects
     'size [int]'                                    -   Change the size of the picture (5 by default)
+    'save [filename] [pixels]'                      -   Save the last run to an svg ('.svgz' is compressed) or a png
+    'cache [megabytes]'                             -   Show the subtree cache, or change its capacity (0 disables it)
+    'diskcache [megabytes]'                         -   Show the geometry cache on disk, or change its capacity
+    'stats [on|off|reset|file.json]'                -   Show the profile of the runs since 'stats on', or export it
+    'budget [limit] [value]'                        -   Show or change the limits of a run (tokens, segments, seconds,
+                                                        memory in MB; 0 removes one), or 'budget progress on|off'
+    'workers [int]'                                 -   Change the number of processes used by 'run' (1 by default)
+    'zoom [xmin] [ymin] [xmax] [ymax]'              -   Only draw a region of the next runs & saves; 'zoom' to reset
     'help'                                          -   Print this help screen
     'exit' or 'quit'                                -   Quit the program
 """
@@ -34,23 +51,60 @@ import sys                  # For Command Line Arguments
 import os                   # For determining the current directory (image saving & file loading)
 import datetime             # For naming images
 import turtle as t          # For Drawing TODO: Move this
-from math import sqrt
 
 from util.io import *       # For Reading/Writing lsys to/from files
 from util.stack import *    # For Stack support
-
-try:
-    import canvasvg         # For saving images. This is a non-standard module, so report it if it cannot be opened.
-except ImportError:
-    print("Warning: Could not import 'canvasvg'. You will be unable to save images.")
+from util.cache import SUBTREE_CACHE    # For limiting the memory used by expansions
+from util.parallel import interpretParallel     # For expanding lsys objects across processes
+from util.geometry import interpretLsys         # For drawing lsys objects w/o the turtle
+from util.svg import writeSvg, getBounds        # For saving images
+from util.raster import writePng, IMAGE_SIZE    # For saving raster images
+from util.lod import interpretCulled            # For skipping what can't be seen
+from util.simplify import simplify              # For drawing & saving fewer segments
+from util.diskcache import GeometryCache, getKey    # For loading runs that were already interpreted
+from util.generation import isIncremental       # For rewriting the generations of 'runthru' from one another
+from util.batch import runBatch                 # For rendering w/o the prompt
+from util.benchmark import runBenchmark         # For measuring the speed of every stage
+from util.profiler import PROFILER, profiled    # For telling where the time of a run went
+from util.budget import BUDGET, BudgetError     # For limiting, and reporting the progress of, long runs
+from util.library import Library, loadLibrary   # For loading lsys objects only once they are used
+from xml.etree.ElementTree import ParseError    # For reporting data files that aren't well-formed
 
 # Global Stack (for saving turtle position and heading between recursive function calls)
 STACK = Stack()
 
+# The geometry of runs, kept on disk between sessions
+GEOMETRY_CACHE = GeometryCache( os.path.join( os.path.dirname(__file__), "cache" ) )
+
+# Number of processes used to expand and interpret an lsys
+WORKERS = 1
+
+# The (lsys, depth, size) of the last run, which is redrawn by 'save'
+LAST_RUN = None
+
+# Blank space around a drawing, relative to its size
+MARGIN = 0.05
+
+# The (xmin, ymin, xmax, ymax) region drawn by 'run' and 'save', or None to fit the whole drawing
+VIEWPORT = None
+
+# Subtrees smaller than this many pixels are drawn as a single line
+LOD_PIXELS = 1
+
+# Whether duplicate edges are removed & collinear segments merged before drawing or saving
+SIMPLIFY = True
+
+# Longest expansion of a stochastic, parametric or context-sensitive lsys that is drawn headlessly first, to fit the
+# window to it exactly
+MAX_FIT_LENGTH = 1 << 16
+
 DEFAULT_COLOR_FILE = "src/misc/colors.xml"
 
 DEFAULT_DATA_FILE = "src/data/all.xml"
 
+PROFILER.watch( "subtree cache", SUBTREE_CACHE )
+PROFILER.watch( "geometry cache", GEOMETRY_CACHE )
+
 try:
     COLORS = getColors( DEFAULT_COLOR_FILE )
 except FileNotFoundError:
@@ -58,28 +112,29 @@ except FileNotFoundError:
 except ValueError:
     COLORS = None
 
-def chooseAction( token, size, angle ):
+def chooseAction( token, arg ):
     """ Determine which turtle action to use.
     
-    Helper for recursive turtle implementation
+    Helper for the turtle implementation
     Args:
         token: A string, token from lsys alphabet
-        size: An integer, the length the turtle will go forward
-        angle: An integer, the angle associated with the lsys
+        arg: The argument of the command; the length the turtle will go forward, the angle it will turn,
+            or the id of the color it will use (see util/expand.py)
     """
     global STACK
+    global COLORS
 
     # Defaults
     if token in "FGHIJ":
-        t.forward( size )
-    elif token in "fjhij":
+        t.forward( arg )
+    elif token in "fghij":
         t.up()
-        t.forward( size )
+        t.forward( arg )
         t.down()
     elif token == "-":
-        t.right( angle )
+        t.right( arg )
     elif token == "+":
-        t.left( angle )
+        t.left( arg )
 
     # Stack related
     elif token == "[":
@@ -93,107 +148,264 @@ def chooseAction( token, size, angle ):
 
     # Fractal Tree related
     elif token == "L":      # Draws a line segment 'leaf'
-        t.forward(size)
+        t.forward(arg)
         t.lt(45)
-        t.forward(size/4)
-        t.backward(size/4)
+        t.forward(arg/4)
+        t.backward(arg/4)
         t.rt(90)
-        t.forward(size/4)
-        t.backward(size/4)
+        t.forward(arg/4)
+        t.backward(arg/4)
         t.lt(45)
 
+    elif token == "#":
+        try:
+            t.color( COLORS[ arg ] )
+
+        # No/invalid color file? Who cares?
+        except t.TurtleGraphicsError:
+            pass
+        except TypeError:
+            pass
+        except KeyError:
+            pass
+
     return None
 
-def runLsys( lsys, depth, size ):
-    """ Recursive function that recurses a given number of times, and determines turtle action.
+def runLsys( lsys, depth, size, geometry=None ):
+    """ Expand an lsys a given number of times, and determine turtle actions.
     
     Args:
         lsys: An lsys object
         depth: Number of recursions
         size: Unit size of turtle
-    Raises:
-        RecursionError: If the maximum number of stack frame is exceeded.
+        geometry: The Geometry of the run, if it was already interpreted headlessly
     """
 
     # Clear stack, failsafe against unbalanced lsys
     global STACK
+    global LAST_RUN
     if not STACK.isEmpty():
         STACK = Stack()
+    LAST_RUN = ( lsys, depth, size )
 
-    t.setup()
-    t.tracer(False) # Refresh the drawing manually, must use turtle.update() at the end
-    t.hideturtle()
-    t.setworldcoordinates( -300, -300, 300, 300 ) # NOTE: This may cause problems on different resolutions
-    t.reset()
-
-    print("The image is being generated. This may or may not take a while.")
+    print("The image is being generated. This may or may not take a while. Ctrl-C cancels it.")
 
     try:
-        runLsysHelper( lsys.axiom, lsys, depth, size )
+        pixels = getWindowPixels()
+        t.tracer(False) # Refresh the drawing manually, must use turtle.update() at the end
+        t.hideturtle()
+        BUDGET.begin( lsys, depth, geometry is None and not isCulled( lsys, depth, pixels ) )
+
+        # Fit the window to the drawing before drawing it; the bounds of deterministic lsys objects are exact, so
+        # only small stochastic or parametric ones are drawn headlessly first, to get theirs exactly too
+        if geometry is None:
+            geometry = cullLsys( lsys, depth, size, pixels )
+        if geometry is None:
+            geometry = GEOMETRY_CACHE.get( getKey( lsys, depth, size ) )
+        if geometry is None and WORKERS > 1:
+            geometry = interpretGeometry( lsys, depth, size )
+        elif geometry is None and not lsys.getRuleTable().isDeterministic():
+            try:
+                if lsys.predict( depth )["tokens"] <= MAX_FIT_LENGTH:
+                    geometry = interpretGeometry( lsys, depth, size )
+            except ValueError:      # Parametric or context-sensitive, its size can't be predicted
+                geometry = interpretGeometry( lsys, depth, size )
+
+        if VIEWPORT is not None:
+            bounds = VIEWPORT
+        elif geometry is not None:
+            bounds = getBounds( geometry ) if len(geometry) > 0 else None
+        else:
+            try:
+                bounds = lsys.getBounds( depth, size )
+            except ValueError:
+                bounds = None
+
+        fitWindow( bounds )
+        t.reset()
+
+        if geometry is not None:
+            drawGeometry( simplify( geometry ) if SIMPLIFY else geometry )
+        else:
+            runLsysHelper( lsys, depth, size )
         t.hideturtle()
         t.update()
         print("Image generated. Use 'save' command to save the image to file.")
 
-    except RecursionError:
-        print("A Stack Overflow Error occurred; try again w/ fewer iterations.")
+    except MemoryError:
+        print("Ran out of memory; try again w/ fewer iterations.")
+    except ( BudgetError, ValueError ) as e:     # ValueError: An expression of a parametric rule can't be evaluated
+        t.update()
+        print( "Error: {}".format( e ) )
+    except KeyboardInterrupt:
+        BUDGET.end()
+        t.update()
+        print( "Cancelled after {:,} commands; what was drawn so far is kept.".format( BUDGET.tokens ) )
+    finally:
+        BUDGET.end()
+
+def getWindowPixels():
+    """ Return the width (or height, if it is taller) of the turtle window, opening it if it isn't already. """
+    t.setup()
+    return max( t.window_width(), t.window_height() )
+
+def interpretGeneration( generation, size ):
+    """ Interpret a generation of 'runthru' headlessly (see util/generation.py), or load it from the geometry cache
+    if it was already, the same way 'run' would.
+
+    Args:
+        generation: A Generation object
+        size: Unit size of turtle
+    Returns:
+        The Geometry
+    """
+    key = getKey( generation.lsys, generation.depth, size )
+    geometry = GEOMETRY_CACHE.get( key )
+    if geometry is None:
+        geometry = generation.interpret( size )
+        storeGeometry( key, geometry )
+    return geometry
+
+def isCulled( lsys, depth, pixels=None ):
+    """ Return whether a run is culled, see cullLsys. """
+    if not lsys.getRuleTable().isDeterministic():
+        return False
+    return VIEWPORT is not None or ( pixels is not None and lsys.predict( depth )["segments"] > pixels * pixels )
+
+def cullLsys( lsys, depth, size, pixels=None ):
+    """ Interpret an lsys headlessly, skipping the subtrees outside of the viewport, or smaller than a pixel.
 
-def runLsysHelper( string, lsys, depth, size ):
-    """ Recursive Helper for 'runLsys'
-    
     Args:
-        string: A string to which the rules will be applied
         lsys: An lsys object
         depth: Number of recursions
         size: Unit size of turtle
+        pixels: The width (or height, if it is taller) of the image, or None to keep every detail
+    Returns:
+        The Geometry, or None if the lsys can't be culled, or it isn't worth it: there is no viewport, and it draws
+        fewer segments than there are pixels.
     """
+    if not isCulled( lsys, depth, pixels ):
+        return None
+
+    bounds = VIEWPORT if VIEWPORT is not None else lsys.getBounds( depth, size )
+    if bounds is None:
+        return None
+    pixel = 0 if pixels is None else LOD_PIXELS * max( bounds[2] - bounds[0], bounds[3] - bounds[1] ) / pixels
+    key = getKey( lsys, depth, size, ( VIEWPORT, pixel ) )
+    geometry = GEOMETRY_CACHE.get( key )
+    if geometry is None:
+        geometry = interpretCulled( lsys, depth, size, VIEWPORT, pixel )
+        storeGeometry( key, geometry )
+    return geometry
+
+def interpretGeometry( lsys, depth, size ):
+    """ Interpret an lsys headlessly, w/ every worker, or load it from the geometry cache if it was already.
 
-    global COLORS
-
-    size_multiplier = 1
-
-    for i in range(len(string)):
-        char = string[i]
-
-        if char == "#":
-            id = ""
-            i += 1
-            while string[i].isdigit():
-                id += string[i]
-                i += 1
-            try:
-                t.color( COLORS[ int(id) ] )
-
-            # No/invalid color file? Who cares?
-            except t.TurtleGraphicsError:
-                pass
-            except TypeError:
-                pass
+    Args:
+        lsys: An lsys object
+        depth: Number of recursions
+        size: Unit size of turtle
+    Returns:
+        The Geometry
+    """
+    key = getKey( lsys, depth, size )
+    geometry = GEOMETRY_CACHE.get( key )
+    if geometry is None:
+        if WORKERS > 1:
+            geometry = interpretParallel( lsys, depth, size, WORKERS )
+        else:
+            geometry = interpretLsys( lsys, depth, size )
+        storeGeometry( key, geometry )
+    return geometry
 
+def storeGeometry( key, geometry ):
+    """ Add a Geometry to the geometry cache; a cache that can't be written is only worth a warning. """
+    try:
+        GEOMETRY_CACHE.put( key, geometry )
+    except OSError as e:
+        print( "Warning: Could not write to the geometry cache: {}".format( e ) )
 
-        # Modify size multiplier by reading remaining string
-        elif char == "@":
-            s = ""
-            i += 1
+def fitWindow( bounds ):
+    """ Set the coordinates of the turtle window so that a bounding box fills it, w/o stretching the drawing.
 
-            while string[i].upper() in "1234567890.QI":
-                s += string[i]
-                i += 1
+    Args:
+        bounds: A tuple of (xmin, ymin, xmax, ymax), or None to center the origin in a 600 by 600 window
+    """
+    if bounds is None:
+        t.setworldcoordinates( -300, -300, 300, 300 )
+        return
+
+    ( xmin, ymin, xmax, ymax ) = bounds
+    aspect = t.window_width() / t.window_height()
+    width = max( xmax - xmin, ( ymax - ymin ) * aspect, 1e-9 ) * ( 1 + 2 * MARGIN )
+    height = width / aspect
+    ( cx, cy ) = ( ( xmin + xmax ) / 2, ( ymin + ymax ) / 2 )
+    t.setworldcoordinates( cx - width / 2, cy - height / 2, cx + width / 2, cy + height / 2 )
+
+@profiled( "draw" )
+def runLsysHelper( lsys, depth, size ):
+    """ Helper for 'runLsys', draws the lazily expanded commands of an lsys with the turtle.
+    
+    Args:
+        lsys: An lsys object
+        depth: Number of recursions
+        size: Unit size of turtle
+    """
+    for ( token, arg ) in BUDGET.watch( PROFILER.countCommands( lsys.iterCommands( depth, size ) ) ):
+        chooseAction( token, arg )
 
-            if s[0].upper() == "Q":
-                size_multiplier = sqrt( float(s[1:]) )
-            elif s[0].upper() == "I":
-                size_multiplier = 1 / float(s[1:])
-            else:
-                size_multiplier = float( s[0:] )
+@profiled( "draw" )
+def drawGeometry( geometry ):
+    """ Draw line segments that have already been interpreted with the turtle.
 
-        # Character must correspond to some executable action
-        elif depth <= 0 or char not in lsys.getVars():
-            chooseAction( char, size * size_multiplier, lsys.angle )
+    Args:
+        geometry: A Geometry object, see util/geometry.py
+    """
+    color = None
+    for ( x0, y0, x1, y1, id ) in geometry.iterSegments():
+        if id != color:
+            chooseAction( "#", id )
+            color = id
+        if t.position() != ( x0, y0 ):
+            t.penup()
+            t.setpos( x0, y0 )
+            t.pendown()
+        t.setpos( x1, y1 )
+
+@profiled( "save" )
+def saveLsys( filename=None, pixels=IMAGE_SIZE ):
+    """ Save the last run to an svg file, or a png file if the filename ends in '.png'. The lsys is interpreted
+    again, w/o the turtle, so the canvas doesn't need to be open and the image isn't limited to what fits in the window.
 
-        # Otherwise recurse with a rule string
-        else:
-            s = lsys.getResult( char, string[i-1] if i > 0 else "", string[i+1] if i < len(string)-1 else "" )
-            runLsysHelper( s, lsys, depth-1, size * size_multiplier )
+    Args:
+        filename: The path of the file, or None to save to src/images. Compressed if it ends in '.svgz'.
+        pixels: The width (or height, if it is taller) of a png image
+    Returns:
+        The path of the file
+    Raises:
+        OSError: If the file can't be written
+        ValueError: If the number of pixels isn't positive, or an expression of a parametric rule is invalid
+        BudgetError: If the run exceeds its budget
+    """
+    ( lsys, depth, size ) = LAST_RUN
+    if filename is None:
+        dir = os.path.join( os.path.dirname(__file__), "images" )
+        os.makedirs( dir, exist_ok=True )
+        filename = os.path.join( dir, "{}_{}_{}.svg".format( lsys.name, depth, datetime.date.today() ) )
+
+    png = filename.lower().endswith( ".png" )
+    with BUDGET.begin( lsys, depth, not isCulled( lsys, depth, pixels if png else None ) ):
+        geometry = cullLsys( lsys, depth, size, pixels if png else None )
+        if geometry is None:
+            geometry = interpretGeometry( lsys, depth, size )
+    if SIMPLIFY:
+        geometry = simplify( geometry )
+
+    if png:
+        writePng( filename, geometry, pixels, COLORS, WORKERS, VIEWPORT )
+    else:
+        writeSvg( filename, geometry, COLORS, viewport=VIEWPORT )
+    return filename
 
 def printHelp():
     """ Print Help: read help.txt """
@@ -207,19 +419,17 @@ def loadLsysFromFile( filename ):
     Args:
         filename: The file that the program will attempt to use to load L-Systems into memory.
     Returns:
-        List of L-System objects.
+        A Library of L-System objects, see util/library.py
     """
-    lst = list()
+    lst = Library()
     try:
-        lst = getLsysFromFile( filename )
+        lst = loadLibrary( filename )
         print("Sucessfully loaded: {}. Use 'display' to see the updated list of lsys objects.".format( filename ))
         return lst
     except FileNotFoundError:
         print("Error: File was not found: {}".format( filename ) )
 
-    except IndexError:
-        print("Error: Invalid syntax in datafile.")
-    except ValueError:
+    except ParseError:
         print("Error: Invalid syntax in datafile.")
 
     return lst
@@ -228,25 +438,43 @@ def getLsysFromCollection( lst, param ):
     """ Find an L-System object given some user input.
 
     Args:
-        lst: List of L-System to search through.
+        lst: Library of L-System to search through.
         param: User input parameter used to match one of the L-Systems.
     Returns:
         An L-System object that is 'matched' by the parameter.
     """
     obj = None
 
-    if param.isdigit():     # Allow user to select lsys by number in collection
-        try:
+    try:
+        if param.isdigit():     # Allow user to select lsys by number in collection
             obj = lst[ int(param) - 1 ]
-        except IndexError:
-            obj = None
-
-    else:                   # Allow user to select lsys by name
-        for l in lst:
-            if l.name.lower() == param.lower():
-                obj = l
+        else:                   # Allow user to select lsys by name
+            obj = lst.find( param )
+    except IndexError:
+        obj = None
+    except ValueError as e:     # Built on first use, so an invalid definition is only found now
+        print( "Error: {}".format( e ) )
+        obj = None
     return obj
 
+def printPrediction( lsys, depth ):
+    """ Print the predicted size of an lsys after a given number of iterations.
+
+    Args:
+        lsys: An lsys object
+        depth: Number of iterations
+    """
+    try:
+        prediction = lsys.predict( depth )
+    except ValueError as e:
+        print( "Error: {}".format( e ) )
+        return
+    print( "{} after {} iterations:".format( lsys.name, depth ) )
+    print( "Tokens: {:,}".format( round( prediction["tokens"] ) ) )
+    print( "Segments: {:,}".format( round( prediction["segments"] ) ) )
+    for ( symbol, count ) in prediction["histogram"].items():
+        print( "    {}: {:,}".format( symbol, round( count ) ) )
+
 def display( param, lst ):
     if param == None:
         if len(lst) == 0:
@@ -254,7 +482,7 @@ def display( param, lst ):
         else:
             print("Currently loaded objects are:")
             for i in range(len(lst)):
-                print( "{}. {}".format( str(i+1), lst[i].name) )
+                print( "{}. {}".format( str(i+1), lst.names[i] ) )
     else:
         l = getLsysFromCollection( lst, param )
         if l == None:
@@ -267,6 +495,14 @@ def main():
     size = 5
 
     global COLORS
+    global WORKERS
+    global VIEWPORT
+
+    # Non-interactive rendering
+    if len(sys.argv) >= 2 and sys.argv[1] == "batch":
+        sys.exit( runBatch( sys.argv[2:], COLORS, GEOMETRY_CACHE ) )
+    if len(sys.argv) >= 2 and sys.argv[1] == "bench":
+        sys.exit( runBenchmark( sys.argv[2:] ) )
 
     # Initialization: check for loadable file
     print( "Hello. Welcome to lsys." )
@@ -275,7 +511,7 @@ def main():
         # NOTE: command line filename will be relative to shell, not file
         lsysCollection = loadLsysFromFile( filename )
     else:
-        lsysCollection = []
+        lsysCollection = Library()
         try:
             lsysCollection = loadLsysFromFile( DEFAULT_DATA_FILE )
         except FileNotFoundError:
@@ -311,6 +547,77 @@ def main():
                 size = int(param)
                 print( "Size has been set to {}.".format(size) )
 
+        elif 'cache'.startswith( cmdTerm ):
+            if param == None:
+                print( SUBTREE_CACHE )
+            elif not param.isdigit():
+                print( "Invalid use of 'cache'. Usage \'cache [megabytes]\'" )
+            else:
+                SUBTREE_CACHE.setCapacity( int(param) * 1024 * 1024 )
+                print( "Cache capacity has been set to {} MB.".format(param) )
+
+        elif 'diskcache'.startswith( cmdTerm ):
+            if param == None:
+                print( GEOMETRY_CACHE )
+            elif not param.isdigit():
+                print( "Invalid use of 'diskcache'. Usage \'diskcache [megabytes]\'" )
+            else:
+                GEOMETRY_CACHE.setCapacity( int(param) * 1024 * 1024 )
+                print( "Geometry cache capacity has been set to {} MB.".format(param) )
+
+        elif 'stats'.startswith( cmdTerm ):
+            if param == None:
+                print( PROFILER )
+            elif param == "on" or param == "off":
+                PROFILER.enable( param == "on" )
+                print( "Profiling has been turned {}.".format( param ) )
+            elif param == "reset":
+                PROFILER.reset()
+                print( "The profile has been reset." )
+            else:
+                try:
+                    PROFILER.writeJson( param )
+                    print( "Profile written to {}.".format( param ) )
+                except OSError as e:
+                    print( "Error: Could not write the profile: {}".format( e ) )
+
+        elif 'budget'.startswith( cmdTerm ):
+            if param == None:
+                print( BUDGET )
+            elif param == "progress" and len(userIN) >= 3 and userIN[2] in ( "on", "off" ):
+                BUDGET.progress = userIN[2] == "on"
+                print( "Progress will be {}.".format( "shown" if BUDGET.progress else "hidden" ) )
+            else:
+                try:
+                    value = float( userIN[2] ) if param == "seconds" else int( userIN[2] )
+                    if value < 0:
+                        raise ValueError()
+                    BUDGET.setLimit( param, value if value > 0 else None )
+                    print( "The {} limit has been {}.".format( param, "set to {:,}".format( value ) if value > 0 else "removed" ) )
+                except ( ValueError, IndexError, KeyError ):
+                    print( "Invalid use of 'budget'. Usage \'budget [tokens|segments|seconds|memory] [value]\' or \'budget progress [on|off]\'" )
+
+        elif 'workers'.startswith( cmdTerm ):
+            if param == None or not param.isdigit() or int(param) < 1:
+                print( "Invalid use of 'workers'. Usage \'workers [int]\'" )
+            else:
+                WORKERS = int(param)
+                print( "Number of workers has been set to {}.".format(WORKERS) )
+
+        elif 'zoom'.startswith( cmdTerm ):
+            if param == None:
+                VIEWPORT = None
+                print( "Zoom has been reset; the whole drawing is shown." )
+            else:
+                try:
+                    ( xmin, ymin, xmax, ymax ) = ( float( value ) for value in userIN[1:5] )
+                    if xmin >= xmax or ymin >= ymax:
+                        raise ValueError()
+                    VIEWPORT = ( xmin, ymin, xmax, ymax )
+                    print( "Zoomed in on ({}, {}) to ({}, {}).".format( *VIEWPORT ) )
+                except ValueError:
+                    print( "Invalid use of 'zoom'. Usage \'zoom [xmin] [ymin] [xmax] [ymax]\', w/ xmin < xmax and ymin < ymax" )
+
         elif 'run'.startswith( cmdTerm ):
 
             obj = getLsysFromCollection( lsysCollection, param )
@@ -342,39 +649,86 @@ def main():
 
             else:
                 print("Using the lsys called {}.".format(obj.name))
+                generations = None
                 try:
-                    for i in range( int(userIN[2]), int(userIN[3]) ):
-                        runLsys( obj, i, size )
-                        if input("ENTER to continue. 'X' to quit.").upper() == "X":
-                            break
-
+                    ( first, last ) = ( int(userIN[2]), int(userIN[3]) )
                 except ValueError:
                     print("Error: Invalid params for runthru range. Params must be integers.")
+                except IndexError:
+                    print("Error: Range not given. Usage: 'runthru [lsys_name/num] [first_itr] [final_itr]'")
+                else:
+                    try:
+                        # Rewrite each generation from the last one, rather than from the axiom, when possible;
+                        # but once a run is culled, like 'run' would cull it, each is run from scratch instead
+                        if isIncremental( obj ):
+                            generations = obj.iterGenerations( first, last - 1 )
+                        for i in range( first, last ):
+                            BUDGET.check( obj, i )
+                            geometry = None
+                            if generations is not None and isCulled( obj, i, getWindowPixels() ):
+                                generations.close()
+                                generations = None
+                            if generations is not None:
+                                geometry = interpretGeneration( next( generations ), size )
+                            runLsys( obj, i, size, geometry )
+                            if input("ENTER to continue. 'X' to quit.").upper() == "X":
+                                break
+
+                    except ( BudgetError, ValueError ) as e:
+                        print( "Error: {}".format( e ) )
+                    except KeyboardInterrupt:
+                        print( "Cancelled." )
+                    finally:
+                        if generations is not None:
+                            generations.close()
+
+        elif 'predict'.startswith( cmdTerm ):
+            obj = getLsysFromCollection( lsysCollection, param ) if param != None else None
 
-        elif 'save'.startswith( cmdTerm ):
-            try:
-                ts = t.getscreen().getcanvas()
-                dir = os.path.dirname(__file__)
-                filename = "images/{}_{}_{}.svg".format(obj.name, str(n), str( datetime.date.today()))
+            if obj == None:         # Check if object was found
+                print("Could not find an lsys w/ name/number '{}'".format(param))
 
-                canvasvg.saveall( os.path.join( dir, filename ), ts)     # Save as svg
-            except NameError:
-                print("The canvasvg module was not imported. You must install it to save images. \
-                    Run 'pip install canvasvg'")
-            except t.Terminator:
-                print("The turtle canvas must be open to save the image. You must re-run your command to save.")
+            else:
+                try:
+                    printPrediction( obj, int(userIN[2]) )
+                except ValueError:
+                    print("Error: The number of iterations must be a non-negative integer.")
+                except IndexError:
+                    print("Error: # of iterations not given. Usage: 'predict [lsys_name/num] [#_of_iterations]'")
+
+        elif 'save'.startswith( cmdTerm ):
+            if LAST_RUN == None:
+                print("Nothing has been run yet. Use 'run' to draw an lsys, then 'save' it.")
+            else:
+                try:
+                    pixels = int( userIN[2] ) if len(userIN) >= 3 else IMAGE_SIZE
+                    if pixels <= 0:
+                        raise ValueError()
+                except ValueError:
+                    print("Error: The size of a png must be a positive integer. Usage: 'save [filename] [pixels]'")
+                else:
+                    try:
+                        print( "Image saved to {}.".format( saveLsys( param, pixels ) ) )
+                    except OSError as e:
+                        print( "Error: Could not save the image: {}".format( e ) )
+                    except ( BudgetError, ValueError ) as e:
+                        print( "Error: {}".format( e ) )
+                    except KeyboardInterrupt:
+                        print( "Cancelled; nothing was saved." )
+                    except MemoryError:
+                        print("Ran out of memory; try again w/ fewer iterations.")
 
         elif 'load'.startswith( cmdTerm ):
             if param == None:
                 print( "Invalid use of 'load'. Usage \'load [filename]\'" )
             else:
                 try:
-                    lsysCollection += getLsysFromFile( param )
+                    lsysCollection.extend( loadLibrary( param ) )
                     print("Sucessfully loaded: {}. \
                         Use 'display' to see the updated list of lsys objects.".format( param ))
                 except FileNotFoundError:
                     print("Error: File was not found: {}.".format( param ) )
-                except IndexError:
+                except ParseError:
                     print("Error: Invalid syntax in datafile.")
 
         elif 'exit'.startswith( cmdTerm ) or 'quit'.startswith( cmdTerm ):
@@ -382,7 +736,7 @@ def main():
 
         elif 'dump'.startswith( cmdTerm ):
             if "yes".startswith(input("Are you sure you'd like to dump currently loaded collection? (y/n) ").lower()):
-                lsysCollection = list()
+                lsysCollection = Library()
                 print("Done.")
 
         elif 'mod'.startswith( cmdTerm ):
@@ -393,10 +747,12 @@ def main():
                     l.angle = ( float(userIN[3]) )
                 elif attr == 'axiom':
                     l.axiom = ( userIN[3] )
+                elif attr == 'seed':
+                    l.seed = ( int(userIN[3]) )
 
                 print("Set the {} of {} to be {}".format( attr, l.name, userIN[3] ))
             except ValueError:
-                print("Error: Invalid attribute. Attribute must be float for angle.")
+                print("Error: Invalid attribute. Attribute must be float for angle, or integer for seed.")
             except IndexError:
                 print("Error: Invalid number of arguments. Usage 'mod [lsys_name] [lsys_attr] [new_attr_val]'")
             except AttributeError:
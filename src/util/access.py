@@ -0,0 +1,342 @@
+"""
+Random access
+Find the k-th token of a deterministic expansion, or the state of the turtle at that token, without expanding
+anything else.
+
+The final-depth string is a tree: every token of the axiom expands into its rule string, every variable of that
+string expands into its own rule string, and so on. Given the length of every (symbol, depth) subtree, the token
+at position k is found by descending from the axiom, choosing at each level the subtree that contains k.
+That is O(depth) steps, each of which searches a single rule string.
+
+In the same way, the state of the turtle is found by summarizing every (symbol, depth) subtree as a transform:
+how far it moves the turtle, and how much it turns it, starting from the origin with a heading of 0 and a unit
+size of 1. Transforms assume that the brackets of each rule string are balanced.
+
+Only deterministic lsys objects have a single expansion, so only they can be randomly accessed.
+"""
+
+from bisect import bisect_right
+from itertools import accumulate
+from math import cos, sin, radians
+
+from util.expand import tokenize, getSizeMultiplier, DRAW_TOKENS, MOVE_TOKENS, LEAF_TOKEN, COLOR_TOKEN, SIZE_TOKEN
+
+class TurtleState( object ):
+    """ Helper class which holds the state of the turtle at some token. """
+
+    def __init__( self, x=0.0, y=0.0, heading=0.0, color=None, stack=None ):
+        """ Constructor
+
+        Args:
+            x, y: The position of the turtle
+            heading: The heading of the turtle, in degrees (0 is east, counterclockwise)
+            color: The id of the last color used, or None
+            stack: List of (x, y, heading) tuples pushed by unclosed brackets, the last being the topmost
+        """
+        self.x = x
+        self.y = y
+        self.heading = heading
+        self.color = color
+        self.stack = [] if stack is None else stack
+
+    def __repr__( self ):
+        """ String representation.
+
+        Returns:
+            A console-friendly string representation.
+        """
+        return "({:.4f}, {:.4f}) heading {:.4f}, color {}, {} branches open".format(
+            self.x, self.y, self.heading % 360, self.color, len(self.stack) )
+
+class RandomAccess( object ):
+
+    def __init__( self, table, angle ):
+        """ Constructor
+
+        Args:
+            table: A compiled RuleTable, see util/ruletable.py
+            angle: The angle associated with the lsys
+        Raises:
+            ValueError: If the ruleset is not deterministic
+        """
+        if not table.isDeterministic():
+            raise ValueError( "Only deterministic lsys objects can be randomly accessed." )
+
+        self.table = table
+        self.angle = angle
+        self.variables = table.variables
+        self.results = { var: tokenize( table.results[var] ) for var in table.variables }
+        self.lengths = [ { var: 1 for var in self.variables } ]
+        self.transforms = [ dict() ]
+        self.prefixes = dict()
+
+    def getLength( self, token, depth ):
+        """ Get the number of tokens that a single token expands into.
+
+        Args:
+            token: A token of the lsys' alphabet
+            depth: Number of generations
+        Returns:
+            The length of the expansion of 'token' after 'depth' generations.
+        """
+        if token not in self.variables:
+            return 1
+        while len(self.lengths) <= depth:
+            previous = self.lengths[-1]
+            self.lengths.append( { var: sum( previous.get(c, 1) for c in self.results[var] )
+                                   for var in self.variables } )
+        return self.lengths[depth][token]
+
+    def getTotalLength( self, axiom, depth ):
+        """ Get the number of tokens in the final-depth string.
+
+        Args:
+            axiom: The string the expansion starts with
+            depth: Number of generations
+        Returns:
+            The length of the final-depth string.
+        """
+        return sum( self.getLength( token, depth ) for token in tokenize( axiom ) )
+
+    def getPrefix( self, var, depth ):
+        """ Get the cumulative lengths of the tokens that a variable expands into.
+
+        Args:
+            var: A variable of the lsys
+            depth: Number of generations that 'var' is expanded
+        Returns:
+            A list, whose i-th element is the total length of the first i+1 subtrees of 'var'.
+        """
+        key = ( var, depth )
+        if key not in self.prefixes:
+            self.prefixes[key] = list( accumulate( self.getLength( c, depth-1 ) for c in self.results[var] ) )
+        return self.prefixes[key]
+
+    def locate( self, axiom, depth, k ):
+        """ Find the path from the axiom to the k-th token.
+
+        Args:
+            axiom: The string the expansion starts with
+            depth: Number of generations
+            k: Index of the token in the final-depth string
+        Returns:
+            A list of (tokens, index, depth) tuples, one per level, from the axiom down to the k-th token, where
+            'tokens' is the tokenized string of that level, 'index' the subtree which contains k, and 'depth' the
+            number of generations that each token of that level is expanded.
+        Raises:
+            IndexError: If k is out of range
+        """
+        tokens = tokenize( axiom )
+        prefix = list( accumulate( self.getLength( token, depth ) for token in tokens ) )
+        if k < 0 or len(prefix) == 0 or k >= prefix[-1]:
+            raise IndexError( "Token index out of range: {}".format( k ) )
+
+        path = []
+        while True:
+            i = bisect_right( prefix, k )
+            if i > 0:
+                k -= prefix[i-1]
+            path.append( ( tokens, i, depth ) )
+
+            token = tokens[i]
+            if depth <= 0 or token not in self.variables:
+                return path
+            prefix = self.getPrefix( token, depth )
+            tokens = self.results[token]
+            depth -= 1
+
+    def getToken( self, axiom, depth, k ):
+        """ Get the k-th token of the final-depth string.
+
+        Args:
+            axiom: The string the expansion starts with
+            depth: Number of generations
+            k: Index of the token in the final-depth string
+        Returns:
+            The token
+        """
+        ( tokens, i, depth ) = self.locate( axiom, depth, k )[-1]
+        return tokens[i]
+
+    def walk( self, axiom, depth, size, start, stop ):
+        """ Generate the tokens [start, stop) of the final-depth string, along with their unit size.
+
+        Args:
+            axiom: The string the expansion starts with
+            depth: Number of generations
+            size: Unit size of turtle
+            start: Index of the first token
+            stop: Index after the last token
+        Yields:
+            Tuples of a token and the unit size at that token, the same as util/expand.walk
+        """
+        if stop <= start:
+            return
+
+        # Rebuild the work stack of util/expand.walk at the start token
+        frames = []
+        for ( tokens, i, level ) in self.locate( axiom, depth, start ):
+            size_multiplier = self.getMultiplier( tokens, i )
+            frames.append( ( tokens, i + 1, level, size, size_multiplier ) )
+            size *= size_multiplier
+        ( tokens, i, depth, size, size_multiplier ) = frames.pop()
+        i -= 1
+
+        remaining = stop - start
+        while remaining > 0:
+            if i >= len(tokens):
+                if len(frames) == 0:
+                    return
+                ( tokens, i, depth, size, size_multiplier ) = frames.pop()
+                continue
+
+            token = tokens[i]
+            i += 1
+
+            if token[0] == SIZE_TOKEN:
+                size_multiplier = getSizeMultiplier( token[1:] )
+                yield ( token, size * size_multiplier )
+                remaining -= 1
+            elif depth <= 0 or token not in self.variables:
+                yield ( token, size * size_multiplier )
+                remaining -= 1
+            else:
+                frames.append( ( tokens, i, depth, size, size_multiplier ) )
+                ( tokens, i, depth, size, size_multiplier ) = ( self.results[token], 0, depth-1, size * size_multiplier, 1 )
+
+    def getString( self, axiom, depth, start, stop ):
+        """ Get the tokens [start, stop) of the final-depth string, as a string. Only valid if the ruleset has a fast
+        path (see util/ruletable.py). Like 'walk', but every subtree that lies entirely in the range is rewritten a
+        whole generation at a time, so only the subtrees at the ends of the range are walked token by token.
+
+        Args:
+            axiom: The string the expansion starts with
+            depth: Number of generations
+            start: Index of the first token
+            stop: Index after the last token
+        Returns:
+            The tokens of the range, joined
+        """
+        if stop <= start:
+            return ""
+
+        frames = [ ( tokens, i + 1, level ) for ( tokens, i, level ) in self.locate( axiom, depth, start ) ]
+        ( tokens, i, depth ) = frames.pop()
+        i -= 1
+
+        parts = []
+        remaining = stop - start
+        while remaining > 0:
+            if i >= len(tokens):
+                if len(frames) == 0:
+                    break
+                ( tokens, i, depth ) = frames.pop()
+                continue
+
+            token = tokens[i]
+            i += 1
+
+            if depth <= 0 or token not in self.variables:
+                parts.append( token )
+                remaining -= 1
+                continue
+            length = self.getLength( token, depth )
+            if length <= remaining:
+                parts.append( self.table.expand( token, depth ) )
+                remaining -= length
+            else:
+                frames.append( ( tokens, i, depth ) )
+                ( tokens, i, depth ) = ( self.results[token], 0, depth-1 )
+        return "".join( parts ).replace( " ", "" )
+
+    def getMultiplier( self, tokens, i ):
+        """ Get the size multiplier in effect before the i-th token of a string.
+
+        Args:
+            tokens: The tokens of a string
+            i: An index into 'tokens'
+        Returns:
+            The size multiplier set by the last size modifier before i, or 1.
+        """
+        for j in range( i-1, -1, -1 ):
+            if tokens[j][0] == SIZE_TOKEN:
+                return getSizeMultiplier( tokens[j][1:] )
+        return 1
+
+    def getTransform( self, token, depth ):
+        """ Get the transform of a single token, expanded a given number of times.
+
+        Args:
+            token: A variable of the lsys
+            depth: Number of generations, at least 1
+        Returns:
+            A tuple of (dx, dy, dheading, color), the displacement and turn of the turtle when it draws the
+            expansion from the origin with a heading of 0 and a unit size of 1, and the last color it used (or None).
+        """
+        while len(self.transforms) <= depth:
+            level = len(self.transforms)
+            transforms = dict()
+            for var in self.variables:
+                state = TurtleState()
+                self.advance( state, self.results[var], level-1, 1 )
+                transforms[var] = ( state.x, state.y, state.heading, state.color )
+            self.transforms.append( transforms )
+        return self.transforms[depth][token]
+
+    def advance( self, state, tokens, depth, size ):
+        """ Move the turtle through a string, using the transforms of its subtrees.
+
+        Args:
+            state: The TurtleState to update
+            tokens: The tokens of a string
+            depth: Number of generations that each token is expanded
+            size: Unit size of turtle
+        """
+        size_multiplier = 1
+        for token in tokens:
+            first = token[0]
+            if first == SIZE_TOKEN:
+                size_multiplier = getSizeMultiplier( token[1:] )
+            elif first == COLOR_TOKEN:
+                try:
+                    state.color = int( token[1:] )
+                except ValueError:
+                    pass
+            elif depth > 0 and token in self.variables:
+                ( dx, dy, dheading, color ) = self.getTransform( token, depth )
+                length = size * size_multiplier
+                h = radians( state.heading )
+                state.x += length * ( dx * cos(h) - dy * sin(h) )
+                state.y += length * ( dx * sin(h) + dy * cos(h) )
+                state.heading += dheading
+                if color is not None:
+                    state.color = color
+            elif first in DRAW_TOKENS or first in MOVE_TOKENS or first == LEAF_TOKEN:
+                h = radians( state.heading )
+                state.x += size * size_multiplier * cos(h)
+                state.y += size * size_multiplier * sin(h)
+            elif first == "+":
+                state.heading += self.angle
+            elif first == "-":
+                state.heading -= self.angle
+            elif first == "[":
+                state.stack.append( ( state.x, state.y, state.heading ) )
+            elif first == "]" and len(state.stack) > 0:
+                ( state.x, state.y, state.heading ) = state.stack.pop()
+
+    def getTurtleState( self, axiom, depth, size, k ):
+        """ Get the state of the turtle just before it reads the k-th token.
+
+        Args:
+            axiom: The string the expansion starts with
+            depth: Number of generations
+            size: Unit size of turtle
+            k: Index of the token in the final-depth string
+        Returns:
+            A TurtleState
+        """
+        state = TurtleState()
+        for ( tokens, i, level ) in self.locate( axiom, depth, k ):
+            self.advance( state, tokens[:i], level, size )
+            size *= self.getMultiplier( tokens, i )
+        return state
@@ -0,0 +1,254 @@
+"""
+Batch rendering
+Renders many lsys objects of a data file to image files in one command, w/o the turtle or the prompt:
+
+    python3 src/main.py batch src/data/all.xml --names all --depths 1-6 --formats svg,png --workers 8
+
+Every (lsys, depth, format) combination is a job. Jobs are run across a pool of processes; each loads the data file
+once and interprets its lsys objects headlessly, the same way 'save' does (see main.py): deterministic lsys objects
+are culled to the resolution of a png (see util/lod.py), geometry is shared through the geometry cache (see
+util/diskcache.py), and segments are simplified before they are written (see util/simplify.py).
+
+A job that runs for longer than the timeout is interrupted (on platforms w/ SIGALRM), and reported as such.
+Once every job is done, a summary of all of them is written as JSON, by default next to the images:
+    {
+        "file": ..., "started": ..., "seconds": ...,
+        "counts": { "ok": ..., "error": ..., "timeout": ... },
+        "jobs": [ { "name": ..., "depth": ..., "format": ..., "path": ..., "status": ..., "seconds": ...,
+                    "segments": ..., "error": ... }, ... ]
+    }
+"""
+
+import os
+import json
+import time
+import signal
+import argparse
+import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from util.library import loadLibrary
+from util.geometry import interpretLsys
+from util.lod import interpretCulled
+from util.simplify import simplify
+from util.diskcache import getKey
+from util.svg import writeSvg
+from util.raster import writePng, IMAGE_SIZE
+
+FORMATS = ( "svg", "svgz", "png" )
+DEFAULT_SIZE = 5            # Unit size of turtle, the same as the prompt's
+DEFAULT_TIMEOUT = 600       # Seconds
+IMAGE_DIRECTORY = os.path.join( os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ), "images" )
+SUMMARY_NAME = "summary.json"
+
+# The library of every data file loaded by this process, by file
+LIBRARIES = dict()
+
+def parseDepths( string ):
+    """ Parse a list of depths and ranges of depths.
+
+    Args:
+        string: Comma separated depths, or inclusive ranges of depths, e.g. '1-5,8'
+    Returns:
+        A sorted list of distinct depths
+    Raises:
+        ValueError: If a depth isn't a non-negative integer, or a range is empty
+    """
+    depths = set()
+    for part in string.split( "," ):
+        ( first, dash, last ) = part.strip().partition( "-" )
+        ( first, last ) = ( int( first ), int( last ) if dash else int( first ) )
+        if first < 0 or last < first:
+            raise ValueError( "Invalid range of depths: '{}'".format( part ) )
+        depths.update( range( first, last + 1 ) )
+    return sorted( depths )
+
+def parseFormats( string ):
+    """ Parse a comma separated list of formats.
+
+    Raises:
+        ValueError: If a format isn't one of FORMATS
+    """
+    formats = [ format.strip().lower() for format in string.split( "," ) if format.strip() ]
+    for format in formats:
+        if format not in FORMATS:
+            raise ValueError( "Unknown format '{}', expected one of {}".format( format, ", ".join( FORMATS ) ) )
+    return formats
+
+def getParser():
+    """ Return the parser of the arguments of the 'batch' command. """
+    parser = argparse.ArgumentParser( prog="main.py batch", description="Render lsys objects to image files." )
+    parser.add_argument( "file", help="the data file to read lsys objects from, e.g. src/data/all.xml" )
+    parser.add_argument( "--names", default="all", help="comma separated names of lsys objects, or 'all' (default)" )
+    parser.add_argument( "--depths", default="1-5", help="depths to render, e.g. '1-5,8' (default: 1-5)" )
+    parser.add_argument( "--formats", default="svg", help="comma separated formats: svg, svgz or png (default: svg)" )
+    parser.add_argument( "--size", type=float, default=DEFAULT_SIZE, help="unit size of turtle" )
+    parser.add_argument( "--pixels", type=int, default=IMAGE_SIZE, help="width (or height) of png images" )
+    parser.add_argument( "--workers", type=int, default=os.cpu_count() or 1, help="number of processes" )
+    parser.add_argument( "--timeout", type=float, default=DEFAULT_TIMEOUT, help="seconds allowed per job" )
+    parser.add_argument( "--output", default=IMAGE_DIRECTORY, help="directory of the images" )
+    parser.add_argument( "--summary", default=None, help="path of the JSON summary (default: in the output directory)" )
+    return parser
+
+def getLibrary( filename ):
+    """ Return the Library of a data file (see util/library.py), loading it once per process. """
+    library = LIBRARIES.get( filename )
+    if library is None:
+        library = LIBRARIES[filename] = loadLibrary( filename )
+    return library
+
+class JobTimeout( Exception ):
+    """ Raised in a job that ran out of time. Not an OSError (unlike TimeoutError), which the caches swallow. """
+
+def onTimeout( signum, frame ):
+    """ Interrupt a job that ran out of time. """
+    raise JobTimeout()
+
+def renderJob( job, options ):
+    """ Render a single job. Runs in a worker process.
+
+    Args:
+        job: A map of the 'name', 'depth', 'format' and 'path' of the job
+        options: A map of the 'file', 'size', 'pixels', 'timeout', 'colors' and 'cache' shared by all jobs
+    Returns:
+        The job, w/ its 'status' ('ok', 'error' or 'timeout'), 'seconds', 'segments' and 'error' (or None)
+    """
+    result = dict( job, status="ok", seconds=0.0, segments=None, error=None )
+    start = time.time()
+    timed = hasattr( signal, "SIGALRM" ) and options["timeout"] > 0
+    if timed:
+        signal.signal( signal.SIGALRM, onTimeout )
+        signal.setitimer( signal.ITIMER_REAL, options["timeout"] )
+    try:
+        lsys = getLibrary( options["file"] ).find( job["name"] )
+        ( depth, size, pixels, cache ) = ( job["depth"], options["size"], options["pixels"], options["cache"] )
+
+        # Cull to the resolution of the image, like main.py's 'cullLsys' (w/o a viewport)
+        pixel = None
+        table = lsys.getRuleTable()
+        if job["format"] == "png" and table.isDeterministic() and lsys.predict( depth )["segments"] > pixels * pixels:
+            try:
+                bounds = lsys.getBounds( depth, size )
+                if bounds is not None:
+                    pixel = max( bounds[2] - bounds[0], bounds[3] - bounds[1] ) / pixels
+            except ValueError:
+                pixel = None
+
+        key = getKey( lsys, depth, size, None if pixel is None else ( None, pixel ) )
+        geometry = cache.get( key ) if cache is not None else None
+        if geometry is None:
+            if pixel is None:
+                geometry = interpretLsys( lsys, depth, size )
+            else:
+                geometry = interpretCulled( lsys, depth, size, None, pixel )
+            if cache is not None:
+                cache.put( key, geometry )
+        geometry = simplify( geometry )
+        result["segments"] = len(geometry)
+
+        if job["format"] == "png":
+            writePng( job["path"], geometry, pixels, options["colors"] )
+        else:
+            writeSvg( job["path"], geometry, options["colors"], compress=job["format"] == "svgz" )
+
+    except JobTimeout:
+        result["status"] = "timeout"
+        result["error"] = "Ran for longer than {} seconds.".format( options["timeout"] )
+    except MemoryError:
+        result["status"] = "error"
+        result["error"] = "Ran out of memory."
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = "{}: {}".format( type( e ).__name__, e )
+    finally:
+        if timed:
+            signal.setitimer( signal.ITIMER_REAL, 0 )
+    result["seconds"] = round( time.time() - start, 3 )
+    return result
+
+def getJobs( library, names, depths, formats, directory ):
+    """ List every job of a batch.
+
+    Args:
+        library: The Library of the data file
+        names: The lower case names of the lsys objects to render, or [ 'all' ]
+        depths: The depths to render each lsys at
+        formats: The formats to write each image in
+        directory: The directory of the images
+    Returns:
+        A list of jobs, see renderJob
+    Raises:
+        KeyError: If a name isn't in the library
+    """
+    if names == [ "all" ]:
+        names = list( library.index.keys() )
+    jobs = []
+    for name in names:
+        name = library.names[ library.index[name] ]     # Only the names are needed, the lsys objects aren't built
+        for depth in depths:
+            for format in formats:
+                path = os.path.join( directory, "{}_{}.{}".format( name, depth, format ) )
+                jobs.append( { "name": name, "depth": depth, "format": format, "path": path } )
+    return jobs
+
+def runBatch( argv, colors=None, cache=None ):
+    """ Run the 'batch' command, see the docstring of this module.
+
+    Args:
+        argv: The arguments following 'batch'
+        colors: Map of color ids to color strings, see util/io.py
+        cache: The GeometryCache to share between jobs, or None
+    Returns:
+        The exit status of the program: 0 if every job succeeded, 1 otherwise, 2 if the arguments are invalid
+    """
+    parser = getParser()
+    args = parser.parse_args( argv )
+    try:
+        depths = parseDepths( args.depths )
+        formats = parseFormats( args.formats )
+        names = [ name.strip().lower() for name in args.names.split( "," ) if name.strip() ]
+        jobs = getJobs( getLibrary( args.file ), names, depths, formats, args.output )
+        if args.workers < 1 or args.pixels < 1:
+            raise ValueError( "The number of workers and of pixels must be positive." )
+    except KeyError as e:
+        print( "Error: No lsys named {} in {}.".format( e, args.file ) )
+        return 2
+    except ( OSError, ValueError, IndexError, SyntaxError ) as e:     # ParseError is a SyntaxError
+        print( "Error: {}".format( e ) )
+        return 2
+
+    os.makedirs( args.output, exist_ok=True )
+    options = { "file": args.file, "size": args.size, "pixels": args.pixels, "timeout": args.timeout,
+                "colors": colors, "cache": cache }
+    started = datetime.datetime.now()
+    start = time.time()
+    results = []
+    print( "Rendering {} jobs w/ {} workers.".format( len(jobs), args.workers ) )
+
+    with ProcessPoolExecutor( max_workers=args.workers ) as pool:
+        futures = { pool.submit( renderJob, job, options ): job for job in jobs }
+        for future in as_completed( futures ):
+            try:
+                result = future.result()
+            except BrokenProcessPool as e:
+                result = dict( futures[future], status="error", seconds=None, segments=None,
+                               error="The worker process died: {}".format( e ) )
+            results.append( result )
+            print( "[{}/{}] {:7} {} at depth {} as {} ({}s){}".format(
+                len(results), len(jobs), result["status"], result["name"], result["depth"], result["format"],
+                result["seconds"], "" if result["error"] is None else ": " + result["error"] ) )
+
+    # In the order of the jobs, rather than the order they finished in
+    order = { ( job["name"], job["depth"], job["format"] ): i for ( i, job ) in enumerate( jobs ) }
+    results.sort( key=lambda result: order[ ( result["name"], result["depth"], result["format"] ) ] )
+    counts = { status: sum( 1 for result in results if result["status"] == status )
+               for status in ( "ok", "error", "timeout" ) }
+    summary = { "file": args.file, "started": started.isoformat( timespec="seconds" ),
+                "seconds": round( time.time() - start, 3 ), "counts": counts, "jobs": results }
+    path = args.summary if args.summary is not None else os.path.join( args.output, SUMMARY_NAME )
+    with open( path, "w", encoding="utf-8" ) as file:
+        json.dump( summary, file, indent=2 )
+    print( "{ok} succeeded, {error} failed, {timeout} timed out. Summary written to {path}.".format(
+        path=path, **counts ) )
+    return 0 if counts["ok"] == len(jobs) else 1
@@ -0,0 +1,258 @@
+"""
+Benchmarks
+Times every lsys of a data file at a ladder of depths, so that changes can be checked for regressions:
+
+    python3 src/main.py bench src/data/all.xml --output bench.json --baseline baseline.json
+
+Each (lsys, depth) case is run in a fresh process, so that the caches of an earlier case don't speed it up and its
+peak memory is its own. Its stages are timed separately:
+    parse       -   Reading the data file and compiling its lsys objects (see util/io.py)
+    expand      -   Generating every token of the final-depth string (see util/expand.py)
+    interpret   -   Expanding and interpreting it into segments w/ a headless turtle (see util/geometry.py)
+    save        -   Simplifying the segments and writing them to an svg file (see util/simplify.py, util/svg.py)
+Each stage is the best of a number of repetitions. Throughputs (tokens and segments per second) and the peak
+resident memory of the process (where the platform reports it) are recorded along w/ the times.
+
+The depths of an lsys are chosen by the predicted length of its expansion (see util/growth.py): for every power of
+ten up to the largest length benchmarked, the deepest depth whose expansion is no longer than it. So quickly
+growing lsys objects (e.g. FractalPlant) are benchmarked at a few shallow depths, and slowly growing ones (e.g.
+DragonCurve) at deeper ones, and both take a comparable amount of time. Lsys objects whose length doesn't grow are
+skipped. Parametric and context-sensitive ones, whose lengths can't be predicted, are benchmarked at a fixed range
+of depths.
+
+Results are written as JSON. Given a baseline (the results of an earlier run), every stage that is slower than its
+baseline by more than a threshold, and by more than MIN_SLOWDOWN seconds, is reported as a regression; so the
+jitter of stages that take a few milliseconds isn't. Comparing to a baseline takes at least MIN_BASELINE_REPEAT
+repetitions of each stage, for the same reason.
+"""
+
+import os
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import multiprocessing
+
+try:
+    import numpy
+except ImportError:
+    numpy = None            # Only reported, see util/geometry.py
+
+from util.io import getLsysFromFile
+from util.cache import SUBTREE_CACHE
+from util.geometry import interpretLsys
+from util.simplify import simplify
+from util.svg import writeSvg
+from util.profiler import getPeakMemory
+
+VERSION = 1                 # Changes whenever the format of the results changes
+STAGES = ( "parse", "expand", "interpret", "save" )
+MAX_TOKENS = 200000         # Longest expansion benchmarked, by default
+MAX_DEPTH = 16              # Deepest depth benchmarked
+PARAMETRIC_DEPTHS = range( 1, 7 )
+DEFAULT_SIZE = 5            # Unit size of turtle, the same as the prompt's
+DEFAULT_REPEAT = 3
+DEFAULT_TIMEOUT = 300       # Seconds per case
+DEFAULT_THRESHOLD = 0.25    # Slowdown reported as a regression, relative to the baseline
+MIN_SLOWDOWN = 0.010        # Seconds; smaller changes of a stage are never reported, whatever their ratio
+MIN_BASELINE_REPEAT = 3     # Fewest repetitions of each stage when comparing to a baseline
+
+def getLadder( lsys, max_tokens=MAX_TOKENS ):
+    """ Choose the depths an lsys is benchmarked at, see the docstring of this module.
+
+    Args:
+        lsys: An lsys object
+        max_tokens: The longest expansion benchmarked
+    Returns:
+        A sorted list of depths, empty if the length of the lsys doesn't grow (e.g. it has no rules)
+    """
+    try:
+        lengths = [ lsys.predict( depth )["tokens"] for depth in range( MAX_DEPTH + 1 ) ]
+    except ValueError:      # Parametric or context-sensitive
+        return list( PARAMETRIC_DEPTHS )
+    if lengths[MAX_DEPTH] <= lengths[1]:
+        return []
+
+    depths = set()
+    rung = 10
+    while True:
+        fitting = [ depth for ( depth, length ) in enumerate( lengths )
+                    if depth > 0 and length <= min( rung, max_tokens ) ]
+        if fitting:
+            depths.add( max( fitting ) )
+        if rung >= max_tokens:
+            break
+        rung *= 10
+    return sorted( depths )
+
+def timeStage( function, repeat ):
+    """ Run a function a number of times, emptying the subtree cache before each.
+
+    Returns:
+        A tuple of the best time, in seconds, and the result of the last run
+    """
+    best = None
+    for _ in range( repeat ):
+        SUBTREE_CACHE.clear()
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min( best, elapsed )
+    return ( best, result )
+
+def runCase( filename, name, depth, size, repeat, directory ):
+    """ Benchmark a single lsys at a single depth. Runs in a fresh process.
+
+    Args:
+        filename: The data file
+        name: The name of the lsys
+        depth: Number of iterations
+        size: Unit size of turtle
+        repeat: Number of repetitions of each stage
+        directory: A directory to save the svg file in
+    Returns:
+        A map of the results of the case, see the docstring of this module
+    """
+    ( parse, library ) = timeStage( lambda: getLsysFromFile( filename ), repeat )
+    lsys = next( lsys for lsys in library if lsys.name == name )
+    ( expand, tokens ) = timeStage( lambda: sum( 1 for token in lsys.iterTokens( depth ) ), repeat )
+    ( interpret, geometry ) = timeStage( lambda: interpretLsys( lsys, depth, size ), repeat )
+    path = os.path.join( directory, "{}_{}.svg".format( name, depth ) )
+    ( save, _ ) = timeStage( lambda: writeSvg( path, simplify( geometry ) ), repeat )
+
+    return { "name": name, "depth": depth, "tokens": tokens, "segments": len(geometry),
+             "seconds": { "parse": round( parse, 6 ), "expand": round( expand, 6 ),
+                          "interpret": round( interpret, 6 ), "save": round( save, 6 ) },
+             "tokens_per_second": round( tokens / expand ) if expand > 0 else None,
+             "segments_per_second": round( len(geometry) / interpret ) if interpret > 0 else None,
+             "peak_memory_mb": getPeakMemory() }
+
+def compare( results, baseline, threshold=DEFAULT_THRESHOLD ):
+    """ Compare results to a baseline.
+
+    Args:
+        results: The 'cases' of a run, see runBenchmark
+        baseline: The 'cases' of an earlier run
+        threshold: The slowdown, relative to the baseline, above which a stage has regressed
+    Returns:
+        A tuple of two lists of (case, stage, baseline seconds, seconds) tuples: the regressions, then the
+        improvements (stages faster than the baseline by more than the threshold). Either way, the time of a stage
+        must have changed by more than MIN_SLOWDOWN.
+    """
+    regressions = []
+    improvements = []
+    for ( case, result ) in results.items():
+        if case not in baseline or result.get( "error" ) or baseline[case].get( "error" ):
+            continue
+        for stage in STAGES:
+            ( old, new ) = ( baseline[case]["seconds"][stage], result["seconds"][stage] )
+            if abs( new - old ) <= MIN_SLOWDOWN:
+                continue
+            if new > old * ( 1 + threshold ):
+                regressions.append( ( case, stage, old, new ) )
+            elif new * ( 1 + threshold ) < old:
+                improvements.append( ( case, stage, old, new ) )
+    return ( regressions, improvements )
+
+def getParser():
+    """ Return the parser of the arguments of the 'bench' command. """
+    parser = argparse.ArgumentParser( prog="main.py bench", description="Benchmark the lsys objects of a data file." )
+    parser.add_argument( "file", help="the data file to benchmark, e.g. src/data/all.xml" )
+    parser.add_argument( "--names", default="all", help="comma separated names of lsys objects, or 'all' (default)" )
+    parser.add_argument( "--max-tokens", type=int, default=MAX_TOKENS, help="longest expansion benchmarked" )
+    parser.add_argument( "--repeat", type=int, default=DEFAULT_REPEAT, help="repetitions of each stage, the best is kept" )
+    parser.add_argument( "--size", type=float, default=DEFAULT_SIZE, help="unit size of turtle" )
+    parser.add_argument( "--timeout", type=float, default=DEFAULT_TIMEOUT, help="seconds allowed per case" )
+    parser.add_argument( "--output", default="bench.json", help="path of the JSON results (default: bench.json)" )
+    parser.add_argument( "--baseline", default=None, help="JSON results of an earlier run to compare against" )
+    parser.add_argument( "--threshold", type=float, default=DEFAULT_THRESHOLD,
+                         help="relative slowdown reported as a regression (default: 0.25)" )
+    return parser
+
+def runBenchmark( argv ):
+    """ Run the 'bench' command, see the docstring of this module.
+
+    Args:
+        argv: The arguments following 'bench'
+    Returns:
+        The exit status of the program: 0 if nothing regressed, 1 otherwise, 2 if the arguments are invalid
+    """
+    args = getParser().parse_args( argv )
+    try:
+        library = getLsysFromFile( args.file )
+        baseline = None
+        if args.baseline is not None:
+            with open( args.baseline, encoding="utf-8" ) as file:
+                baseline = json.load( file )
+        if args.repeat < 1 or args.max_tokens < 1:
+            raise ValueError( "The number of repetitions and of tokens must be positive." )
+        if baseline is not None and args.repeat < MIN_BASELINE_REPEAT:
+            raise ValueError( "Comparing to a baseline takes at least {} repetitions, got --repeat {}.".format(
+                MIN_BASELINE_REPEAT, args.repeat ) )
+    except ( OSError, ValueError, IndexError ) as e:
+        print( "Error: {}".format( e ) )
+        return 2
+
+    names = [ name.strip().lower() for name in args.names.split( "," ) if name.strip() ]
+    if names != [ "all" ]:
+        library = [ lsys for lsys in library if lsys.name.lower() in names ]
+    cases = []
+    for lsys in library:
+        ladder = getLadder( lsys, args.max_tokens )
+        if not ladder:
+            print( "Skipping {}, its length doesn't grow.".format( lsys.name ) )
+        cases.extend( ( lsys.name, depth ) for depth in ladder )
+
+    results = dict()
+    directory = tempfile.mkdtemp( prefix="lsys-bench-" )
+    print( "Benchmarking {} cases.".format( len(cases) ) )
+    print( "{:24} {:>5} {:>10} {:>10} {:>9} {:>9} {:>9} {:>9} {:>8}".format(
+        "lsys", "depth", "tokens", "segments", "parse", "expand", "interpret", "save", "peak MB" ) )
+    try:
+        for ( name, depth ) in cases:
+            case = "{}@{}".format( name, depth )
+
+            # A new process for every case; leaving the pool terminates it, even if the case is still running
+            with multiprocessing.Pool( 1 ) as pool:
+                try:
+                    result = pool.apply_async( runCase, ( args.file, name, depth, args.size, args.repeat, directory ) )
+                    results[case] = result.get( args.timeout )
+                except multiprocessing.TimeoutError:
+                    results[case] = { "name": name, "depth": depth, "error": "Timed out" }
+                except Exception as e:
+                    results[case] = { "name": name, "depth": depth, "error": "{}: {}".format( type( e ).__name__, e ) }
+
+            result = results[case]
+            if result.get( "error" ):
+                print( "{:24} {:>5} {}".format( name, depth, result["error"] ) )
+            else:
+                seconds = result["seconds"]
+                print( "{:24} {:>5} {:>10,} {:>10,} {:>8.3f}s {:>8.3f}s {:>8.3f}s {:>8.3f}s {:>8}".format(
+                    name, depth, result["tokens"], result["segments"], seconds["parse"], seconds["expand"],
+                    seconds["interpret"], seconds["save"], str( result["peak_memory_mb"] ) ) )
+    finally:
+        shutil.rmtree( directory, ignore_errors=True )
+
+    summary = { "version": VERSION, "file": args.file, "python": platform.python_version(),
+                "platform": platform.platform(), "numpy": numpy is not None, "repeat": args.repeat,
+                "size": args.size, "cases": results }
+    try:
+        with open( args.output, "w", encoding="utf-8" ) as file:
+            json.dump( summary, file, indent=2 )
+        print( "Results written to {}.".format( args.output ) )
+    except OSError as e:
+        print( "Error: Could not write the results: {}".format( e ) )
+
+    if baseline is None:
+        return 0
+    ( regressions, improvements ) = compare( results, baseline.get( "cases", {} ), args.threshold )
+    for ( title, rows ) in ( ( "Improvements", improvements ), ( "Regressions", regressions ) ):
+        if rows:
+            print( "{} (more than {:.0%} against {}):".format( title, args.threshold, args.baseline ) )
+            for ( case, stage, old, new ) in rows:
+                print( "    {:28} {:9} {:8.3f}s -> {:8.3f}s ({:+.0%})".format(
+                    case, stage, old, new, new / old - 1 if old > 0 else float( "inf" ) ) )
+    print( "{} regressions, {} improvements.".format( len(regressions), len(improvements) ) )
+    return 1 if regressions else 0
@@ -0,0 +1,281 @@
+"""
+Analytic bounds
+Find a bounding box of the drawing of an lsys at any depth, without expanding or drawing anything.
+
+A set of points is summarized by its support function: the furthest it reaches in each of a fixed set of evenly
+spaced directions. Support functions compose the way turtle drawings do: rotating a set rotates its support
+function, scaling it scales it, the union of two sets is their maximum and the sum of two sets (every point of one
+moved by every point of the other) is their sum.
+
+So, like the transforms of util/access.py, every (symbol, depth) subtree is summarized once, drawn from the origin
+w/ a heading of 0 and a unit size of 1, by the support function of the points it draws (its hull), and for every
+turn it may end with, the support function of the points it may end at. A rule string is then summarized from the
+summaries of its tokens, and the axiom from those of its variables, in O(depth) work per symbol.
+
+Stochastic and context-sensitive rules are summarized by the union of all their results (including the token
+itself, if no context may match), so their bounds are conservative. If the lsys' angle is a multiple of the
+angle between two directions, every rotation moves the support function by a whole number of directions, and the
+bounding box of a deterministic lsys is exactly that of its drawing; other angles are interpolated between the
+neighboring directions, which is conservative. Summaries assume that the brackets of each rule string are
+balanced.
+"""
+
+from math import cos, sin, ceil, radians, gcd
+
+from util.expand import tokenize, getSizeMultiplier, DRAW_TOKENS, MOVE_TOKENS, LEAF_TOKEN, COLOR_TOKEN, SIZE_TOKEN
+
+MIN_DIRECTIONS = 16         # Fewest directions a support function is sampled in
+MAX_DIRECTIONS = 360        # Most directions; angles that would need more are interpolated
+INTERPOLATED_DIRECTIONS = 64    # Number of directions when rotations are interpolated
+MAX_HEADINGS = 64           # Most headings a subtree may end with, before it is deemed unbounded
+LEAF_ANGLE = 45             # Angle between a leaf and its stem, see util/geometry.py
+LEAF_FRACTION = 0.25        # Length of a leaf, relative to its stem
+EPSILON = 1e-9
+
+def getDirectionCount( angle ):
+    """ Choose the number of directions of the support functions of an lsys.
+
+    Args:
+        angle: The angle associated with the lsys
+    Returns:
+        A multiple of 4, so that the bounding box can be read off, and of the number of turns in a full circle, if
+        that is a whole number no greater than MAX_DIRECTIONS.
+    """
+    for turns in range( 1, MAX_DIRECTIONS + 1 ):
+        steps = angle * turns / 360
+        if abs( steps - round( steps ) ) < EPSILON:
+            count = turns * 4 // gcd( turns, 4 )
+            if count <= MAX_DIRECTIONS:
+                return count * ceil( MIN_DIRECTIONS / count )
+            break
+    return INTERPOLATED_DIRECTIONS
+
+class Bounds( object ):
+
+    def __init__( self, table, angle ):
+        """ Constructor
+
+        Args:
+            table: A compiled RuleTable, see util/ruletable.py
+            angle: The angle associated with the lsys
+        Raises:
+            ValueError: If the ruleset is parametric
+        """
+        if table.isParametric():
+            raise ValueError( "The bounds of parametric lsys objects can't be predicted." )
+
+        self.table = table
+        self.angle = angle
+        self.variables = table.variables
+        self.count = getDirectionCount( angle )
+        self.step = 360 / self.count
+        self.directions = [ ( cos( radians( i * self.step ) ), sin( radians( i * self.step ) ) )
+                            for i in range( self.count ) ]
+        self.empty = ( float("-inf"), ) * self.count
+        self.origin = ( 0.0, ) * self.count
+        self.choices = { var: self.getChoices( var ) for var in self.variables }
+        self.summaries = [ dict() ]
+
+        # Summaries of the tokens that draw something by themselves
+        forward = self.getPoints( [ ( 1.0, 0.0 ) ] )
+        leaf = [ ( 0.0, 0.0 ), ( 1.0, 0.0 ) ] + [
+            ( 1.0 + LEAF_FRACTION * cos( radians( turn ) ), LEAF_FRACTION * sin( radians( turn ) ) )
+            for turn in ( LEAF_ANGLE, -LEAF_ANGLE ) ]
+        self.draw = ( self.getPoints( [ ( 0.0, 0.0 ), ( 1.0, 0.0 ) ] ), { 0.0: forward } )
+        self.move = ( self.empty, { 0.0: forward } )
+        self.leaf = ( self.getPoints( leaf ), { 0.0: forward } )
+
+    def getChoices( self, var ):
+        """ Get every string that a variable may be rewritten into, in a single generation.
+
+        Args:
+            var: A variable of the lsys
+        Returns:
+            A set of tuples of tokens
+        """
+        choices = set()
+        universal = False
+        for ( context, lengths, mask, results ) in self.table.productions.get( var, () ):
+            if mask.outcomes is None:
+                mask.compile()
+            choices.update( results.get( outcome, () ) for outcome in mask.outcomes )
+            universal = universal or context.isUniversal()
+        if not universal:
+            choices.add( ( var, ) )
+        return choices
+
+    def getPoints( self, points ):
+        """ Return the support function of a list of (x, y) points. """
+        return tuple( max( x * dx + y * dy for ( x, y ) in points ) for ( dx, dy ) in self.directions )
+
+    def rotate( self, support, heading ):
+        """ Rotate a support function counterclockwise.
+
+        Args:
+            support: A support function
+            heading: The angle to rotate by, in degrees
+        Returns:
+            The support function of the rotated set, or of a set that contains it if the angle isn't a multiple
+            of the angle between two directions.
+        """
+        shift = heading / self.step
+        n = self.count
+        if abs( shift - round( shift ) ) < EPSILON:
+            shift = round( shift ) % n
+            return support[n-shift:] + support[:n-shift]
+
+        # The furthest point in between two directions is at most the corner of their two half-planes
+        shift %= n
+        whole = int( shift )
+        fraction = ( shift - whole ) * self.step
+        ( a, b ) = ( sin( radians( self.step - fraction ) ), sin( radians( fraction ) ) )
+        scale = 1 / sin( radians( self.step ) )
+        return tuple( ( support[ ( i - whole - 1 ) % n ] * b + support[ ( i - whole ) % n ] * a ) * scale
+                      for i in range( n ) )
+
+    def place( self, support, position, heading, size ):
+        """ Move a support function, drawn from the origin w/ a heading of 0 and a unit size of 1, to a turtle state.
+
+        Args:
+            support: A support function
+            position: The support function of the set of positions the turtle may be at
+            heading: The heading of the turtle, in degrees
+            size: Unit size of turtle
+        Returns:
+            The support function of every point the set may be drawn at
+        """
+        if size < 0:
+            ( heading, size ) = ( heading + 180, -size )
+        rotated = self.rotate( support, heading )
+        return tuple( p + size * s for ( p, s ) in zip( position, rotated ) )
+
+    def getBox( self, token, depth, x, y, heading, size ):
+        """ Get a bounding box of a single token, expanded a given number of times and drawn from a turtle state.
+
+        Args:
+            token: A token of the lsys' alphabet
+            depth: Number of generations
+            x, y: The position of the turtle
+            heading: The heading of the turtle, in degrees
+            size: Unit size of turtle
+        Returns:
+            A tuple of (xmin, ymin, xmax, ymax), or None if nothing is drawn.
+        """
+        hull = self.getSummary( token, depth )[0]
+        if hull[0] == float("-inf"):
+            return None
+        if size < 0:
+            ( heading, size ) = ( heading + 180, -size )
+        hull = self.rotate( hull, heading )
+        quarter = self.count // 4
+        return ( x - size * hull[2*quarter], y - size * hull[3*quarter], x + size * hull[0], y + size * hull[quarter] )
+
+    def getSummary( self, token, depth ):
+        """ Get the summary of a single token, expanded a given number of times.
+
+        Args:
+            token: A token of the lsys' alphabet
+            depth: Number of generations
+        Returns:
+            A tuple of the hull of the subtree, and a map of every turn it may end with to the support function of
+            the points it may end at, when drawn from the origin w/ a heading of 0 and a unit size of 1.
+        Raises:
+            ValueError: If the subtree may end w/ more than MAX_HEADINGS headings
+        """
+        if depth > 0 and token in self.variables:
+            while len(self.summaries) <= depth:
+                level = len(self.summaries)
+                summaries = dict()
+                for var in self.variables:
+                    hull = self.empty
+                    ends = dict()
+                    for choice in self.choices[var]:
+                        ( h, e ) = self.advance( choice, level-1 )
+                        hull = tuple( map( max, hull, h ) )
+                        merge( ends, e )
+                    if len(ends) > MAX_HEADINGS:
+                        raise ValueError( "The bounds of '{}' can't be predicted, it may end w/ too many headings."
+                                          .format( var ) )
+                    summaries[var] = ( hull, ends )
+                self.summaries.append( summaries )
+            return self.summaries[depth][token]
+
+        first = token[0]
+        if first in DRAW_TOKENS:
+            return self.draw
+        elif first in MOVE_TOKENS:
+            return self.move
+        elif first == LEAF_TOKEN:
+            return self.leaf
+        elif first == "+":
+            return ( self.empty, { normalize( self.angle ): self.origin } )
+        elif first == "-":
+            return ( self.empty, { normalize( -self.angle ): self.origin } )
+        return ( self.empty, { 0.0: self.origin } )
+
+    def advance( self, tokens, depth, size=1 ):
+        """ Summarize a string, using the summaries of its subtrees.
+
+        Args:
+            tokens: The tokens of a string
+            depth: Number of generations that each token is expanded
+            size: Unit size of turtle
+        Returns:
+            A summary of the string, see getSummary
+        """
+        hull = self.empty
+        states = { 0.0: self.origin }       # Map of the headings the turtle may have to the positions it may be at
+        stack = []
+        size_multiplier = 1
+        for token in tokens:
+            first = token[0]
+            if first == SIZE_TOKEN:
+                size_multiplier = getSizeMultiplier( token[1:] )
+            elif first == COLOR_TOKEN:
+                pass
+            elif first == "[":
+                stack.append( states )
+            elif first == "]":
+                if len(stack) > 0:
+                    states = stack.pop()
+            else:
+                ( h, ends ) = self.getSummary( token, depth )
+                result = dict()
+                for ( heading, position ) in states.items():
+                    if h[0] != float("-inf"):
+                        hull = tuple( map( max, hull, self.place( h, position, heading, size * size_multiplier ) ) )
+                    for ( turn, end ) in ends.items():
+                        merge( result, { normalize( heading + turn ):
+                                         self.place( end, position, heading, size * size_multiplier ) } )
+                states = result
+                if len(states) > MAX_HEADINGS:
+                    raise ValueError( "The bounds of '{}' can't be predicted, it may turn to too many headings."
+                                      .format( "".join( tokens ) ) )
+        return ( hull, states )
+
+    def getBounds( self, axiom, depth, size=1 ):
+        """ Get a bounding box of the drawing of the final-depth string.
+
+        Args:
+            axiom: The string the expansion starts with
+            depth: Number of generations
+            size: Unit size of turtle
+        Returns:
+            A tuple of (xmin, ymin, xmax, ymax), or None if nothing is drawn.
+        Raises:
+            ValueError: If the lsys may turn to too many headings to be bounded
+        """
+        ( hull, ends ) = self.advance( tokenize( axiom ), depth, size )
+        if hull[0] == float("-inf"):
+            return None
+        quarter = self.count // 4
+        return ( -hull[2*quarter], -hull[3*quarter], hull[0], hull[quarter] )
+
+def normalize( heading ):
+    """ Reduce a heading to [0, 360), rounded so that equal headings compare equal. """
+    return round( heading % 360, 9 ) % 360
+
+def merge( summary, other ):
+    """ Add the turns and end points of a summary to another, see Bounds.getSummary. """
+    for ( turn, end ) in other.items():
+        summary[turn] = tuple( map( max, summary[turn], end ) ) if turn in summary else end
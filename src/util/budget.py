@@ -0,0 +1,225 @@
+"""
+Run budgets
+Limits on the resources a single run may use, so that a run that is too deep fails early instead of locking up the
+machine. A budget limits:
+    tokens      -   The number of turtle commands of the final-depth string
+    segments    -   The number of line segments drawn
+    seconds     -   The wall time of the run
+    memory      -   The resident memory of the process, in megabytes (half of the physical memory by default)
+
+Limits are checked twice. Before a run starts, against the predicted size of the expansion (see util/growth.py);
+a stochastic lsys is checked against its expected size, and a parametric or context-sensitive one, whose size can't
+be predicted, isn't checked at all. Then, while the commands of the run are generated ('watch'), every block of
+CHECK_INTERVAL commands, which also catches what the prediction missed. Expansions that don't go through commands (e.g. lsys objects w/ a
+fast path, whose predictions are exact) are only checked up front. Culled runs (see util/lod.py) are bounded by the
+resolution of the drawing rather than by the size of the expansion, so they aren't checked up front.
+
+While a run is being watched, its progress (the commands generated so far, out of the predicted number) is reported
+on a single line of the console, at most every PROGRESS_INTERVAL seconds; so short runs report nothing.
+"""
+
+import os
+import sys
+import time
+from itertools import islice
+
+try:
+    import resource
+except ImportError:
+    resource = None         # Not available on Windows; memory isn't limited there
+
+from util.expand import DRAW_TOKENS, MOVE_TOKENS, LEAF_TOKEN, TURN_TOKENS, BRANCH_TOKENS, COLOR_TOKEN
+from util.growth import LEAF_SEGMENTS
+
+LIMITS = ( "tokens", "segments", "seconds", "memory" )
+CHECK_INTERVAL = 1 << 12    # Commands generated between two checks of the limits
+PROGRESS_INTERVAL = 0.5     # Seconds between two reports of the progress
+SEGMENT_BYTES = 40          # Memory used by an interpreted segment, see util/geometry.py
+COMMAND_TOKENS = DRAW_TOKENS + MOVE_TOKENS + LEAF_TOKEN + TURN_TOKENS + BRANCH_TOKENS
+
+class BudgetError( RuntimeError ):
+    """ Raised when a run would exceed, or exceeds, one of the limits of its budget. """
+
+def getMemory():
+    """ Return the resident memory of this process, in megabytes, or None if it isn't known.
+    Where the current size isn't available, the peak size is returned instead.
+    """
+    try:
+        with open( "/proc/self/statm" ) as file:
+            return int( file.read().split()[1] ) * os.sysconf( "SC_PAGE_SIZE" ) / 1048576
+    except ( OSError, ValueError, IndexError, AttributeError ):
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss
+    return peak / ( 1048576 if sys.platform == "darwin" else 1024 )     # Bytes on macOS, KB elsewhere
+
+def getDefaultMemory():
+    """ Return half of the physical memory of the machine, in megabytes, or None if it isn't known. """
+    try:
+        return os.sysconf( "SC_PHYS_PAGES" ) * os.sysconf( "SC_PAGE_SIZE" ) // 2 // 1048576
+    except ( OSError, ValueError, AttributeError ):
+        return None
+
+def getExpectedCommands( histogram ):
+    """ Count the turtle commands of a string, given its symbol counts, see util/growth.py. """
+    return round( sum( count for ( symbol, count ) in histogram.items()
+                       if symbol in COMMAND_TOKENS or ( symbol[0] == COLOR_TOKEN and len(symbol) > 1 ) ) )
+
+class Budget( object ):
+
+    def __init__( self, tokens=None, segments=None, seconds=None, memory=None ):
+        """ Constructor. A limit of None is no limit.
+
+        Args:
+            tokens: Most turtle commands of a run
+            segments: Most line segments of a run
+            seconds: Longest wall time of a run
+            memory: Most resident memory of the process during a run, in megabytes
+        """
+        self.limits = { "tokens": tokens, "segments": segments, "seconds": seconds, "memory": memory }
+        self.progress = True        # Whether the progress of watched runs is reported
+        self.running = False
+        self.name = None
+        self.expected = None
+        self.tokens = 0
+        self.segments = 0
+        self.start = 0.0
+        self.reported = 0.0
+
+    def __repr__( self ):
+        """ String representation.
+
+        Returns:
+            A console-friendly string representation.
+        """
+        units = { "tokens": "", "segments": "", "seconds": " s", "memory": " MB" }
+        limits = ", ".join( "{}: {}".format( name, "none" if value is None else "{:,}{}".format( value, units[name] ) )
+                            for ( name, value ) in self.limits.items() )
+        return "Limits of a run: {}. Progress is {}.".format( limits, "shown" if self.progress else "hidden" )
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, *args ):
+        self.end()
+
+    def setLimit( self, name, value ):
+        """ Change a limit.
+
+        Args:
+            name: One of LIMITS
+            value: The new limit, or None to remove it
+        Raises:
+            KeyError: If there is no such limit
+        """
+        if name not in self.limits:
+            raise KeyError( name )
+        self.limits[name] = value
+
+    def check( self, lsys, depth ):
+        """ Check the predicted size of a run against the limits, before running it.
+
+        Args:
+            lsys: An lsys object
+            depth: Number of iterations
+        Returns:
+            The predicted number of turtle commands, or None if it can't be predicted
+        Raises:
+            BudgetError: If the run is predicted to exceed a limit
+        """
+        try:
+            prediction = lsys.predict( depth )
+        except ValueError:      # Parametric or context-sensitive
+            return None
+
+        ( commands, segments ) = ( getExpectedCommands( prediction["histogram"] ), prediction["segments"] )
+        estimate = ( segments * SEGMENT_BYTES + prediction["tokens"] ) / 1048576   # The segments, and the string if built
+        current = getMemory() or 0
+        for ( name, value ) in ( ( "tokens", commands ), ( "segments", segments ), ( "memory", current + estimate ) ):
+            limit = self.limits[name]
+            if limit is not None and value > limit:
+                raise BudgetError( "{} after {} iterations is predicted to need {:,.0f} {}, more than the limit of "
+                                   "{:,}. Use 'budget {} [value]' to change it.".format(
+                                       lsys.name, depth, value, "MB" if name == "memory" else name, limit, name ) )
+        return commands
+
+    def begin( self, lsys, depth, checked=True ):
+        """ Check a run up front, then start watching it.
+
+        Args:
+            lsys: An lsys object
+            depth: Number of iterations
+            checked: Whether the predicted size of the run is checked, see the docstring of this module
+        Returns:
+            The budget itself, which stops watching the run when used as a context manager
+        Raises:
+            BudgetError: If the run is predicted to exceed a limit
+        """
+        self.expected = self.check( lsys, depth ) if checked else None
+        self.name = lsys.name
+        self.running = True
+        self.tokens = 0
+        self.segments = 0
+        self.start = self.reported = time.monotonic()
+        return self
+
+    def end( self ):
+        """ Stop watching the current run, and end its line of progress. """
+        if self.running and self.reported > self.start:
+            print()
+        self.running = False
+
+    def watch( self, commands ):
+        """ Count the turtle commands of the current run as they are generated, and enforce its limits.
+
+        Args:
+            commands: An iterable of (token, arg) commands, see util/expand.py
+        Returns:
+            The iterable itself if no run is being watched, otherwise a generator of the same commands, which
+            raises BudgetError once a limit is exceeded
+        """
+        return commands if not self.running else self.iterWatched( commands )
+
+    def iterWatched( self, commands ):
+        """ Helper for 'watch', a block of CHECK_INTERVAL commands at a time. """
+        commands = iter( commands )
+        while True:
+            block = list( islice( commands, CHECK_INTERVAL ) )
+            self.tokens += len(block)
+            self.segments += sum( 1 for ( token, arg ) in block if token in DRAW_TOKENS ) + \
+                sum( LEAF_SEGMENTS for ( token, arg ) in block if token == LEAF_TOKEN )
+            self.enforce()
+            yield from block
+            if len(block) < CHECK_INTERVAL:
+                return
+
+    def enforce( self ):
+        """ Check the current run against the limits, and report its progress.
+
+        Raises:
+            BudgetError: If the run exceeds a limit
+        """
+        now = time.monotonic()
+        elapsed = now - self.start
+        memory = getMemory() if self.limits["memory"] is not None else None
+        for ( name, value ) in ( ( "tokens", self.tokens ), ( "segments", self.segments ),
+                                 ( "seconds", elapsed ), ( "memory", memory ) ):
+            limit = self.limits[name]
+            if limit is not None and value is not None and value > limit:
+                self.end()
+                raise BudgetError( "{} exceeded the limit of {:,} {} after {:,} commands. Use 'budget {} [value]' "
+                                   "to change it.".format( self.name, limit, "MB" if name == "memory" else name,
+                                                           self.tokens, name ) )
+
+        if self.progress and now - self.reported >= PROGRESS_INTERVAL:
+            self.reported = now
+            if self.expected:
+                progress = "{:,} of ~{:,} commands ({:.0%})".format(
+                    self.tokens, self.expected, min( self.tokens / self.expected, 1 ) )
+            else:
+                progress = "{:,} commands".format( self.tokens )
+            print( "\r{}: {}, {:.1f}s. Ctrl-C to cancel.".format( self.name, progress, elapsed ), end="", flush=True )
+
+# The limits of every run of the prompt
+BUDGET = Budget( memory=getDefaultMemory() )
@@ -0,0 +1,95 @@
+"""
+Subtree cache
+Deterministic lsys objects expand the same symbol at the same remaining depth over and over again;
+e.g. every 'F' of PeanoCurve at depth 3 becomes the same 9^3 character string.
+The cache remembers these expansions so that each repeated subtree is computed once.
+
+Entries are keyed by (compiled ruleset, symbol, remaining depth) and are evicted least recently used first,
+once the approximate memory used by the cache exceeds its capacity.
+Stochastic lsys objects are never cached, since the same subtree can expand differently every time.
+"""
+
+from collections import OrderedDict
+
+DEFAULT_CAPACITY = 64 * 1024 * 1024     # Bytes
+
+class SubtreeCache( object ):
+
+    def __init__( self, capacity=DEFAULT_CAPACITY ):
+        """ Constructor
+
+        Args:
+            capacity: Approximate number of bytes the cache may hold. 0 disables the cache.
+        """
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.used = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__( self ):
+        """ String representation.
+
+        Returns:
+            A console-friendly string representation.
+        """
+        return "{} entries, {:.1f} of {:.1f} MB used, {} hits, {} misses".format(
+            len(self.entries), self.used / 1048576, self.capacity / 1048576, self.hits, self.misses )
+
+    def isEnabled( self ):
+        """ Return whether the cache may hold anything. """
+        return self.capacity > 0
+
+    def setCapacity( self, capacity ):
+        """ Change the capacity of the cache, evicting entries if necessary.
+
+        Args:
+            capacity: Approximate number of bytes the cache may hold. 0 disables the cache.
+        """
+        self.capacity = capacity
+        self.evict()
+
+    def clear( self ):
+        """ Remove every entry. """
+        self.entries.clear()
+        self.used = 0
+
+    def get( self, key ):
+        """ Look up an entry, and mark it as the most recently used.
+
+        Args:
+            key: A (ruleset, symbol, depth) tuple
+        Returns:
+            The cached expansion, or None if there is none.
+        """
+        entry = self.entries.get( key )
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end( key )
+        return entry[0]
+
+    def put( self, key, value, cost ):
+        """ Add an entry, evicting the least recently used entries if the cache is over capacity.
+
+        Args:
+            key: A (ruleset, symbol, depth) tuple
+            value: The expansion of the symbol
+            cost: Approximate number of bytes used by 'value'
+        """
+        if cost > self.capacity:
+            return
+        if key in self.entries:
+            self.used -= self.entries.pop( key )[1]
+        self.entries[key] = ( value, cost )
+        self.used += cost
+        self.evict()
+
+    def evict( self ):
+        """ Remove least recently used entries until the cache is within its capacity. """
+        while self.used > self.capacity and len(self.entries) > 0:
+            self.used -= self.entries.popitem( last=False )[1][1]
+
+# Shared by every expansion
+SUBTREE_CACHE = SubtreeCache()
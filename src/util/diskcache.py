@@ -0,0 +1,220 @@
+"""
+Geometry cache
+Keeps the Geometry of runs (see util/geometry.py) on disk, so that runs which were already interpreted, in this
+session or an earlier one, are loaded instead of being expanded again.
+
+Entries are keyed by a hash of everything a drawing depends on: the definition of the lsys (its angle, axiom,
+ruleset and seed, but not its name), the depth, the unit size and, for culled drawings, the viewport and pixel size
+(see util/lod.py). Modifying or reloading an lsys changes its key, so stale entries are never read; they are left
+to be evicted.
+
+Every entry is a single file: a short header followed by the x0, y0, x1 and y1 arrays of its segments (as doubles)
+and their colors (as 64 bit integers), in the byte order of the machine. Files are memory-mapped when read, so an
+entry is copied straight from the page cache into the arrays of a Geometry.
+Once the files take more than the capacity of the cache, the least recently used are deleted; a file's modification
+time is its last use.
+"""
+
+import os
+import mmap
+import struct
+import hashlib
+import tempfile
+from array import array
+
+from util.geometry import Geometry
+from util.profiler import profiled
+
+DEFAULT_CAPACITY = 256 * 1024 * 1024    # Bytes
+VERSION = 1                 # Changes whenever the format of the files, or what is drawn, changes
+MAGIC = b"LSYSGEO"
+HEADER = struct.Struct( "<7sBQ" )       # Magic, version and number of segments
+SEGMENT_BYTES = 40          # Four doubles and a 64 bit integer
+EXTENSION = ".geo"
+
+def getKey( lsys, depth, size, variant=None ):
+    """ Hash everything a run depends on into the key of its entry.
+
+    Args:
+        lsys: An lsys object
+        depth: Number of iterations
+        size: Unit size of turtle
+        variant: Anything else the Geometry depends on, which has a stable repr(), e.g. a viewport
+    Returns:
+        A string of hexadecimal digits
+    """
+    definition = ( VERSION, lsys.getDefinition(), depth, size, variant )
+    return hashlib.sha256( repr( definition ).encode( "utf-8" ) ).hexdigest()
+
+class GeometryCache( object ):
+
+    def __init__( self, directory, capacity=DEFAULT_CAPACITY ):
+        """ Constructor. The directory is created when the first entry is written.
+
+        Args:
+            directory: The path of the directory the entries are kept in
+            capacity: Approximate number of bytes the entries may take. 0 disables the cache.
+        """
+        self.directory = directory
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__( self ):
+        """ String representation.
+
+        Returns:
+            A console-friendly string representation.
+        """
+        entries = self.getEntries()
+        return "{} entries, {:.1f} of {:.1f} MB used in {}, {} hits, {} misses".format(
+            len(entries), sum( size for ( time, size, path ) in entries ) / 1048576, self.capacity / 1048576,
+            self.directory, self.hits, self.misses )
+
+    def isEnabled( self ):
+        """ Return whether the cache may hold anything. """
+        return self.capacity > 0
+
+    def setCapacity( self, capacity ):
+        """ Change the capacity of the cache, evicting entries if necessary.
+
+        Args:
+            capacity: Approximate number of bytes the entries may take. 0 disables the cache.
+        """
+        self.capacity = capacity
+        self.evict()
+
+    def getPath( self, key ):
+        """ Return the path of the file of an entry. """
+        return os.path.join( self.directory, key + EXTENSION )
+
+    def getEntries( self ):
+        """ List the entries of the cache.
+
+        Returns:
+            A list of (last use, bytes, path) tuples, least recently used first.
+        """
+        try:
+            names = os.listdir( self.directory )
+        except OSError:
+            return []
+        entries = []
+        for name in names:
+            if name.endswith( EXTENSION ):
+                path = os.path.join( self.directory, name )
+                try:
+                    stat = os.stat( path )
+                except OSError:
+                    continue
+                entries.append( ( stat.st_mtime, stat.st_size, path ) )
+        entries.sort()
+        return entries
+
+    @profiled( "diskcache" )
+    def get( self, key ):
+        """ Load an entry, and mark it as the most recently used.
+
+        Args:
+            key: The key of the entry, see getKey
+        Returns:
+            The Geometry, or None if there is no such entry (or it can't be read).
+        """
+        if not self.isEnabled():
+            return None
+        path = self.getPath( key )
+        try:
+            with open( path, "rb" ) as file:
+                with mmap.mmap( file.fileno(), 0, access=mmap.ACCESS_READ ) as buffer:
+                    geometry = readGeometry( buffer )
+            os.utime( path )
+        except ( OSError, ValueError ):
+            geometry = None
+
+        if geometry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return geometry
+
+    @profiled( "diskcache" )
+    def put( self, key, geometry ):
+        """ Add an entry, evicting the least recently used entries if the cache is over capacity.
+        The file is written under a temporary name first, so that an entry is never read half written.
+
+        Args:
+            key: The key of the entry, see getKey
+            geometry: The Geometry to keep
+        Raises:
+            OSError: If the file can't be written
+        """
+        if not self.isEnabled() or HEADER.size + len(geometry) * SEGMENT_BYTES > self.capacity:
+            return
+        os.makedirs( self.directory, exist_ok=True )
+        ( fd, temporary ) = tempfile.mkstemp( EXTENSION + ".tmp", dir=self.directory )
+        try:
+            with os.fdopen( fd, "wb" ) as file:
+                writeGeometry( file, geometry )
+            os.replace( temporary, self.getPath( key ) )
+        except BaseException:
+            os.remove( temporary )
+            raise
+        self.evict()
+
+    def evict( self ):
+        """ Delete least recently used entries until the cache is within its capacity. """
+        entries = self.getEntries()
+        used = sum( size for ( time, size, path ) in entries )
+        for ( time, size, path ) in entries:
+            if used <= self.capacity:
+                break
+            try:
+                os.remove( path )
+            except OSError:
+                continue
+            used -= size
+
+    def clear( self ):
+        """ Delete every entry. """
+        for ( time, size, path ) in self.getEntries():
+            try:
+                os.remove( path )
+            except OSError:
+                pass
+
+def writeGeometry( file, geometry ):
+    """ Write a Geometry to a binary file, see the docstring of this module. """
+    file.write( HEADER.pack( MAGIC, VERSION, len(geometry) ) )
+    for values in ( geometry.x0, geometry.y0, geometry.x1, geometry.y1 ):
+        file.write( values.tobytes() )
+    colors = geometry.colors if geometry.colors.itemsize == 8 else array( "q", geometry.colors )
+    file.write( colors.tobytes() )
+
+def readGeometry( buffer ):
+    """ Read a Geometry from a buffer, see the docstring of this module.
+
+    Args:
+        buffer: A bytes-like object, e.g. a memory-mapped file
+    Returns:
+        The Geometry
+    Raises:
+        ValueError: If the buffer doesn't hold a Geometry of this version
+    """
+    if len(buffer) < HEADER.size:
+        raise ValueError( "The entry is truncated." )
+    ( magic, version, count ) = HEADER.unpack_from( buffer )
+    if magic != MAGIC or version != VERSION or len(buffer) != HEADER.size + count * SEGMENT_BYTES:
+        raise ValueError( "The entry isn't a Geometry of this version." )
+
+    geometry = Geometry()
+    with memoryview( buffer ) as view:
+        offset = HEADER.size
+        for values in ( geometry.x0, geometry.y0, geometry.x1, geometry.y1 ):
+            values.frombytes( view[offset:offset + count * 8] )
+            offset += count * 8
+        if geometry.colors.itemsize == 8:
+            geometry.colors.frombytes( view[offset:] )
+        else:
+            colors = array( "q" )
+            colors.frombytes( view[offset:] )
+            geometry.colors.extend( colors )
+    return geometry
@@ -0,0 +1,428 @@
+"""
+Expansion engine
+Lazily expands an lsys to a given depth, without ever building the full string.
+
+The engine walks rule strings depth-first with an explicit work stack, so the maximum depth is limited only by
+memory, and memory use is proportional to the depth rather than to the length of the expansion.
+
+Two views of an expansion are offered:
+    Tokens:     The symbols of the final-depth string, in order. Color codes ('#12') and size modifiers ('@Q2')
+                are single tokens. Spaces are dropped.
+    Commands:   Decoded turtle commands, as (token, arg) tuples, where 'arg' depends on the token:
+                    'F' 'G' 'H' 'I' 'J' 'f' 'g' 'h' 'i' 'j' 'L'   -   The length to move forward
+                    '+' '-'                                         -   The angle to turn
+                    '#'                                             -   The integer color id
+                    '[' ']'                                         -   None
+                Size modifiers are applied to the lengths and tokens without any turtle action are skipped.
+                Context-free lsys objects are decoded from their opcodes instead (see util/opcodes.py).
+
+Parametric lsys objects (see classes/symbol.py) are walked as (token, parameters) modules. Their tokens are
+formatted w/ their parameter values, e.g. 'F(2.5)'. In their commands, the first parameter of a forward token
+multiplies its length, and the first parameter of a turn is its angle.
+
+The result of a stochastic rule is selected by the key of the token it rewrites, which is hashed from the seed of
+the lsys and the position of the token in the derivation tree (see util/stream.py). So the same lsys, seed and depth
+always give the same expansion, however it is expanded.
+"""
+
+from util.stack import Stack
+from util.cache import SUBTREE_CACHE
+from util.stream import getRootKey, getChildKey
+from util.profiler import PROFILER
+
+DRAW_TOKENS = "FGHIJ"       # Forward, drawing a line
+MOVE_TOKENS = "fghij"       # Forward, without drawing
+LEAF_TOKEN = "L"            # Forward, w/ two leaves
+TURN_TOKENS = "+-"
+BRANCH_TOKENS = "[]"
+COLOR_TOKEN = "#"
+SIZE_TOKEN = "@"
+
+TOKEN_COST = 80             # Approximate bytes used by one cached (token, size) tuple
+MAX_MODULE_DEPTH = 8        # Deepest parametric subtrees cached by their parameters, see walkModuleCommands
+
+def readOperand( string, i, chars ):
+    """ Read the operand of a color code or size modifier.
+
+    Args:
+        string: The string being read.
+        i: The index of the first character after the '#' or '@'.
+        chars: The characters (upper case) which may appear in the operand.
+    Returns:
+        A tuple of the operand string and the index of the first character after it.
+    """
+    start = i
+    while i < len(string) and string[i].upper() in chars:
+        i += 1
+    return ( string[start:i], i )
+
+def getSizeMultiplier( operand ):
+    """ Interpret the operand of a size modifier.
+
+    Args:
+        operand: The string following an '@', e.g. '0.5', 'Q2' (square root of 2) or 'I2' (inverse of 2)
+    Returns:
+        The float by which the unit size is multiplied.
+    """
+    if operand[0].upper() == "Q":
+        return float( operand[1:] ) ** 0.5
+    elif operand[0].upper() == "I":
+        return 1 / float( operand[1:] )
+    return float( operand )
+
+def tokenize( string ):
+    """ Split a string of symbols into tokens, the same way the expansion engine reads it.
+
+    Args:
+        string: A string of symbols, e.g. an axiom or a rule result.
+    Returns:
+        A list of tokens; color codes and size modifiers are single tokens and spaces are dropped.
+    """
+    result = []
+    i = 0
+    while i < len(string):
+        char = string[i]
+        i += 1
+        if char == COLOR_TOKEN:
+            ( operand, i ) = readOperand( string, i, "0123456789" )
+            result.append( char + operand )
+        elif char == SIZE_TOKEN:
+            ( operand, i ) = readOperand( string, i, "0123456789.QI" )
+            result.append( char + operand )
+        elif char != " ":
+            result.append( char )
+    return result
+
+def formatModule( token, params ):
+    """ Format a parametric module as text.
+
+    Args:
+        token: The token of the module
+        params: The parameter values
+    Returns:
+        A string, e.g. 'A(1,2.5)'
+    """
+    if len(params) == 0:
+        return token
+    return "{}({})".format( token, ",".join( "{:.10g}".format( p ) for p in params ) )
+
+def isModular( lsys ):
+    """ Return whether an lsys must be walked as parametric modules. """
+    return lsys.getRuleTable().isParametric() or "(" in lsys.axiom
+
+def walkModules( lsys, depth, size=1 ):
+    """ Expand a parametric lsys depth-first, the same way as 'walk'.
+
+    Args:
+        lsys: An lsys object
+        depth: Number of recursions
+        size: Unit size of turtle
+    Yields:
+        Tuples of a token, the unit size at that token, and the parameter values of that token.
+    """
+    frames = Stack()
+    table = lsys.getRuleTable()
+    modules = table.parseModules( lsys.axiom )
+    key = getRootKey( lsys.seed )
+    size_multiplier = 1
+    i = 0
+    PROFILER.setMaximum( "recursion depth", depth )
+
+    if table.isContextSensitive() and depth > 0:
+        keys = [ getChildKey( key, j ) for j in range( len(modules) ) ]
+        for _ in range( depth ):
+            ( modules, keys ) = table.rewriteModules( modules, keys )
+        depth = 0
+
+    while True:
+        if i >= len(modules):
+            if frames.isEmpty():
+                return
+            ( modules, i, depth, size, size_multiplier, key ) = frames.pop()
+            continue
+
+        ( token, params ) = modules[i]
+        i += 1
+
+        if token[0] == SIZE_TOKEN:
+            size_multiplier = getSizeMultiplier( token[1:] )
+            yield ( token, size * size_multiplier, params )
+            continue
+
+        child = getChildKey( key, i-1 )
+        successor = table.rewriteModule( token, params, key=child ) if depth > 0 else None
+        if successor is None:
+            yield ( token, size * size_multiplier, params )
+        else:
+            frames.push( ( modules, i, depth, size, size_multiplier, key ) )
+            ( modules, i, depth, size, size_multiplier, key ) = ( successor, 0, depth-1, size * size_multiplier, 1,
+                                                                  child )
+
+def walkModuleCommands( lsys, depth, size=1, cache=SUBTREE_CACHE, modules=None, key=None ):
+    """ Expand a context-free parametric lsys depth-first, the same way as 'walkModules', and yield the turtle
+    commands of the final-depth modules directly, the same as 'decodeModules' would decode them.
+
+    The keys of modules are only tracked if a rule has more than one case. Otherwise a subtree is determined by
+    its token, its parameters and its depth, so the commands of subtrees no deeper than MAX_MODULE_DEPTH are
+    cached (see util/cache.py) and replayed wherever the same module is rewritten again, e.g. every branch of a
+    tree whose parameters only depend on its depth.
+
+    Args:
+        lsys: A context-free, parametric lsys object
+        depth: Number of recursions
+        size: Unit size of turtle
+        cache: The SubtreeCache to use, or None
+        modules: The modules to expand, the lsys' axiom by default
+        key: The key of the module that 'modules' replaced, the root key of the lsys by default
+    Yields:
+        Tuples of (token, arg), see the docstring of this module.
+    Raises:
+        ValueError: If an expression can't be evaluated
+    """
+    frames = []
+    table = lsys.getRuleTable()
+    rules = table.modules
+    angle = lsys.angle
+    keyed = table.hasStochasticModules()
+    if cache is not None and ( keyed or not cache.isEnabled() ):
+        cache = None
+    if modules is None:
+        modules = table.parseModules( lsys.axiom )
+    key = getRootKey( lsys.seed ) if key is None else key
+    size_multiplier = 1
+    i = 0
+    PROFILER.setMaximum( "recursion depth", depth )
+
+    while True:
+        if i >= len(modules):
+            if len(frames) == 0:
+                return
+            ( modules, i, depth, size, size_multiplier, key ) = frames.pop()
+            continue
+
+        ( token, params ) = modules[i]
+        i += 1
+        first = token[0]
+
+        if first == SIZE_TOKEN:
+            size_multiplier = getSizeMultiplier( token[1:] )
+            continue
+
+        if depth > 0 and token in rules:
+
+            # Replay the commands of a short subtree
+            if cache is not None and depth <= MAX_MODULE_DEPTH:
+                length = size * size_multiplier
+                entry = ( table, token, params, depth, length, angle )
+                segment = cache.get( entry )
+                if segment is None:
+                    segment = tuple( walkModuleCommands( lsys, depth, length, None, ( ( token, params ), ), key ) )
+                    cache.put( entry, segment, len(segment) * TOKEN_COST )
+                yield from segment
+                continue
+
+            child = getChildKey( key, i-1 ) if keyed else key
+            successor = table.rewriteModule( token, params, key=child )
+            if successor is not None:
+                frames.append( ( modules, i, depth, size, size_multiplier, key ) )
+                ( modules, i, depth, size, size_multiplier, key ) = ( successor, 0, depth-1, size * size_multiplier,
+                                                                      1, child )
+                continue
+
+        # Module is part of the final string
+        if first in DRAW_TOKENS or first in MOVE_TOKENS or first == LEAF_TOKEN:
+            yield ( first, size * size_multiplier * params[0] if params else size * size_multiplier )
+        elif first in TURN_TOKENS:
+            yield ( first, params[0] if params else angle )
+        elif first in BRANCH_TOKENS:
+            yield ( first, None )
+        elif first == COLOR_TOKEN and len(token) > 1:
+            yield ( first, int( token[1:] ) )
+
+def walk( lsys, depth, size=1, axiom=None, cache=SUBTREE_CACHE, key=None ):
+    """ Expand an lsys depth-first, and yield every token of the final-depth string along with its unit size.
+
+    Each frame on the work stack holds a partially read string, the index of the next character to read,
+    the remaining depth, the unit size and the size multiplier of that string, and the key of the token that
+    the string replaced (only tracked for stochastic lsys objects).
+
+    Subtrees of deterministic lsys objects that are short enough are looked up in the cache (see util/cache.py)
+    instead of being expanded again. Short subtrees of batched stochastic lsys objects are rewritten in bulk,
+    but never cached.
+
+    Context-sensitive lsys objects need the neighbors of every token, so they are rewritten a whole generation
+    at a time instead, and the final generation is read as a flat string. Size modifiers then apply until the
+    next size modifier, rather than to the rest of their rule string.
+
+    Args:
+        lsys: An lsys object
+        depth: Number of recursions
+        size: Unit size of turtle
+        axiom: The string to expand, the lsys' axiom by default
+        cache: The SubtreeCache to use, or None
+        key: The key of the token that 'axiom' replaced, the root key of the lsys by default
+    Yields:
+        Tuples of a token and the unit size (with size modifiers applied) at that token.
+    """
+    frames = Stack()
+    table = lsys.getRuleTable()
+    variables = table.variables
+    results = table.results
+    string = lsys.axiom if axiom is None else axiom
+    key = getRootKey( lsys.seed ) if key is None else key
+    keyed = results is None     # Deterministic lsys objects don't need keys
+    PROFILER.setMaximum( "recursion depth", depth )
+
+    if isModular( lsys ):
+        for ( token, length, params ) in walkModules( lsys, depth, size ):
+            yield ( formatModule( token, params ), length )
+        return
+
+    if table.isContextSensitive() and depth > 0:
+        ( string, depth ) = ( "".join( table.generate( string, depth, key ) ), 0 )
+
+    if cache is not None and not ( cache.isEnabled() and table.isDeterministic() ):
+        cache = None
+    size_multiplier = 1
+    i = 0
+
+    while True:
+
+        # Finished the current string, resume the one that expanded into it
+        if i >= len(string):
+            if frames.isEmpty():
+                return
+            ( string, i, depth, size, size_multiplier, key ) = frames.pop()
+            continue
+
+        char = string[i]
+        i += 1
+
+        if char == COLOR_TOKEN:
+            ( operand, i ) = readOperand( string, i, "0123456789" )
+            yield ( char + operand, size * size_multiplier )
+
+        # Modify size multiplier by reading remaining string
+        elif char == SIZE_TOKEN:
+            ( operand, i ) = readOperand( string, i, "0123456789.QI" )
+            size_multiplier = getSizeMultiplier( operand )
+            yield ( char + operand, size * size_multiplier )
+
+        elif char == " ":
+            pass
+
+        # Character is part of the final string
+        elif depth <= 0 or char not in variables:
+            yield ( char, size * size_multiplier )
+
+        # Otherwise continue with a rule string, and come back to this one once it is done
+        else:
+            frames.push( ( string, i, depth, size, size_multiplier, key ) )
+            child = getChildKey( key, i-1 ) if keyed else key
+
+            # Short enough to rewrite in bulk; the result is read as a final-depth string
+            if table.isBulk( char, depth ):
+                entry = ( table, char, depth )
+                s = cache.get( entry ) if cache is not None else None
+                if s is None:
+                    s = table.expand( char, depth, [ child ] )
+                    if cache is not None:
+                        cache.put( entry, s, len(s) )
+                ( string, i, depth, size, size_multiplier ) = ( s, 0, 0, size * size_multiplier, 1 )
+                continue
+
+            # Deterministic, but can't be rewritten in bulk; replay the tokens of the subtree
+            if cache is not None and table.isShort( char, depth ):
+                entry = ( table, char, depth )
+                segment = cache.get( entry )
+                if segment is None:
+                    segment = tuple( walk( lsys, depth, 1, char, None ) )
+                    cache.put( entry, segment, len(segment) * TOKEN_COST )
+                size *= size_multiplier
+                for ( token, scale ) in segment:
+                    yield ( token, scale * size )
+                ( string, i, depth, size, size_multiplier, key ) = frames.pop()
+                continue
+
+            if results is not None:
+                s = results[char]
+            else:
+                s = table.roll( char, child )
+            ( string, i, depth, size, size_multiplier, key ) = ( s, 0, depth-1, size * size_multiplier, 1, child )
+
+def iterTokens( lsys, depth ):
+    """ Lazily generate the final-depth string of an lsys.
+
+    Args:
+        lsys: An lsys object
+        depth: Number of recursions
+    Yields:
+        Every token of the final-depth string, in order.
+    """
+    for ( token, size ) in walk( lsys, depth ):
+        yield token
+
+def iterCommands( lsys, depth, size ):
+    """ Lazily generate the turtle commands of the final-depth string of an lsys.
+
+    Args:
+        lsys: An lsys object
+        depth: Number of recursions
+        size: Unit size of turtle
+    Yields:
+        Tuples of (token, arg), see the docstring of this module.
+    """
+    table = lsys.getRuleTable()
+    if isModular( lsys ) and not table.isContextSensitive():
+        return walkModuleCommands( lsys, depth, size )
+    if isModular( lsys ):
+        return decodeModules( walkModules( lsys, depth, size ), lsys.angle )
+    if not table.isContextSensitive():
+        return table.getProgram().walk( lsys.axiom, lsys.angle, depth, size, getRootKey( lsys.seed ) )
+    return decode( walk( lsys, depth, size ), lsys.angle )
+
+def decode( pairs, angle ):
+    """ Decode tokens into turtle commands.
+
+    Args:
+        pairs: An iterable of (token, unit size) tuples, as generated by 'walk'
+        angle: The angle associated with the lsys
+    Yields:
+        Tuples of (token, arg), see the docstring of this module.
+    """
+    for ( token, length ) in pairs:
+        first = token[0]
+        if first in DRAW_TOKENS or first in MOVE_TOKENS or first == LEAF_TOKEN:
+            yield ( first, length )
+        elif first in TURN_TOKENS:
+            yield ( first, angle )
+        elif first in BRANCH_TOKENS:
+            yield ( first, None )
+        elif first == COLOR_TOKEN:
+            try:
+                yield ( first, int( token[1:] ) )
+            except ValueError:
+                pass
+
+def decodeModules( triples, angle ):
+    """ Decode parametric modules into turtle commands.
+
+    Args:
+        triples: An iterable of (token, unit size, params) tuples, as generated by 'walkModules'
+        angle: The angle associated with the lsys, used by turns without parameters
+    Yields:
+        Tuples of (token, arg), see the docstring of this module.
+    """
+    for ( token, length, params ) in triples:
+        first = token[0]
+        if first in DRAW_TOKENS or first in MOVE_TOKENS or first == LEAF_TOKEN:
+            yield ( first, length * params[0] if params else length )
+        elif first in TURN_TOKENS:
+            yield ( first, params[0] if params else angle )
+        elif first in BRANCH_TOKENS:
+            yield ( first, None )
+        elif first == COLOR_TOKEN:
+            try:
+                yield ( first, int( token[1:] ) )
+            except ValueError:
+                pass
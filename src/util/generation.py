@@ -0,0 +1,200 @@
+"""
+Generations
+Materialized generations of an lsys, each rewritten from the one before, rather than expanded from the axiom.
+
+Going through the generations 0, 1, ..., n one by one (e.g. 'runthru') costs as much as the last one alone, instead
+of the sum of all of them. Only lsys objects whose generations can be rewritten in bulk (see util/ruletable.py) are
+supported: deterministic ones w/ a fast path, and batched stochastic ones, whose generations also carry the key of
+every variable (see util/stream.py), so that they rewrite into exactly what util/expand.py would expand.
+
+A generation is kept in a spooled temporary file: in memory while it is short, and spilled to disk once it holds
+more than MAX_MEMORY_LENGTH characters. It is then read, rewritten and interpreted in chunks of CHUNK_LENGTH
+characters, so memory use stays bounded however long the generations get.
+"""
+
+import re
+import tempfile
+from array import array
+
+from util.geometry import Geometry, interpretString
+from util.access import TurtleState
+from util.expand import isModular
+from util.profiler import PROFILER, profiled, countSegments
+
+MAX_MEMORY_LENGTH = 1 << 24     # Most characters (or keys) of a generation kept in memory
+CHUNK_LENGTH = 1 << 20          # Characters read at a time
+KEY_BYTES = 8
+TRAILING_OPERAND = re.compile( r"[#@][0-9.QqIi]*$" )    # A color code or size modifier that may continue
+
+def isIncremental( lsys ):
+    """ Return whether the generations of an lsys can be rewritten from one another. """
+    table = lsys.getRuleTable()
+    return ( table.hasFastPath() or table.isBatched() ) and not isModular( lsys )
+
+class Generation( object ):
+
+    def __init__( self, lsys, depth ):
+        """ Constructor. Creates an empty generation, to be written.
+
+        Args:
+            lsys: An lsys object, see isIncremental
+            depth: The number of generations rewritten from the axiom
+        """
+        self.lsys = lsys
+        self.table = lsys.getRuleTable()
+        self.depth = depth
+        self.length = 0
+        self.text = tempfile.SpooledTemporaryFile( MAX_MEMORY_LENGTH, "w+", encoding="utf-8" )
+        self.keys = None if self.table.isDeterministic() else \
+            tempfile.SpooledTemporaryFile( MAX_MEMORY_LENGTH * KEY_BYTES, "w+b" )
+
+    def __repr__( self ):
+        """ String representation.
+
+        Returns:
+            A console-friendly string representation.
+        """
+        return "Generation {} of {}, {:,} characters{}".format( self.depth, self.lsys.name, self.length,
+                                                                 " (spilled to disk)" if self.isSpilled() else "" )
+
+    def __len__( self ):
+        """ Return the number of characters of the generation. """
+        return self.length
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, *args ):
+        self.close()
+
+    def isSpilled( self ):
+        """ Return whether the generation was too long to be kept in memory. """
+        return self.length > MAX_MEMORY_LENGTH
+
+    def write( self, string, keys=() ):
+        """ Append a string to the generation.
+
+        Args:
+            string: The next characters of the generation
+            keys: The keys of the variables of 'string', in order (only for stochastic lsys objects)
+        """
+        self.text.write( string )
+        self.length += len(string)
+        if self.keys is not None:
+            self.keys.write( array( "Q", keys ).tobytes() )
+
+    def iterChunks( self ):
+        """ Read the generation a chunk at a time. A chunk never ends in the middle of a color code or size modifier.
+
+        Yields:
+            Tuples of a string, and the list of the keys of its variables (empty for deterministic lsys objects).
+        """
+        self.text.seek( 0 )
+        if self.keys is not None:
+            self.keys.seek( 0 )
+        variables = self.table.variables
+        pending = ""
+        while True:
+            chunk = self.text.read( CHUNK_LENGTH )
+            if len(chunk) == 0:
+                break
+            chunk = pending + chunk
+            match = TRAILING_OPERAND.search( chunk )
+            ( chunk, pending ) = ( chunk[:match.start()], chunk[match.start():] ) if match else ( chunk, "" )
+            yield ( chunk, self.readKeys( sum( chunk.count( var ) for var in variables ) ) )
+        if len(pending) > 0:
+            yield ( pending, self.readKeys( sum( pending.count( var ) for var in variables ) ) )
+
+    def readKeys( self, count ):
+        """ Read the keys of the next 'count' variables. """
+        if self.keys is None:
+            return []
+        keys = array( "Q" )
+        keys.frombytes( self.keys.read( count * KEY_BYTES ) )
+        return keys.tolist()
+
+    def getString( self ):
+        """ Return the whole generation as a single string. Its length grows exponentially w/ the depth. """
+        self.text.seek( 0 )
+        return self.text.read().replace( " ", "" )
+
+    @profiled( "expand" )
+    def next( self ):
+        """ Rewrite this generation into the next one, a chunk at a time.
+
+        Returns:
+            A new Generation, one deeper
+        """
+        result = Generation( self.lsys, self.depth + 1 )
+        for ( chunk, keys ) in self.iterChunks():
+            if self.table.hasFastPath():
+                result.write( self.table.rewrite( chunk ) )
+            else:
+                result.write( *self.table.rewriteBatch( chunk, keys ) )
+        PROFILER.count( "tokens", len(result) )
+        return result
+
+    @profiled( "interpret", countSegments )
+    def interpret( self, size=1, state=None, geometry=None ):
+        """ Interpret the generation w/ a headless turtle, a chunk at a time (see util/geometry.py).
+
+        Args:
+            size: Unit size of turtle
+            state: The TurtleState to start from (and update), the origin by default
+            geometry: The Geometry to add segments to, a new one by default
+        Returns:
+            The Geometry
+        """
+        if state is None:
+            state = TurtleState()
+        if geometry is None:
+            geometry = Geometry()
+        for ( chunk, keys ) in self.iterChunks():
+            interpretString( chunk, self.lsys.angle, size, state, geometry )
+        return geometry
+
+    def close( self ):
+        """ Release the generation, deleting its temporary files. """
+        self.text.close()
+        if self.keys is not None:
+            self.keys.close()
+
+def getAxiom( lsys ):
+    """ Return generation 0 of an lsys, its axiom.
+
+    Raises:
+        ValueError: If the generations of the lsys can't be rewritten from one another, see isIncremental
+    """
+    if not isIncremental( lsys ):
+        raise ValueError( "The generations of '{}' can't be rewritten one at a time.".format( lsys.name ) )
+    generation = Generation( lsys, 0 )
+    if generation.keys is None:
+        generation.write( lsys.axiom )
+    else:
+        generation.write( lsys.axiom, lsys.getRuleTable().getChildKeys( lsys.axiom, lsys.getKey() ) )
+    return generation
+
+def iterGenerations( lsys, first=0, last=None ):
+    """ Generate the generations of an lsys, each rewritten from the one before.
+    Every generation is closed once the next one is generated, so it must not be kept.
+
+    Args:
+        lsys: An lsys object, see isIncremental
+        first: The depth of the first generation generated
+        last: The depth of the last generation generated, or None to go on forever
+    Yields:
+        Generation objects
+    Raises:
+        ValueError: If the generations of the lsys can't be rewritten from one another
+    """
+    generation = getAxiom( lsys )
+    try:
+        while True:
+            if generation.depth >= first:
+                yield generation
+            if last is not None and generation.depth >= last:
+                return
+            ( previous, generation ) = ( generation, generation.next() )
+            previous.close()
+    finally:
+        generation.close()
@@ -0,0 +1,406 @@
+"""
+Headless turtle
+Interprets turtle commands into line segments, without drawing anything.
+
+Segments are kept in flat arrays of doubles, rather than one object per segment, so that large drawings stay
+compact and can be cheaply sent between processes.
+The interpreter follows the same conventions as python's turtle: the turtle starts at the origin facing east (a
+heading of 0), '+' turns it counterclockwise and '-' clockwise, and the pen color is not restored by ']'.
+
+If NumPy is installed, blocks of commands can be interpreted w/ array operations instead of one command at a time
+('interpretVectorized'). Every command becomes a change of heading and a displacement; headings and positions are
+their cumulative sums. A ']' must undo every change since its '[', so it is given the opposite of their sum, one
+nesting level at a time from the innermost, each level taking one cumulative sum. Open brackets carried over from
+the previous block are replayed as jumps to their saved states, followed by a '['.
+Final-depth strings are converted to arrays w/o going through commands at all ('interpretString'), which is what
+makes the lsys objects w/ a fast path (see util/ruletable.py) fast to interpret ('interpretLsys').
+"""
+
+import re
+from array import array
+from itertools import islice
+from math import cos, sin, radians
+
+try:
+    import numpy
+except ImportError:
+    numpy = None            # Optional, only used by interpretVectorized
+
+from util.access import TurtleState
+from util.expand import iterCommands, getSizeMultiplier, DRAW_TOKENS, MOVE_TOKENS, LEAF_TOKEN, COLOR_TOKEN
+from util.growth import predict
+from util.profiler import PROFILER, profiled, countSegments
+from util.budget import BUDGET
+
+LEAF_ANGLE = 45             # Angle between a leaf and its stem
+LEAF_FRACTION = 0.25        # Length of a leaf, relative to its stem
+NO_COLOR = -1               # Color id of segments drawn before any color code
+BLOCK_LENGTH = 1 << 18      # Number of commands interpreted at once w/ NumPy
+MIN_BLOCK_LENGTH = 1 << 10  # Shorter blocks are interpreted one command at a time, which is faster
+MAX_STRING_LENGTH = 1 << 25 # Longest final-depth string built by interpretLsys; longer ones are streamed
+OPERANDS = re.compile( r"#([0-9]*)|@([0-9.QqIi]*)" )   # Color codes and size modifiers of a final-depth string
+
+# Kinds of commands, for interpretVectorized
+( OTHER, DRAW, MOVE, LEAF, LEFT, RIGHT, PUSH, POP, COLOR, JUMP ) = range( 10 )
+KINDS = dict( [ ( token, DRAW ) for token in DRAW_TOKENS ] + [ ( token, MOVE ) for token in MOVE_TOKENS ] +
+              [ ( LEAF_TOKEN, LEAF ), ( "+", LEFT ), ( "-", RIGHT ), ( "[", PUSH ), ( "]", POP ), ( COLOR_TOKEN, COLOR ) ] )
+KIND_TOKENS = "?FfL+-[]#"   # A token of each kind, to interpret arrays one command at a time
+
+class Geometry( object ):
+
+    def __init__( self ):
+        """ Constructor. Creates an empty collection of segments. """
+        self.x0 = array( "d" )
+        self.y0 = array( "d" )
+        self.x1 = array( "d" )
+        self.y1 = array( "d" )
+        self.colors = array( "l" )
+
+    def __len__( self ):
+        """ Return the number of segments. """
+        return len(self.x0)
+
+    def __eq__( self, other ):
+        """ Check whether two collections hold the same segments, in the same order. """
+        return isinstance( other, Geometry ) and self.x0 == other.x0 and self.y0 == other.y0 and \
+            self.x1 == other.x1 and self.y1 == other.y1 and self.colors == other.colors
+
+    def add( self, x0, y0, x1, y1, color ):
+        """ Add a line segment.
+
+        Args:
+            x0, y0: The start of the segment
+            x1, y1: The end of the segment
+            color: The color id of the segment, or NO_COLOR
+        """
+        self.x0.append( x0 )
+        self.y0.append( y0 )
+        self.x1.append( x1 )
+        self.y1.append( y1 )
+        self.colors.append( color )
+
+    def extend( self, other ):
+        """ Append every segment of another Geometry object. """
+        self.x0.extend( other.x0 )
+        self.y0.extend( other.y0 )
+        self.x1.extend( other.x1 )
+        self.y1.extend( other.y1 )
+        self.colors.extend( other.colors )
+
+    def extendTransformed( self, other, state ):
+        """ Append every segment of another Geometry object, drawn relative to the origin w/ a heading of 0, as if it
+        was drawn from a given turtle state instead.
+
+        Args:
+            other: The Geometry to append
+            state: The TurtleState to place its origin at; its color replaces NO_COLOR
+        """
+        h = radians( state.heading )
+        ( c, s ) = ( cos(h), sin(h) )
+        ( x, y ) = ( state.x, state.y )
+        color = NO_COLOR if state.color is None else state.color
+        if numpy is not None:
+            ( x0, y0, x1, y1 ) = ( numpy.frombuffer( a, dtype=numpy.float64 ) for a in
+                                   ( other.x0, other.y0, other.x1, other.y1 ) )
+            colors = numpy.frombuffer( other.colors, dtype="i{}".format( other.colors.itemsize ) )
+            self.x0.frombytes( ( x + x0 * c - y0 * s ).tobytes() )
+            self.y0.frombytes( ( y + x0 * s + y0 * c ).tobytes() )
+            self.x1.frombytes( ( x + x1 * c - y1 * s ).tobytes() )
+            self.y1.frombytes( ( y + x1 * s + y1 * c ).tobytes() )
+            self.colors.frombytes( numpy.where( colors == NO_COLOR, color, colors ).astype( colors.dtype ).tobytes() )
+            return
+        for ( x0, y0, x1, y1, col ) in other.iterSegments():
+            self.add( x + x0 * c - y0 * s, y + x0 * s + y0 * c, x + x1 * c - y1 * s, y + x1 * s + y1 * c,
+                      color if col == NO_COLOR else col )
+
+    def iterSegments( self ):
+        """ Generate every segment, as (x0, y0, x1, y1, color) tuples. """
+        return zip( self.x0, self.y0, self.x1, self.y1, self.colors )
+
+def interpret( commands, state=None, geometry=None ):
+    """ Move a headless turtle through a sequence of commands, and record the segments it draws.
+
+    Args:
+        commands: An iterable of (token, arg) commands, see util/expand.py
+        state: The TurtleState to start from (and update), the origin by default
+        geometry: The Geometry to add segments to, a new one by default
+    Returns:
+        The Geometry
+    """
+    if state is None:
+        state = TurtleState()
+    if geometry is None:
+        geometry = Geometry()
+
+    x = state.x
+    y = state.y
+    heading = state.heading
+    color = NO_COLOR if state.color is None else state.color
+    stack = state.stack
+    add = geometry.add
+
+    for ( token, arg ) in commands:
+        if token in DRAW_TOKENS:
+            h = radians( heading )
+            ( nx, ny ) = ( x + arg * cos(h), y + arg * sin(h) )
+            add( x, y, nx, ny, color )
+            ( x, y ) = ( nx, ny )
+        elif token in MOVE_TOKENS:
+            h = radians( heading )
+            ( x, y ) = ( x + arg * cos(h), y + arg * sin(h) )
+        elif token == "+":
+            heading += arg
+        elif token == "-":
+            heading -= arg
+        elif token == "[":
+            stack.append( ( x, y, heading ) )
+        elif token == "]":
+            if len(stack) > 0:
+                ( x, y, heading ) = stack.pop()
+        elif token == LEAF_TOKEN:
+            h = radians( heading )
+            ( nx, ny ) = ( x + arg * cos(h), y + arg * sin(h) )
+            add( x, y, nx, ny, color )
+            ( x, y ) = ( nx, ny )
+            leaf = arg * LEAF_FRACTION
+            for turn in ( LEAF_ANGLE, -LEAF_ANGLE ):
+                h = radians( heading + turn )
+                add( x, y, x + leaf * cos(h), y + leaf * sin(h), color )
+        elif token == COLOR_TOKEN:
+            color = arg
+
+    state.x = x
+    state.y = y
+    state.heading = heading
+    state.color = None if color == NO_COLOR else color
+    return geometry
+
+@profiled( "interpret", countSegments )
+def interpretLsys( lsys, depth, size=1, state=None, geometry=None ):
+    """ Expand and interpret an lsys, the fastest way available.
+
+    Args:
+        lsys: An lsys object
+        depth: Number of iterations
+        size: Unit size of turtle
+        state: The TurtleState to start from (and update), the origin by default
+        geometry: The Geometry to add segments to, a new one by default
+    Returns:
+        The Geometry
+    """
+    table = lsys.getRuleTable()
+    if numpy is not None and table.hasFastPath() and "(" not in lsys.axiom and \
+            predict( lsys, depth )["tokens"] <= MAX_STRING_LENGTH:
+        return interpretString( lsys.expand( depth ), lsys.angle, size, state, geometry )
+    commands = BUDGET.watch( PROFILER.countCommands( iterCommands( lsys, depth, size ) ) )
+    return interpretVectorized( commands, state, geometry )
+
+def interpretVectorized( commands, state=None, geometry=None ):
+    """ Same as 'interpret', but w/ NumPy array operations, a block of commands at a time.
+    Falls back on 'interpret' if NumPy isn't installed.
+
+    Args:
+        commands: An iterable of (token, arg) commands, see util/expand.py
+        state: The TurtleState to start from (and update), the origin by default
+        geometry: The Geometry to add segments to, a new one by default
+    Returns:
+        The Geometry
+    """
+    if state is None:
+        state = TurtleState()
+    if geometry is None:
+        geometry = Geometry()
+    if numpy is None:
+        return interpret( commands, state, geometry )
+
+    commands = iter( commands )
+    while True:
+        block = list( islice( commands, BLOCK_LENGTH ) )
+        if len(block) < MIN_BLOCK_LENGTH:
+            interpret( block, state, geometry )
+        else:
+            kind = numpy.fromiter( ( KINDS.get( token, OTHER ) for ( token, arg ) in block ), numpy.int8, len(block) )
+            arg = numpy.fromiter( ( 0.0 if arg is None else arg for ( token, arg ) in block ), numpy.float64, len(block) )
+            interpretArrays( kind, arg, state, geometry )
+        if len(block) < BLOCK_LENGTH:
+            return geometry
+
+def interpretString( string, angle, size=1, state=None, geometry=None ):
+    """ Interpret a final-depth string w/ NumPy array operations, a block of characters at a time.
+    Falls back on 'interpret' if NumPy isn't installed.
+
+    Args:
+        string: A final-depth string, w/o parametric symbols
+        angle: The angle of the lsys
+        size: Unit size of turtle
+        state: The TurtleState to start from (and update), the origin by default
+        geometry: The Geometry to add segments to, a new one by default
+    Returns:
+        The Geometry
+    """
+    if state is None:
+        state = TurtleState()
+    if geometry is None:
+        geometry = Geometry()
+    if numpy is None:
+        return interpret( decodeString( string, angle, size ), state, geometry )
+
+    lookup = numpy.zeros( 256, numpy.int8 )
+    for ( token, kind ) in KINDS.items():
+        lookup[ord(token)] = kind
+
+    multiplier = 1
+    start = 0
+    while start < len(string):
+        # Don't split an operand from its color code or size modifier
+        stop = min( start + BLOCK_LENGTH, len(string) )
+        for match in OPERANDS.finditer( string, max( start, stop - 32 ), stop ):
+            if match.end() >= stop:
+                stop = OPERANDS.match( string, match.start() ).end()
+        block = string[start:stop]
+
+        chars = numpy.frombuffer( block.encode( "latin-1", "replace" ), numpy.uint8 )
+        kind = lookup[chars]
+        arg = numpy.zeros( len(block) )
+        scale = numpy.full( len(block), numpy.nan )
+        scale[0] = multiplier
+        for match in OPERANDS.finditer( block ):
+            kind[ match.start() + 1 : match.end() ] = OTHER
+            if match.group(1) is not None:
+                if match.group(1) == "":
+                    kind[match.start()] = OTHER
+                else:
+                    arg[match.start()] = int( match.group(1) )
+            else:
+                multiplier = getSizeMultiplier( match.group(2) )
+                scale[match.start()] = multiplier
+
+        # Forward fill the size multipliers
+        last = numpy.maximum.accumulate( numpy.where( numpy.isnan( scale ), 0, numpy.arange( len(block) ) ) )
+        scale = scale[last]
+        forward = ( kind == DRAW ) | ( kind == MOVE ) | ( kind == LEAF )
+        arg[forward] = size * scale[forward]
+        arg[ ( kind == LEFT ) | ( kind == RIGHT ) ] = angle
+
+        interpretArrays( kind, arg, state, geometry )
+        start = stop
+    return geometry
+
+def decodeString( string, angle, size ):
+    """ Decode a final-depth string into turtle commands, w/o NumPy. """
+    multiplier = 1
+    i = 0
+    for match in OPERANDS.finditer( string ):
+        for char in string[i:match.start()]:
+            if char in KINDS:
+                yield ( char, angle if char in "+-" else None if char in "[]" else size * multiplier )
+        if match.group(1) is not None and match.group(1) != "":
+            yield ( COLOR_TOKEN, int( match.group(1) ) )
+        elif match.group(2) is not None:
+            multiplier = getSizeMultiplier( match.group(2) )
+        i = match.end()
+    for char in string[i:]:
+        if char in KINDS:
+            yield ( char, angle if char in "+-" else None if char in "[]" else size * multiplier )
+
+def interpretArrays( kind, arg, state, geometry ):
+    """ Interpret commands given as arrays w/ array operations, see the docstring of this module.
+
+    Args:
+        kind: An array of the kind of every command
+        arg: An array of the argument of every command, see util/expand.py
+        state: The TurtleState to start from, updated to the state after the commands
+        geometry: The Geometry to add segments to
+    """
+    # Replay the open brackets of the state as jumps, then jump to the state itself
+    jumps = []
+    ( x, y, heading ) = ( 0.0, 0.0, 0.0 )
+    for ( sx, sy, sheading ) in state.stack + [ ( state.x, state.y, state.heading ) ]:
+        jumps.append( ( sheading - heading, complex( sx - x, sy - y ) ) )
+        ( x, y, heading ) = ( sx, sy, sheading )
+    prefix = 2 * len(jumps) - 1
+    kind = numpy.concatenate( ( numpy.array( [ JUMP, PUSH ] * len(jumps), numpy.int8 )[:prefix], kind ) )
+    arg = numpy.concatenate( ( numpy.zeros( prefix ), arg ) )
+    n = len(kind)
+
+    # Match the brackets; a ']' without a '[' is ignored, which is left to 'interpret'. The arguments are decoded back
+    # to what the expansion engine yields: None for brackets and an int for color codes
+    after = numpy.cumsum( ( kind == PUSH ).astype( numpy.int64 ) - ( kind == POP ) )
+    if after.min() < 0:
+        commands = zip( ( KIND_TOKENS[k] for k in kind[prefix:].tolist() ), arg[prefix:].tolist() )
+        interpret( ( ( token, None if token in "[]" else int( value ) if token == COLOR_TOKEN else value )
+                     for ( token, value ) in commands ), state, geometry )
+        return
+    pushes = numpy.flatnonzero( kind == PUSH )
+    pops = numpy.flatnonzero( kind == POP )
+    push_levels = after[pushes]
+    pop_levels = after[pops] + 1
+    order = numpy.lexsort( ( pushes, push_levels ) )
+    ( sorted_pushes, push_levels ) = ( pushes[order], push_levels[order] )
+    order = numpy.lexsort( ( pops, pop_levels ) )
+    ( pops, pop_levels ) = ( pops[order], pop_levels[order] )
+    ranks = numpy.arange( len(pops) ) - numpy.searchsorted( pop_levels, pop_levels )
+    matches = sorted_pushes[ numpy.searchsorted( push_levels, pop_levels ) + ranks ]
+    bounds = numpy.searchsorted( pop_levels, numpy.arange( int( after.max( initial=0 ) ) + 2 ) )
+    levels = [ ( pops[bounds[level]:bounds[level+1]], matches[bounds[level]:bounds[level+1]] )
+               for level in range( len(bounds) - 2, 0, -1 ) ]
+
+    def accumulate( delta ):
+        """ Cumulative sum of changes, where every ']' undoes the changes since its '['. """
+        for ( closing, opening ) in levels:
+            if len(closing) > 0:
+                total = numpy.cumsum( delta )
+                delta[closing] = total[opening] - total[closing - 1]
+        return numpy.cumsum( delta )
+
+    # Headings, in degrees, after each command
+    turn = numpy.where( kind == LEFT, arg, 0.0 ) - numpy.where( kind == RIGHT, arg, 0.0 )
+    step = numpy.zeros( n, complex )
+    turn[0:prefix:2] = [ h for ( h, z ) in jumps ]
+    step[0:prefix:2] = [ z for ( h, z ) in jumps ]
+    headings = accumulate( turn )
+
+    # Positions after each command, as complex numbers
+    forward = ( kind == DRAW ) | ( kind == MOVE ) | ( kind == LEAF )
+    step[forward] = arg[forward] * numpy.exp( 1j * numpy.radians( headings[forward] ) )
+    positions = accumulate( step )
+
+    # Pen color after each command
+    last = numpy.maximum.accumulate( numpy.where( kind == COLOR, numpy.arange( n ), -1 ) )
+    initial = NO_COLOR if state.color is None else state.color
+    colors = numpy.where( last >= 0, arg[numpy.maximum( last, 0 )], initial ).astype( numpy.int64 )
+
+    # Segments, in the order they are drawn: a stem for every draw & leaf, and two leaves after every leaf stem
+    drawn = numpy.flatnonzero( ( kind == DRAW ) | ( kind == LEAF ) )
+    leaves = kind[drawn] == LEAF
+    counts = numpy.where( leaves, 3, 1 )
+    offsets = numpy.cumsum( counts ) - counts
+    total = int( counts.sum() )
+    start = numpy.empty( total, complex )
+    end = numpy.empty( total, complex )
+    color = numpy.empty( total, numpy.int64 )
+    start[offsets] = positions[drawn] - step[drawn]
+    end[offsets] = positions[drawn]
+    color[offsets] = colors[drawn]
+
+    stems = drawn[leaves]
+    length = arg[stems] * LEAF_FRACTION
+    for ( i, angle ) in ( ( 1, LEAF_ANGLE ), ( 2, -LEAF_ANGLE ) ):
+        start[offsets[leaves] + i] = positions[stems]
+        end[offsets[leaves] + i] = positions[stems] + length * numpy.exp( 1j * numpy.radians( headings[stems] + angle ) )
+        color[offsets[leaves] + i] = colors[stems]
+
+    geometry.x0.frombytes( numpy.ascontiguousarray( start.real ).tobytes() )
+    geometry.y0.frombytes( numpy.ascontiguousarray( start.imag ).tobytes() )
+    geometry.x1.frombytes( numpy.ascontiguousarray( end.real ).tobytes() )
+    geometry.y1.frombytes( numpy.ascontiguousarray( end.imag ).tobytes() )
+    geometry.colors.frombytes( color.astype( "i{}".format( geometry.colors.itemsize ) ).tobytes() )
+
+    # State after the commands, w/ the brackets that are still open
+    closed = numpy.zeros( n, bool )
+    closed[matches] = True
+    state.stack = [ ( positions[i].real, positions[i].imag, headings[i] ) for i in pushes if not closed[i] ]
+    state.x = positions[-1].real
+    state.y = positions[-1].imag
+    state.heading = headings[-1]
+    state.color = None if colors[-1] == NO_COLOR else int( colors[-1] )
@@ -0,0 +1,146 @@
+"""
+Growth prediction
+Predict the size of an expansion without expanding anything.
+
+Every rule of a context-free lsys can be summarized by how many of each symbol it produces. Arranged as a matrix,
+where column 'v' counts the symbols produced by the variable 'v' (and constants produce only themselves), the
+symbol counts after n iterations are M^n multiplied by the symbol counts of the axiom.
+M^n is computed with O(log n) matrix products, so even very deep expansions can be predicted instantly.
+
+Deterministic rules give exact (integer) counts. Stochastic rules are weighted by the probability of each case,
+which gives the expected counts. Context-sensitive and parametric rules can't be summarized this way, since what
+they produce depends on the neighbors or the parameters of each token.
+"""
+
+from util.expand import tokenize, DRAW_TOKENS, LEAF_TOKEN
+
+LEAF_SEGMENTS = 3           # A leaf draws a forward line and two short lines
+
+def getProductionMatrix( lsys ):
+    """ Build the production matrix of an lsys.
+
+    Args:
+        lsys: An lsys object
+    Returns:
+        A tuple of the list of symbols and the matrix, as a list of rows, where matrix[i][j] is the number of
+        symbols[i] produced by one symbols[j] in a single iteration.
+    """
+    variables = lsys.getRuleTable().variables
+
+    # Every case of every rule, as lists of (probability, tokens)
+    cases = dict()
+    for var in variables:
+        mask = lsys.ruleset[var].mask.mask
+        if len(mask) == 1:
+            cases[var] = [ ( 1, tokenize( mask[0].elem ) ) ]
+        else:
+            cases[var] = [ ( item.prob, tokenize( item.elem ) ) for item in mask ]
+
+    symbols = []
+    for token in tokenize( lsys.axiom ) + sorted( variables ):
+        if token not in symbols:
+            symbols.append( token )
+    for var in sorted( variables ):
+        for ( prob, tokens ) in cases[var]:
+            for token in tokens:
+                if token not in symbols:
+                    symbols.append( token )
+
+    index = { symbol: i for ( i, symbol ) in enumerate( symbols ) }
+    matrix = [ [ 0 ] * len(symbols) for _ in symbols ]
+
+    for ( j, symbol ) in enumerate( symbols ):
+        if symbol not in variables:
+            matrix[j][j] = 1
+            continue
+        for ( prob, tokens ) in cases[symbol]:
+            for token in tokens:
+                matrix[ index[token] ][j] += prob
+
+    return ( symbols, matrix )
+
+def multiply( a, b ):
+    """ Multiply two square matrices.
+
+    Args:
+        a: A matrix, as a list of rows
+        b: A matrix of the same size
+    Returns:
+        The matrix product a * b
+    """
+    n = len(a)
+    columns = list( zip( *b ) )
+    return [ [ sum( x * y for ( x, y ) in zip( a[i], columns[j] ) ) for j in range(n) ] for i in range(n) ]
+
+def power( matrix, n ):
+    """ Raise a square matrix to a non-negative integer power, by repeated squaring.
+
+    Args:
+        matrix: A matrix, as a list of rows
+        n: The exponent
+    Returns:
+        matrix ^ n
+    """
+    size = len(matrix)
+    result = [ [ int( i == j ) for j in range(size) ] for i in range(size) ]
+    while n > 0:
+        if n & 1:
+            result = multiply( result, matrix )
+        matrix = multiply( matrix, matrix )
+        n >>= 1
+    return result
+
+def predictHistogram( lsys, depth ):
+    """ Predict how many of each symbol an lsys will have after a given number of iterations.
+
+    Args:
+        lsys: An lsys object
+        depth: Number of iterations
+    Returns:
+        A map of symbols to their (expected) counts, omitting symbols which do not occur.
+    """
+    ( symbols, matrix ) = getProductionMatrix( lsys )
+    initial = [ 0 ] * len(symbols)
+    for token in tokenize( lsys.axiom ):
+        initial[ symbols.index( token ) ] += 1
+
+    grown = power( matrix, depth )
+    counts = [ sum( x * y for ( x, y ) in zip( row, initial ) ) for row in grown ]
+    return { symbol: count for ( symbol, count ) in zip( symbols, counts ) if count != 0 }
+
+def countSegments( histogram ):
+    """ Count the line segments drawn by a string, given its symbol counts.
+
+    Args:
+        histogram: A map of symbols to their counts
+    Returns:
+        The number of line segments the turtle will draw.
+    """
+    result = 0
+    for ( symbol, count ) in histogram.items():
+        if symbol in DRAW_TOKENS:
+            result += count
+        elif symbol == LEAF_TOKEN:
+            result += count * LEAF_SEGMENTS
+    return result
+
+def predict( lsys, depth ):
+    """ Predict the size of an expansion.
+
+    Args:
+        lsys: An lsys object
+        depth: Number of iterations
+    Returns:
+        A map with the (expected) number of 'tokens', the number of 'segments' drawn, and the 'histogram' of symbols.
+    Raises:
+        ValueError: If the lsys is parametric or context-sensitive, since its productions depend on the values of
+            its parameters or on the neighbors of its tokens
+    """
+    table = lsys.getRuleTable()
+    if table.isParametric():
+        raise ValueError( "The size of a parametric lsys can't be predicted, its rules depend on its parameters." )
+    if table.isContextSensitive():
+        raise ValueError( "The size of a context-sensitive lsys can't be predicted, its rules depend on the "
+                          "neighbors of its tokens." )
+    histogram = predictHistogram( lsys, depth )
+    return { "tokens": sum( histogram.values() ), "segments": countSegments( histogram ), "histogram": histogram }
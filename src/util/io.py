@@ -9,7 +9,8 @@ The XML Tree for an l-system (lsys) object are virtually identical to the way th
 with the slight exception of how the rule elements accomodate a probabalistic grammar.
 
 Each lsys has attributes <name>, <angle>, and <axiom> tags which directly correspond to the name, angle and axiom
-that will be fed into the internal representation of the lsys.
+that will be fed into the internal representation of the lsys. An optional <seed> attribute seeds the random choices
+of stochastic rules.
 
 Notes:
     axiom attributes are assumed to contain only recognized symbols.
@@ -68,81 +69,126 @@ Note: The string in the 'context' element should be another token or a
     and right contexts.
 
 Note: Probabilities for probabalistic rules should be floats that add up to 1, but are not checked
+
+Parametric l-systems declare the formal parameters of a rule in its variable, and may add a condition
+(cond) on them to a 'case' or 'context' element; see classes/symbol.py for the syntax of expressions.
+The first case whose context and condition hold is used:
+
+    <lsys name="Parametric" angle="60" axiom="A(1)" >
+        <rule var="A(x)">
+            <case cond="x &lt; 3" result="F(x)[+A(x*0.7)][-A(x*0.7)]" />
+        </rule>
+    </lsys>
 """
 
 from classes.lsys import *              # For creating lsys objects
 from classes.rule import *              # For creating Rule Objects
 from classes.context import *
 from util.probmask import *
+from classes.symbol import parseSignature
+from util.profiler import profiled
 
 import xml.etree.ElementTree as ET      # For parsing XML files
 import fractions                        # For interpreting fractions parsed from data
 
+@profiled( "parse" )
 def getLsysFromFile( filename ):
-    """ Open a file designated by 'filename' and return a colleciton lsys objects parsed from it. """
+    """ Open a file designated by 'filename' and return a colleciton lsys objects parsed from it.
+    Every lsys is built up front; see util/library.py to build them only once they are used.
+    """
 
     root = ET.parse( filename ).getroot()
 
-    result = []
-
     # Iterate thru all lsys objects in root
-    for child in root:
-
-        l = getEmptyLsys()
-        ruleset = dict()
-
-
-        # Iterate thru all lsys attributes
-        for attr in child.attrib.keys():
-            if attr == "name":
-                l.name = child.attrib[attr]
-            elif attr == "angle":
-                l.angle = float( fractions.Fraction( child.attrib[attr] ) )
-            elif attr == "axiom":
-                l.axiom = child.attrib[attr]
-
-        # Iterate thru all rules
-        for rule in child:
+    return [ getLsysFromElement( child ) for child in root ]
 
-            ruleObject = Rule(rule.attrib["var"])
+def getLsysFromElement( child ):
+    """ Build an lsys object from its element.
 
-            # Field will be either 'case' or 'context'
-            # 'case' will be assumed to be context-free
-            # 'context' will
-            for field in rule:
-
-                if field.tag == "case":
-
-                    # Assume Probability is '1' unless otherwise specified
-                    try:
-                        ruleObject.mask.add( field.attrib["result"].replace(" ", ""), float( fractions.Fraction( field.attrib["prob"] ) ) ) 
-                    except KeyError:
-                        ruleObject.mask.add( field.attrib["result"].replace(" ", ""), 1.0 ) 
-
-
-                    # Assume context is not sensitive unless otherwise specified
-                    try:
-                        l.rightcontext = field.attrib["right"]
-                    except KeyError:
-                        l.rightcontext = "/*"
-                    try:
-                        l.leftcontext = field.attrib["left"]
-                    except KeyError:
-                        l.leftcontext = "/*"
-
-
-                # TODO: Handle context-sensitive grammars
-                """
-                if field.tag == "context":
-                    (context, case) = getContextAndCases( field )
-                    ruleObject.productions[context] = case
-                """
+    Args:
+        child: An 'lsys' element, see the docstring of this module
+    Returns:
+        The compiled lsys object
+    """
+    l = getEmptyLsys()
+    ruleset = dict()
+
+
+    # Iterate thru all lsys attributes
+    for attr in child.attrib.keys():
+        if attr == "name":
+            l.name = child.attrib[attr]
+        elif attr == "angle":
+            l.angle = float( fractions.Fraction( child.attrib[attr] ) )
+        elif attr == "axiom":
+            l.axiom = child.attrib[attr]
+        elif attr == "seed":
+            l.seed = int( child.attrib[attr] )
+
+    # Iterate thru all rules
+    for rule in child:
+
+        signature = parseSignature( rule.attrib["var"] )
+        ruleObject = Rule( signature.token, signature.params )
+
+        # Field will be either 'case' or 'context'
+        # 'case' will be assumed to be context-free, unless it has 'left' or 'right' attributes
+        # 'context' encapsulates the cases used when the neighbors of the variable match
+        for field in rule:
+
+            if field.tag == "case":
+                context = getContext( field )
+                mask = ruleObject.productions.get( context, ProbabilityMask() )
+                addCase( mask, field )
+                ruleObject.addProduction( context, mask )
+
+            elif field.tag == "context":
+                ( context, mask ) = getContextAndCases( field )
+                ruleObject.addProduction( context, mask )
+
+        ruleset[ruleObject.token] = ruleObject
+
+    l.ruleset = ruleset
+    l.compile()
+    return l
+
+def addCase( mask, field ):
+    """ Add the outcome of a 'case' element to a probability mask.
+
+    Args:
+        mask: A ProbabilityMask
+        field: A 'case' element
+    """
+    # Assume Probability is '1' unless otherwise specified
+    try:
+        mask.add( field.attrib["result"].replace(" ", ""), float( fractions.Fraction( field.attrib["prob"] ) ) )
+    except KeyError:
+        mask.add( field.attrib["result"].replace(" ", ""), 1.0 )
+
+def getContext( field ):
+    """ Make a context from the 'left', 'right' and 'cond' attributes of an element.
+    Assume context is not sensitive (nor conditional) unless otherwise specified.
+
+    Args:
+        field: A 'case' or 'context' element
+    Returns:
+        A Context object
+    """
+    return Context( field.attrib.get( "left", "/*" ), field.attrib.get( "right", "/*" ), field.attrib.get( "cond" ) )
 
-            ruleset[ruleObject.token] = ruleObject
+def getContextAndCases( field ):
+    """ Parse a 'context' element.
 
-        l.ruleset = ruleset
-        result.append( l )
-    return result
+    Args:
+        field: A 'context' element, encapsulating a collection of 'case' elements
+    Returns:
+        A tuple of the Context and the ProbabilityMask of its cases.
+    """
+    mask = ProbabilityMask()
+    for case in field:
+        if case.tag == "case":
+            addCase( mask, case )
+    return ( getContext( field ), mask )
 
 def getColors( filename ):
     """ Open colors.xml and make a map of color id's to color strings.
@@ -0,0 +1,191 @@
+"""
+Lsys libraries
+The lsys objects of data files, indexed by name and only built once they are used, so that loading a library of
+thousands of lsys objects doesn't build (and compile, see util/ruletable.py) every one of them first.
+
+A data file (see util/io.py) is read w/ a streaming parser, one 'lsys' element at a time; each element is kept as
+its own short XML source, and discarded from the parsed tree. An lsys is built from its source the first time it is
+accessed, and the same object is returned from then on, so modifying it (e.g. 'mod') lasts.
+
+The sources of a file are also kept in a compiled cache, next to the geometry cache (see util/diskcache.py): a
+marshalled list of (name, source) pairs, along w/ the modification time, size and sha256 hash of the file. A file
+whose time and size haven't changed is loaded from the cache w/o being read; one that was only touched is read and
+hashed, but not parsed again. Loading a library then takes about as long as reading its names.
+"""
+
+import os
+import io
+import marshal
+import hashlib
+import tempfile
+import xml.etree.ElementTree as ET
+
+from util.io import getLsysFromElement
+from util.profiler import profiled
+
+VERSION = 1                 # Changes whenever the format of the cache files changes
+CACHE_DIRECTORY = os.path.join( os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ), "cache" )
+EXTENSION = ".lib"
+
+class Library( object ):
+
+    def __init__( self, entries=() ):
+        """ Constructor.
+
+        Args:
+            entries: A list of (name, source) pairs, where source is the XML of an 'lsys' element, as bytes
+        """
+        self.names = []
+        self.sources = []
+        self.objects = []           # The lsys object of every entry, or None until it is built
+        self.index = dict()         # Map of lower case names to the index of their entry
+        self.extend( entries )
+
+    def __repr__( self ):
+        """ String representation.
+
+        Returns:
+            A console-friendly string representation.
+        """
+        built = sum( 1 for lsys in self.objects if lsys is not None )
+        return "Library of {:,} lsys objects, {:,} built".format( len(self), built )
+
+    def __len__( self ):
+        """ Return the number of lsys objects. """
+        return len(self.names)
+
+    def __getitem__( self, i ):
+        """ Return the lsys at an index, building it if it wasn't already.
+
+        Raises:
+            IndexError: If there is no such index
+            ValueError: If the definition of the lsys is invalid
+        """
+        lsys = self.objects[i]
+        if lsys is None:
+            try:
+                lsys = self.objects[i] = getLsysFromElement( ET.fromstring( self.sources[i] ) )
+            except ( IndexError, KeyError, ValueError, ZeroDivisionError ) as e:
+                raise ValueError( "The definition of '{}' is invalid: {}".format( self.names[i], e ) )
+        return lsys
+
+    def __iter__( self ):
+        """ Generate every lsys, in order, building them as they are reached. """
+        for i in range( len(self) ):
+            yield self[i]
+
+    def extend( self, entries ):
+        """ Append the lsys objects of another library, or a list of (name, source) pairs.
+        A name that is already in the library then refers to the latest of them.
+        """
+        if isinstance( entries, Library ):
+            ( names, sources, objects ) = ( entries.names, entries.sources, entries.objects )
+        else:
+            ( names, sources ) = ( [ name for ( name, source ) in entries ], [ source for ( name, source ) in entries ] )
+            objects = [ None ] * len(names)
+        for ( name, source, lsys ) in zip( names, sources, objects ):
+            self.index[ name.lower() ] = len(self.names)
+            self.names.append( name )
+            self.sources.append( source )
+            self.objects.append( lsys )
+
+    def find( self, name ):
+        """ Return the lsys w/ a given name, regardless of case, or None if there is none.
+
+        Raises:
+            ValueError: If the definition of the lsys is invalid
+        """
+        i = self.index.get( name.lower() )
+        return None if i is None else self[i]
+
+def parseEntries( file ):
+    """ Read the 'lsys' elements of a data file w/ a streaming parser.
+
+    Args:
+        file: The path of the data file, or a binary file object
+    Returns:
+        A list of (name, source) pairs, see Library
+    Raises:
+        xml.etree.ElementTree.ParseError: If the file isn't well-formed
+    """
+    entries = []
+    depth = 0
+    root = None
+    for ( event, element ) in ET.iterparse( file, events=( "start", "end" ) ):
+        if event == "start":
+            if root is None:
+                root = element
+            depth += 1
+            continue
+        depth -= 1
+        if depth == 1:
+            entries.append( ( element.attrib.get( "name", "" ), ET.tostring( element ) ) )
+            root.clear()        # Drop the element from the tree once it is kept as its source
+    return entries
+
+def getCachePath( filename, directory=CACHE_DIRECTORY ):
+    """ Return the path of the cache file of a data file. """
+    key = hashlib.sha256( os.path.abspath( filename ).encode( "utf-8" ) ).hexdigest()
+    return os.path.join( directory, key + EXTENSION )
+
+def readCache( path ):
+    """ Read a cache file.
+
+    Returns:
+        A tuple of (version, mtime, size, hash, entries), or None if it can't be read
+    """
+    try:
+        with open( path, "rb" ) as file:
+            cached = marshal.load( file )
+    except ( OSError, EOFError, ValueError, TypeError ):
+        return None
+    if not isinstance( cached, tuple ) or len(cached) != 5 or cached[0] != VERSION:
+        return None
+    return cached
+
+def writeCache( path, mtime, size, digest, entries ):
+    """ Write a cache file, under a temporary name first so that it is never read half written.
+    A cache that can't be written is left alone; the library is loaded from its file the next time.
+    """
+    try:
+        os.makedirs( os.path.dirname( path ), exist_ok=True )
+        ( fd, temporary ) = tempfile.mkstemp( EXTENSION + ".tmp", dir=os.path.dirname( path ) )
+        try:
+            with os.fdopen( fd, "wb" ) as file:
+                marshal.dump( ( VERSION, mtime, size, digest, entries ), file )
+            os.replace( temporary, path )
+        except BaseException:
+            os.remove( temporary )
+            raise
+    except OSError:
+        pass
+
+@profiled( "parse" )
+def loadLibrary( filename, directory=CACHE_DIRECTORY ):
+    """ Load the library of a data file, from the compiled cache if the file hasn't changed since it was cached.
+
+    Args:
+        filename: The path of the data file
+        directory: The directory of the cache files, or None to always parse the file
+    Returns:
+        A Library, whose lsys objects aren't built yet
+    Raises:
+        FileNotFoundError: If there is no such file
+        xml.etree.ElementTree.ParseError: If the file isn't well-formed
+    """
+    stat = os.stat( filename )
+    path = getCachePath( filename, directory ) if directory is not None else None
+    cached = readCache( path ) if path is not None else None
+    if cached is not None and cached[1] == stat.st_mtime_ns and cached[2] == stat.st_size:
+        return Library( cached[4] )
+
+    with open( filename, "rb" ) as file:
+        data = file.read()
+    digest = hashlib.sha256( data ).hexdigest()
+    if cached is not None and cached[3] == digest:
+        entries = cached[4]
+    else:
+        entries = parseEntries( io.BytesIO( data ) )
+    if path is not None:
+        writeCache( path, stat.st_mtime_ns, stat.st_size, digest, entries )
+    return Library( entries )
@@ -0,0 +1,132 @@
+"""
+Level of detail
+Interpret a deterministic lsys while skipping the subtrees that wouldn't be seen.
+
+The expansion is walked depth-first, like util/access.py walks it, while a headless turtle follows along. Before
+a variable is expanded, the bounding box of its subtree is placed at the turtle (see util/bounds.py):
+    If it is outside of the viewport, nothing of the subtree is drawn.
+    If it is smaller than a pixel, the subtree is drawn as a single stub, from where it starts to where it ends.
+    Otherwise, the variable is expanded.
+Either way, a skipped subtree moves the turtle by its transform (see util/access.py), so everything after it is
+drawn where it would have been. The cost of a drawing thus grows w/ the detail that is visible, rather than w/ the
+length of the expansion.
+
+Only deterministic lsys objects have a single transform per subtree, so only they can be culled.
+"""
+
+from math import cos, sin, radians
+
+from util.access import TurtleState
+from util.expand import tokenize, decode, getSizeMultiplier, SIZE_TOKEN
+from util.geometry import Geometry, interpret, NO_COLOR
+from util.profiler import PROFILER, profiled, countSegments
+
+def getPlacement( access, bounds, token, depth, heading ):
+    """ Place the subtree of a token at the origin, w/ a given heading and a unit size of 1.
+
+    Args:
+        access: The RandomAccess of the lsys, see util/access.py
+        bounds: The Bounds of the lsys, see util/bounds.py
+        token: A variable of the lsys
+        depth: Number of generations, at least 1
+        heading: The heading of the turtle, in degrees
+    Returns:
+        A tuple of the bounding box of the subtree (or None if it draws nothing), the (x, y) end of the subtree, its
+        turn, and the last color it uses (or None).
+    """
+    ( dx, dy, dheading, color ) = access.getTransform( token, depth )
+    h = radians( heading )
+    end = ( dx * cos(h) - dy * sin(h), dx * sin(h) + dy * cos(h) )
+    return ( bounds.getBox( token, depth, 0, 0, heading, 1 ), end, dheading, color )
+
+def isVisible( box, viewport ):
+    """ Return whether a bounding box overlaps a viewport, both as (xmin, ymin, xmax, ymax) tuples. """
+    return box[0] <= viewport[2] and box[2] >= viewport[0] and box[1] <= viewport[3] and box[3] >= viewport[1]
+
+@profiled( "interpret", countSegments )
+def interpretCulled( lsys, depth, size=1, viewport=None, pixel=0, state=None, geometry=None ):
+    """ Expand and interpret a deterministic lsys, culling the subtrees outside of a viewport or smaller than a pixel.
+
+    Args:
+        lsys: A deterministic, non-parametric lsys object
+        depth: Number of iterations
+        size: Unit size of turtle
+        viewport: The (xmin, ymin, xmax, ymax) region to draw, or None for everything
+        pixel: The size of a pixel; subtrees whose bounding box is smaller are drawn as stubs. 0 draws everything.
+        state: The TurtleState to start from (and update), the origin by default
+        geometry: The Geometry to add segments to, a new one by default
+    Returns:
+        The Geometry
+    Raises:
+        ValueError: If the lsys is not deterministic, or is parametric
+    """
+    access = lsys.getRandomAccess()
+    bounds = lsys.getBoundsTable()
+    if state is None:
+        state = TurtleState()
+    if geometry is None:
+        geometry = Geometry()
+
+    pending = []            # Final-depth (token, unit size) pairs, not interpreted yet
+    placements = dict()     # Map of (token, depth, heading) to the placement of that subtree, see getPlacement
+    frames = []
+    ( tokens, i, size_multiplier ) = ( tokenize( lsys.axiom ), 0, 1 )
+    PROFILER.setMaximum( "recursion depth", depth )
+
+    while True:
+        if i >= len(tokens):
+            if len(frames) == 0:
+                break
+            ( tokens, i, depth, size, size_multiplier ) = frames.pop()
+            continue
+
+        token = tokens[i]
+        i += 1
+
+        if token[0] == SIZE_TOKEN:
+            size_multiplier = getSizeMultiplier( token[1:] )
+            continue
+        if depth <= 0 or token not in access.variables:
+            if token == "+" and not pending:
+                state.heading += lsys.angle
+            elif token == "-" and not pending:
+                state.heading -= lsys.angle
+            else:
+                pending.append( ( token, size * size_multiplier ) )
+            continue
+
+        # The turtle must be where the subtree starts
+        if pending:
+            interpret( PROFILER.countCommands( decode( pending, lsys.angle ) ), state, geometry )
+            pending = []
+
+        length = size * size_multiplier
+        entry = ( token, depth, round( state.heading % 360, 9 ) )
+        placement = placements.get( entry )
+        if placement is None:
+            placement = placements[entry] = getPlacement( access, bounds, token, depth, state.heading )
+        ( box, ( dx, dy ), dheading, color ) = placement
+        ( x, y ) = ( state.x, state.y )
+
+        visible = box is not None
+        if visible:
+            if length < 0:
+                box = ( -box[2], -box[3], -box[0], -box[1] )
+            box = ( x + length * box[0], y + length * box[1], x + length * box[2], y + length * box[3] )
+            visible = viewport is None or isVisible( box, viewport )
+            if visible and max( box[2] - box[0], box[3] - box[1] ) >= pixel:
+                frames.append( ( tokens, i, depth, size, size_multiplier ) )
+                ( tokens, i, depth, size, size_multiplier ) = ( access.results[token], 0, depth-1, length, 1 )
+                continue
+
+        # Skip the subtree, but move the turtle to its end
+        state.x += length * dx
+        state.y += length * dy
+        state.heading += dheading
+        if visible:
+            geometry.add( x, y, state.x, state.y, NO_COLOR if state.color is None else state.color )
+        if color is not None:
+            state.color = color
+
+    interpret( PROFILER.countCommands( decode( pending, lsys.angle ) ), state, geometry )
+    return geometry
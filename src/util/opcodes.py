@@ -0,0 +1,211 @@
+"""
+Opcode programs
+The rule strings of a compiled ruleset (see util/ruletable.py), tokenized once into flat arrays of integer opcodes.
+
+Every symbol of the alphabet is interned to a small integer, its code, when it is first compiled. Color codes and
+size modifiers become a single opcode followed by an inline operand: the color id for '#', or the index of the
+size multiplier in the table of constants for '@'. Spaces are dropped. So a string like 'F@Q2[+F#3]' becomes:
+    F  @ 0  [  +  F  # 3  ]
+and is never scanned character by character again.
+
+Every compiled string also keeps, for each opcode, the index of its symbol in the source string, which is what the
+keys of stochastic rules are hashed from (see util/stream.py); so a program expands into exactly the same string as
+the character-based engine of util/expand.py.
+
+Programs are walked depth-first like util/expand.py walks strings, but yield decoded turtle commands directly,
+w/o building tokens first. The commands of short deterministic subtrees are cached (see util/cache.py) and replayed
+as they are, so they aren't decoded or allocated again.
+"""
+
+from array import array
+
+from util.cache import SUBTREE_CACHE
+from util.stream import getChildKey
+from util.profiler import PROFILER
+from util.expand import readOperand, getSizeMultiplier, DRAW_TOKENS, MOVE_TOKENS, LEAF_TOKEN, TURN_TOKENS, \
+    BRANCH_TOKENS, COLOR_TOKEN, SIZE_TOKEN, TOKEN_COST
+
+COLOR_OP = 0                # Color code, followed by the color id
+SIZE_OP = 1                 # Size modifier, followed by the index of its multiplier
+NO_OPERAND = -1             # Operand of a color code w/o a color id, which does nothing
+
+class Program( object ):
+
+    def __init__( self, table ):
+        """ Constructor. Compiles every result of a ruleset, which interns its whole alphabet.
+
+        Args:
+            table: A compiled, non-parametric RuleTable, see util/ruletable.py
+        Raises:
+            ValueError: If a size modifier can't be read
+            IndexError: If a size modifier has no operand
+        """
+        self.table = table
+        self.codes = dict()                     # Map of symbols to their codes
+        self.symbols = [ COLOR_TOKEN, SIZE_TOKEN ]
+        self.variables = bytearray( 2 )         # Whether the symbol of each code has a rule
+        self.constants = []                     # Size multipliers, indexed by the operands of SIZE_OP
+        self.multipliers = dict()               # Map of size multipliers to their indices
+        self.compiled = dict()                  # Map of strings to their (opcodes, positions) arrays
+        self.results = [ None, None ]           # The compiled result of each deterministic variable, by code
+
+        for var in table.variables:
+            for item in table.masks[var].mask:
+                self.compile( item.elem or "" )
+        if table.isDeterministic():
+            for ( var, result ) in table.results.items():
+                self.results[ self.getCode( var ) ] = self.compile( result )
+
+    def getCode( self, symbol ):
+        """ Return the code of a symbol, interning it if it is new. """
+        code = self.codes.get( symbol )
+        if code is None:
+            code = self.codes[symbol] = len(self.symbols)
+            self.symbols.append( symbol )
+            self.variables.append( symbol in self.table.variables )
+            self.results.append( None )
+        return code
+
+    def getConstant( self, multiplier ):
+        """ Return the index of a size multiplier in the table of constants, adding it if it is new. """
+        index = self.multipliers.get( multiplier )
+        if index is None:
+            index = self.multipliers[multiplier] = len(self.constants)
+            self.constants.append( multiplier )
+        return index
+
+    def compile( self, string ):
+        """ Tokenize a string into opcodes, or return the opcodes it was already compiled into.
+
+        Args:
+            string: A string of symbols, e.g. an axiom or a rule result
+        Returns:
+            A tuple of two arrays: the opcodes (w/ their inline operands) and, for every opcode, the index of its
+            symbol in the string (-1 for operands).
+        Raises:
+            ValueError: If a size modifier can't be read
+            IndexError: If a size modifier has no operand
+        """
+        result = self.compiled.get( string )
+        if result is not None:
+            return result
+
+        ops = array( "l" )
+        positions = array( "l" )
+        i = 0
+        while i < len(string):
+            char = string[i]
+            i += 1
+            if char == COLOR_TOKEN:
+                ( operand, j ) = readOperand( string, i, "0123456789" )
+                ops.extend( ( COLOR_OP, int( operand ) if operand else NO_OPERAND ) )
+                positions.extend( ( i-1, -1 ) )
+                i = j
+            elif char == SIZE_TOKEN:
+                ( operand, j ) = readOperand( string, i, "0123456789.QI" )
+                ops.extend( ( SIZE_OP, self.getConstant( getSizeMultiplier( operand ) ) ) )
+                positions.extend( ( i-1, -1 ) )
+                i = j
+            elif char != " ":
+                ops.append( self.getCode( char ) )
+                positions.append( i-1 )
+
+        result = self.compiled[string] = ( ops, positions )
+        return result
+
+    def getCommands( self, angle ):
+        """ Decode every code of the alphabet into a turtle command.
+
+        Args:
+            angle: The angle associated with the lsys
+        Returns:
+            A tuple of two lists, indexed by code: the token of every forward command (or None), and the (token, arg)
+            command of every other symbol w/ a turtle action (or None), see util/expand.py.
+        """
+        forward = [ None ] * len(self.symbols)
+        fixed = [ None ] * len(self.symbols)
+        for ( code, symbol ) in enumerate( self.symbols ):
+            if code == COLOR_OP or code == SIZE_OP:
+                continue
+            if symbol in DRAW_TOKENS or symbol in MOVE_TOKENS or symbol == LEAF_TOKEN:
+                forward[code] = symbol
+            elif symbol in TURN_TOKENS:
+                fixed[code] = ( symbol, angle )
+            elif symbol in BRANCH_TOKENS:
+                fixed[code] = ( symbol, None )
+        return ( forward, fixed )
+
+    def walk( self, string, angle, depth, size=1, key=0, cache=SUBTREE_CACHE ):
+        """ Expand a string depth-first, and yield the turtle commands of the final-depth string.
+        The same as decoding the tokens of util/expand.py's 'walk', for context-free, non-parametric lsys objects.
+
+        Args:
+            string: The string to expand, usually the axiom
+            angle: The angle associated with the lsys
+            depth: Number of recursions
+            size: Unit size of turtle
+            key: The key of the token that 'string' replaced, the root key of the lsys for its axiom
+            cache: The SubtreeCache to use, or None
+        Yields:
+            Tuples of (token, arg), see util/expand.py
+        """
+        table = self.table
+        keyed = not table.isDeterministic()     # Deterministic lsys objects don't need keys
+        PROFILER.setMaximum( "recursion depth", depth )
+        if cache is not None and ( keyed or not cache.isEnabled() ):
+            cache = None
+
+        ( ops, positions ) = self.compile( string )
+        ( forward, fixed ) = self.getCommands( angle )
+        ( variables, constants, results, symbols ) = ( self.variables, self.constants, self.results, self.symbols )
+        frames = []
+        size_multiplier = 1
+        i = 0
+
+        while True:
+
+            # Finished the current string, resume the one that expanded into it
+            if i >= len(ops):
+                if len(frames) == 0:
+                    return
+                ( ops, positions, i, depth, size, size_multiplier, key ) = frames.pop()
+                continue
+
+            op = ops[i]
+            i += 1
+
+            if op == COLOR_OP:
+                if ops[i] != NO_OPERAND:
+                    yield ( COLOR_TOKEN, ops[i] )
+                i += 1
+
+            elif op == SIZE_OP:
+                size_multiplier = constants[ops[i]]
+                i += 1
+
+            # Symbol is part of the final string
+            elif depth <= 0 or not variables[op]:
+                if forward[op] is not None:
+                    yield ( forward[op], size * size_multiplier )
+                elif fixed[op] is not None:
+                    yield fixed[op]
+
+            # Replay the commands of a short deterministic subtree
+            elif cache is not None and table.isShort( symbols[op], depth ):
+                length = size * size_multiplier
+                entry = ( self, op, depth, length, angle )
+                segment = cache.get( entry )
+                if segment is None:
+                    segment = tuple( self.walk( symbols[op], angle, depth, length, key, None ) )
+                    cache.put( entry, segment, len(segment) * TOKEN_COST )
+                yield from segment
+
+            # Otherwise continue with a rule string, and come back to this one once it is done
+            else:
+                frames.append( ( ops, positions, i, depth, size, size_multiplier, key ) )
+                if keyed:
+                    key = getChildKey( key, positions[i-1] )
+                    ( ops, positions ) = self.compile( table.roll( symbols[op], key ) )
+                else:
+                    ( ops, positions ) = results[op]
+                ( i, depth, size, size_multiplier ) = ( 0, depth-1, size * size_multiplier, 1 )
@@ -0,0 +1,191 @@
+"""
+Parallel interpretation
+Splits the final-depth string of an lsys into ranges of tokens, and expands & interprets every range in its own
+process.
+
+Each worker starts from the exact turtle state at the beginning of its range (position, heading, open brackets
+and pen color), which random access computes without expanding anything before it (see util/access.py), so the
+chunks can be stitched back together in order. Where the ruleset has a fast path, a worker builds its range as a
+string and interprets it a block of characters at a time, like a serial run does.
+
+Batched stochastic lsys objects (see util/ruletable.py) are split by subtree instead: the first generations are
+rewritten until there are enough variables, and every variable is expanded & interpreted by a worker, relative to
+the origin w/ a heading of 0. The choices of stochastic rules only depend on the seed and the derivation path of
+each token (see util/stream.py), so every worker makes the same choices the serial expansion would. The subtrees
+are then placed at the turtle state where they begin, which assumes that their brackets are balanced.
+
+Anything else is interpreted serially.
+"""
+
+import os
+from math import cos, sin, radians
+from concurrent.futures import ProcessPoolExecutor
+
+from util.access import TurtleState
+from util.expand import walk, decode
+from util.geometry import Geometry, interpret, interpretVectorized, interpretString, interpretLsys
+from util.profiler import profiled, countSegments
+
+CHUNKS_PER_WORKER = 4       # More chunks than workers, so that uneven chunks are balanced out
+MIN_CHUNK_LENGTH = 1 << 14  # Shorter expansions aren't worth sending to another process
+MIN_STRING_LENGTH = 1 << 19 # Likewise for those w/ a fast path, which are interpreted serially at ~5M tokens/s
+SUBTREES_PER_CHUNK = 8      # Least number of subtrees in a chunk of a stochastic lsys, to balance out their sizes
+
+def interpretChunk( lsys, depth, size, start, stop ):
+    """ Expand and interpret a range of tokens. Runs in a worker process.
+
+    Args:
+        lsys: A deterministic lsys object
+        depth: Number of iterations
+        size: Unit size of turtle
+        start: Index of the first token
+        stop: Index after the last token
+    Returns:
+        The Geometry of the range.
+    """
+    state = lsys.getTurtleState( depth, start, size )
+    if lsys.getRuleTable().hasFastPath() and "(" not in lsys.axiom and "@" not in lsys.axiom:
+        return interpretString( lsys.getSlice( depth, start, stop ), lsys.angle, size, state )
+    return interpretVectorized( lsys.iterCommands( depth, size, start, stop ), state )
+
+def interpretSubtrees( lsys, subtrees ):
+    """ Expand and interpret subtrees of a stochastic lsys, each from the origin. Runs in a worker process.
+
+    Args:
+        lsys: A batched stochastic lsys object
+        subtrees: A list of (variable, key, depth, size) tuples
+    Returns:
+        A list of (Geometry, TurtleState) tuples, the segments of each subtree and the state of the turtle after it.
+    """
+    table = lsys.getRuleTable()
+    program = table.getProgram()
+    result = []
+    for ( var, key, depth, size ) in subtrees:
+        state = TurtleState()
+        commands = program.walk( table.roll( var, key ), lsys.angle, depth-1, size, key, None )
+        result.append( ( interpretVectorized( commands, state ), state ) )
+    return result
+
+def getFrontier( lsys, depth, size, count ):
+    """ Rewrite the first generations of a batched stochastic lsys until it has enough variables to split.
+
+    Args:
+        lsys: A batched stochastic lsys object
+        depth: Number of iterations
+        size: Unit size of turtle
+        count: The least number of variables
+    Returns:
+        A list of the tokens of the last generation rewritten: (token, size) tuples for terminals, and
+        (variable, key, remaining depth, size) tuples for variables. None if the lsys can't be split.
+    """
+    table = lsys.getRuleTable()
+    string = lsys.axiom
+    keys = table.getChildKeys( string, lsys.getKey() )
+    while depth > 0 and len(keys) < count:
+        ( string, keys ) = table.rewriteBatch( string, keys )
+        depth -= 1
+    if depth == 0:
+        return None
+
+    result = []
+    n = 0
+    for ( token, scale ) in walk( lsys, 0, size, string, None ):
+        if token in table.variables and n < len(keys):
+            result.append( ( token, keys[n], depth, scale ) )
+            n += 1
+        else:
+            result.append( ( token, scale ) )
+    return result if n == len(keys) else None
+
+def interpretStochastic( lsys, depth, size, workers ):
+    """ Expand and interpret a batched stochastic lsys across a pool of processes, split by subtree.
+
+    Args:
+        lsys: A batched stochastic lsys object
+        depth: Number of iterations
+        size: Unit size of turtle
+        workers: Number of processes
+    Returns:
+        The Geometry of the whole expansion, the same as a serial interpretation, or None if it can't be split.
+    """
+    tasks = workers * CHUNKS_PER_WORKER
+    frontier = getFrontier( lsys, depth, size, tasks * SUBTREES_PER_CHUNK )
+    if frontier is None:
+        return None
+
+    subtrees = [ item for item in frontier if len(item) == 4 ]
+    chunks = getChunks( len(subtrees), tasks )
+    state = TurtleState()
+    result = Geometry()
+
+    with ProcessPoolExecutor( max_workers=workers ) as pool:
+        futures = [ pool.submit( interpretSubtrees, lsys, subtrees[start:stop] ) for ( start, stop ) in chunks ]
+        placed = ( placement for future in futures for placement in future.result() )
+        terminals = []
+        for item in frontier:
+            if len(item) == 2:
+                terminals.append( item )
+                continue
+
+            interpret( decode( terminals, lsys.angle ), state, result )
+            terminals = []
+            ( geometry, end ) = next( placed )
+            result.extendTransformed( geometry, state )
+            h = radians( state.heading )
+            state.x += end.x * cos(h) - end.y * sin(h)
+            state.y += end.x * sin(h) + end.y * cos(h)
+            state.heading += end.heading
+            if end.color is not None:
+                state.color = end.color
+        interpret( decode( terminals, lsys.angle ), state, result )
+
+    return result
+
+def getChunks( length, count ):
+    """ Split a range of tokens into even chunks.
+
+    Args:
+        length: Number of tokens
+        count: Number of chunks
+    Returns:
+        A list of (start, stop) tuples
+    """
+    count = max( 1, min( count, length ) )
+    bounds = [ length * i // count for i in range( count + 1 ) ]
+    return [ ( bounds[i], bounds[i+1] ) for i in range( count ) ]
+
+@profiled( "interpret", countSegments )
+def interpretParallel( lsys, depth, size, workers=None ):
+    """ Expand and interpret an lsys across a pool of processes.
+
+    Args:
+        lsys: An lsys object
+        depth: Number of iterations
+        size: Unit size of turtle
+        workers: Number of processes, the number of CPUs by default
+    Returns:
+        The Geometry of the whole expansion, the same as a serial interpretation.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    table = lsys.getRuleTable()
+    if workers > 1 and table.isBatched() and lsys.predict( depth )["tokens"] >= MIN_CHUNK_LENGTH:
+        result = interpretStochastic( lsys, depth, size, workers )
+        if result is not None:
+            return result
+
+    if workers <= 1 or not table.isDeterministic():
+        return interpretLsys( lsys, depth, size )
+
+    length = lsys.getLength( depth )
+    if length < ( MIN_STRING_LENGTH if table.hasFastPath() else MIN_CHUNK_LENGTH ):
+        return interpretLsys( lsys, depth, size )
+
+    chunks = getChunks( length, workers * CHUNKS_PER_WORKER )
+    result = Geometry()
+    with ProcessPoolExecutor( max_workers=workers ) as pool:
+        futures = [ pool.submit( interpretChunk, lsys, depth, size, start, stop ) for ( start, stop ) in chunks ]
+        for future in futures:
+            result.extend( future.result() )
+    return result
@@ -8,10 +8,25 @@ E.g. the probability mask:
 "Asdfg" (0.25) 
 
 Will roll "Hello" about 50% of the time, and the others about 25% each
+
+A mask is compiled into an alias table (Vose's method) the first time it is rolled, so each roll costs a single
+random number and a lookup, regardless of the number of outcomes. If the probabilities add up to less than 1,
+the remainder is the probability of rolling None; if they add up to more, the last outcomes are cut short.
+
+An outcome is selected by a uniform number in [0, 1). Expansions derive that number from the seed of the lsys and
+the position of the token being rewritten (see util/stream.py), rather than drawing it from a shared generator.
+Many outcomes can be selected at once with 'sample', vectorized w/ NumPy if NumPy is installed.
 """
 import random
 
-SEED = 123456789
+try:
+    import numpy
+except ImportError:
+    numpy = None            # Optional, only used to select large samples
+
+SEED = 123456789            # Default seed of the random choices of an lsys
+EPSILON = 1e-9              # Probabilities within this of adding up to 1 are assumed to add up to 1
+MIN_VECTOR_SAMPLE = 64      # Smallest sample worth drawing w/ NumPy
 
 class Probability(object):
     """ Helper class which uniquely maps an element to a probability of that element occurring. """
@@ -37,8 +52,8 @@ class ProbabilityMask(object):
         Raises:
             AttributeError: if probList contains a non-Probability object.
         """
-        random.seed( SEED )
         self.mask = list()
+        self.outcomes = None
         for prob in probList:
             if isinstance( prob, Probability ):
                 self.mask.append( prob )
@@ -53,6 +68,11 @@ class ProbabilityMask(object):
             prob: The probability that this rule will be applied.
         """
         self.mask.append( Probability(elem, prob) )
+        self.outcomes = None
+
+    def __len__(self):
+        """ Return the number of outcomes in this mask. """
+        return len(self.mask)
 
     def isEmpty(self):
         """ Return whether this object is populated with values or not. """
@@ -72,18 +92,85 @@ class ProbabilityMask(object):
             sum += item.prob
         return sum == 1
 
-    def roll(self):
+    def compile(self):
+        """ Build the alias table of this mask: the outcomes, and the threshold and alias of every column. Called by
+        the first roll. """
+        outcomes = []
+        probabilities = []
+        total = 0
+        for item in self.mask:
+            prob = max( 0, min( item.prob, 1 - total ) )
+            total += prob
+            outcomes.append( item.elem )
+            probabilities.append( prob )
+        if total < 1 - EPSILON or len(outcomes) == 0:
+            outcomes.append( None )
+            probabilities.append( 1 - total )
+        total = sum( probabilities )
+
+        # Vose's alias method: split the outcomes into n equally likely columns of at most two outcomes each
+        n = len(outcomes)
+        scaled = [ prob * n / total for prob in probabilities ]
+        threshold = [ 1.0 ] * n
+        alias = list( range( n ) )
+        small = [ i for i in range( n ) if scaled[i] < 1 ]
+        large = [ i for i in range( n ) if scaled[i] >= 1 ]
+        while small and large:
+            ( s, l ) = ( small.pop(), large.pop() )
+            threshold[s] = scaled[s]
+            alias[s] = l
+            scaled[l] -= 1 - scaled[s]
+            ( small if scaled[l] < 1 else large ).append( l )
+
+        self.threshold = threshold
+        self.alias = alias
+        self.outcomes = outcomes
+
+    def roll(self, rng=random):
         """ Return an outcome based on the probabilities in the mask.
-        
+
+        Args:
+            rng: The random number generator to draw from, a random.Random object or the random module
         Returns:
             The outcome of this rule's transformation, according to the probability distribution.
         """
-        roll = random.random()
-        sum = 0
-        for item in self.mask:
-            sum += item.prob
-            if sum >= roll: return item.elem
-        return None
+        return self.select( rng.random() )
+
+    def select(self, u):
+        """ Return the outcome selected by a given uniform number.
+
+        Args:
+            u: A number in [0, 1)
+        Returns:
+            The outcome of this rule's transformation, according to the probability distribution.
+        """
+        if self.outcomes is None:
+            self.compile()
+        u *= len(self.outcomes)
+        i = int(u)
+        return self.outcomes[i] if u - i < self.threshold[i] else self.outcomes[ self.alias[i] ]
+
+    def sample(self, uniforms):
+        """ Select many outcomes at once.
+
+        Args:
+            uniforms: A sequence of numbers in [0, 1), a list or a NumPy array
+        Returns:
+            A list of the outcome selected by each number.
+        """
+        if self.outcomes is None:
+            self.compile()
+        if len(self.outcomes) == 1:
+            return self.outcomes * len(uniforms)
+
+        if numpy is None or len(uniforms) < MIN_VECTOR_SAMPLE:
+            return [ self.select( u ) for u in uniforms ]
+
+        u = numpy.asarray( uniforms ) * len(self.outcomes)
+        i = u.astype( numpy.int64 )
+        i = numpy.where( u - i < numpy.asarray( self.threshold )[i], i, numpy.asarray( self.alias )[i] )
+        outcomes = self.outcomes
+        return [ outcomes[j] for j in i.tolist() ]
 
     def __str__(self):
         """ String representation of the ProbabilityMask
@@ -101,7 +188,7 @@ class ProbabilityMask(object):
         """
         result = str()
         for item in self.mask:
-            result += f"{item[0]}: {item[1] * 100}%\n"
+            result += f"{item.elem}: {item.prob * 100}%\n"
         return result
 
     def asParseString(self):
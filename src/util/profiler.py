@@ -0,0 +1,211 @@
+"""
+Profiler
+Instrumentation of the hot paths of lsys, to tell where the time of a slow run went. Disabled by default; it is
+switched on and shown w/ the 'stats' command (see main.py).
+
+The profiler records:
+    phases      -   The number of calls, the wall time, and the growth of the peak memory of every phase of a run:
+                    parsing data files, expanding, interpreting, simplifying, drawing w/ the turtle, saving, and
+                    the geometry cache. Phases nest (e.g. interpreting includes expanding lazily), and a phase
+                    entered again while it is already running is only timed once.
+    counters    -   The tokens expanded and the segments interpreted.
+    maxima      -   The deepest expansion (the recursion depth of the expansion engine, see util/expand.py) and the
+                    deepest nesting of branches (the size of the turtle's stack).
+    caches      -   The hits and misses of the caches it watches, since it was reset.
+Work done in other processes (see util/parallel.py) is timed as part of its phase, but not counted.
+
+Functions are instrumented w/ the 'profiled' decorator, which costs a single check of a flag per call while the
+profiler is disabled; counting wrappers ('countCommands') aren't even put around generators then.
+"""
+
+import sys
+import json
+import time
+import functools
+from itertools import accumulate
+
+try:
+    import resource
+except ImportError:
+    resource = None         # Not available on Windows; peak memory isn't reported there
+
+VERSION = 1                 # Changes whenever the format of the exported statistics changes
+
+def getPeakMemory():
+    """ Return the peak resident memory of this process, in megabytes, or None if it isn't known. """
+    if resource is None:
+        return None
+    peak = resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss
+    return round( peak / ( 1048576 if sys.platform == "darwin" else 1024 ), 1 )     # Bytes on macOS, KB elsewhere
+
+def getBranchDepth( string ):
+    """ Return the deepest nesting of branches of a final-depth string. """
+    return max( accumulate( 1 if char == "[" else -1 for char in string if char == "[" or char == "]" ), default=0 )
+
+class Profiler( object ):
+
+    def __init__( self ):
+        """ Constructor. Creates a disabled profiler, w/ nothing recorded. """
+        self.enabled = False
+        self.caches = dict()        # Map of names to watched caches, and their (hits, misses) when last reset
+        self.reset()
+
+    def __repr__( self ):
+        """ String representation.
+
+        Returns:
+            A console-friendly string representation.
+        """
+        stats = self.getStats()
+        lines = [ "Profiling is {}.".format( "on" if self.enabled else "off" ) ]
+        if stats["phases"]:
+            lines.append( "{:12} {:>8} {:>11} {:>12}".format( "phase", "calls", "seconds", "peak +MB" ) )
+            for ( phase, record ) in stats["phases"].items():
+                growth = record["peak_growth_mb"]
+                lines.append( "{:12} {:>8,} {:>11.4f} {:>12}".format(
+                    phase, record["calls"], record["seconds"], "?" if growth is None else "{:.1f}".format( growth ) ) )
+        for ( name, value ) in list( stats["counters"].items() ) + list( stats["maxima"].items() ):
+            lines.append( "{}: {:,}".format( name.capitalize(), value ) )
+        for ( name, record ) in stats["caches"].items():
+            rate = record["hit_rate"]
+            lines.append( "{}: {:,} hits, {:,} misses ({} hit rate)".format( name.capitalize(), record["hits"],
+                          record["misses"], "n/a" if rate is None else "{:.1%}".format( rate ) ) )
+        lines.append( "Peak memory: {} MB".format( "?" if stats["peak_memory_mb"] is None else stats["peak_memory_mb"] ) )
+        return "\n".join( lines )
+
+    def enable( self, enabled=True ):
+        """ Switch the profiler on or off. What was recorded is kept either way. """
+        self.enabled = enabled
+
+    def reset( self ):
+        """ Forget everything recorded so far. """
+        self.phases = dict()        # Map of phases to [ calls, seconds, peak growth ] lists
+        self.active = set()         # Phases currently running
+        self.counters = dict()
+        self.maxima = dict()
+        for ( name, ( cache, _ ) ) in self.caches.items():
+            self.caches[name] = ( cache, ( cache.hits, cache.misses ) )
+
+    def watch( self, name, cache ):
+        """ Report the hit rate of a cache, from now on.
+
+        Args:
+            name: The name of the cache, e.g. 'subtree cache'
+            cache: An object w/ 'hits' and 'misses' attributes, e.g. a SubtreeCache (see util/cache.py)
+        """
+        self.caches[name] = ( cache, ( cache.hits, cache.misses ) )
+
+    def count( self, name, value=1 ):
+        """ Add to a counter, if the profiler is enabled. """
+        if self.enabled:
+            self.counters[name] = self.counters.get( name, 0 ) + value
+
+    def setMaximum( self, name, value ):
+        """ Raise a maximum to a value, if the profiler is enabled and the value is larger. """
+        if self.enabled and value > self.maxima.get( name, value - 1 ):
+            self.maxima[name] = value
+
+    def countString( self, string ):
+        """ Count the tokens and the nesting of branches of a final-depth string, if the profiler is enabled. """
+        if self.enabled:
+            self.count( "tokens", len(string) )
+            self.setMaximum( "branch depth", getBranchDepth( string ) )
+
+    def countCommands( self, commands ):
+        """ Count the turtle commands of an iterable as they are generated, and the nesting of their branches.
+
+        Args:
+            commands: An iterable of (token, arg) commands, see util/expand.py
+        Returns:
+            The iterable itself if the profiler is disabled, otherwise a generator of the same commands
+        """
+        return commands if not self.enabled else self.iterCounted( commands )
+
+    def iterCounted( self, commands ):
+        """ Helper for 'countCommands'. """
+        ( count, depth, deepest ) = ( 0, 0, 0 )
+        try:
+            for command in commands:
+                count += 1
+                if command[0] == "[":
+                    depth += 1
+                    if depth > deepest:
+                        deepest = depth
+                elif command[0] == "]":
+                    depth -= 1
+                yield command
+        finally:
+            self.count( "tokens", count )
+            self.setMaximum( "branch depth", deepest )
+
+    def call( self, phase, counters, function, args, kwargs ):
+        """ Call a function as a phase, see 'profiled'. """
+        if phase in self.active:
+            return function( *args, **kwargs )
+
+        self.active.add( phase )
+        peak = getPeakMemory()
+        start = time.perf_counter()
+        try:
+            result = function( *args, **kwargs )
+        finally:
+            elapsed = time.perf_counter() - start
+            self.active.discard( phase )
+            record = self.phases.setdefault( phase, [ 0, 0.0, None ] )
+            record[0] += 1
+            record[1] += elapsed
+            if peak is not None:
+                record[2] = ( record[2] or 0.0 ) + getPeakMemory() - peak
+        if counters is not None:
+            for ( name, value ) in counters( result ).items():
+                self.count( name, value )
+        return result
+
+    def getStats( self ):
+        """ Return everything recorded so far, see the docstring of this module.
+
+        Returns:
+            A map of JSON-serializable statistics
+        """
+        phases = { phase: { "calls": calls, "seconds": round( seconds, 6 ),
+                            "peak_growth_mb": None if growth is None else round( growth, 1 ) }
+                   for ( phase, ( calls, seconds, growth ) ) in self.phases.items() }
+        caches = dict()
+        for ( name, ( cache, ( hits, misses ) ) ) in self.caches.items():
+            ( hits, misses ) = ( cache.hits - hits, cache.misses - misses )
+            caches[name] = { "hits": hits, "misses": misses,
+                             "hit_rate": round( hits / ( hits + misses ), 4 ) if hits + misses > 0 else None }
+        return { "version": VERSION, "enabled": self.enabled, "phases": phases, "counters": dict( self.counters ),
+                 "maxima": dict( self.maxima ), "caches": caches, "peak_memory_mb": getPeakMemory() }
+
+    def writeJson( self, filename ):
+        """ Export everything recorded so far to a JSON file.
+
+        Raises:
+            OSError: If the file can't be written
+        """
+        with open( filename, "w", encoding="utf-8" ) as file:
+            json.dump( self.getStats(), file, indent=2 )
+
+def profiled( phase, counters=None ):
+    """ Decorator, times every call of a function as part of a phase while the shared profiler is enabled.
+
+    Args:
+        phase: The name of the phase, e.g. 'interpret'
+        counters: A function of the result of the function, which returns a map of counters to add to, or None
+    """
+    def decorator( function ):
+        @functools.wraps( function )
+        def wrapper( *args, **kwargs ):
+            if not PROFILER.enabled:
+                return function( *args, **kwargs )
+            return PROFILER.call( phase, counters, function, args, kwargs )
+        return wrapper
+    return decorator
+
+def countSegments( geometry ):
+    """ Counters of a function that returns a Geometry, for 'profiled'. """
+    return { "segments": len(geometry) }
+
+# Shared by every instrumented function
+PROFILER = Profiler()
@@ -0,0 +1,324 @@
+"""
+Raster renderer
+Draws the segments of a Geometry (see util/geometry.py) into pixels, and writes them to a PNG file w/ nothing but
+the standard library ('zlib' and 'struct').
+
+The image is rendered in bands of rows (tiles spanning its width), which are compressed and written as soon as
+they are drawn, so only a few bands are ever held in memory, however large the image is. Every band only depends
+on the segments that cross it, so bands can be drawn in separate processes.
+
+Pixels are indices into a palette rather than colors: index 0 is the background, index 1 the default color, and
+the colors of colors.xml (see util/io.py) follow, so a pixel takes a single byte and the PNG is written in indexed
+color.
+A segment is drawn as the pixels nearest to evenly spaced points along it, one per pixel of its longest side, and
+later segments are drawn over earlier ones. If NumPy is installed, the points of every segment of a band are
+computed at once; otherwise, one at a time, which draws the same pixels, only much more slowly.
+"""
+
+import struct
+import zlib
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from math import ceil, floor
+
+try:
+    import numpy
+except ImportError:
+    numpy = None            # Optional, only used to draw bands w/ array operations
+
+from util.svg import getBounds
+
+BACKGROUND = ( 255, 255, 255 )  # Color of the background
+DEFAULT_COLOR = ( 0, 0, 0 )     # Color of segments w/o a color id, or w/ an unknown one
+IMAGE_SIZE = 2048           # Width of the image (or height, if it is taller), in pixels
+MARGIN = 0.02               # Blank space around the drawing, relative to its size
+BAND_HEIGHT = 256           # Number of rows drawn at once
+COMPRESS_LEVEL = 6          # Level of zlib compression
+MAX_COLORS = 256            # Size of a PNG palette
+BANDS_PER_WORKER = 2        # Bands submitted to each process ahead of the one being written
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# Colors that may be given by name in colors.xml, besides hex strings
+NAMED_COLORS = {
+    "black": ( 0, 0, 0 ), "white": ( 255, 255, 255 ), "red": ( 255, 0, 0 ), "green": ( 0, 128, 0 ),
+    "blue": ( 0, 0, 255 ), "yellow": ( 255, 255, 0 ), "cyan": ( 0, 255, 255 ), "magenta": ( 255, 0, 255 ),
+    "orange": ( 255, 165, 0 ), "purple": ( 128, 0, 128 ), "brown": ( 165, 42, 42 ), "pink": ( 255, 192, 203 ),
+    "gray": ( 128, 128, 128 ), "grey": ( 128, 128, 128 ), "lime": ( 0, 255, 0 ), "olive": ( 128, 128, 0 ),
+    "navy": ( 0, 0, 128 ), "teal": ( 0, 128, 128 ), "maroon": ( 128, 0, 0 ), "gold": ( 255, 215, 0 ),
+    "darkgreen": ( 0, 100, 0 ), "forestgreen": ( 34, 139, 34 ), "skyblue": ( 135, 206, 235 ),
+}
+
+def parseColor( string ):
+    """ Convert a color string to an (r, g, b) tuple.
+
+    Args:
+        string: A hex string ('#00ccff' or '#0cf') or a color name ('Red')
+    Returns:
+        The (r, g, b) tuple
+    Raises:
+        ValueError: If the color isn't recognized
+    """
+    string = string.strip().lower()
+    if string.startswith( "#" ):
+        digits = string[1:]
+        if len(digits) == 3:
+            digits = "".join( digit * 2 for digit in digits )
+        if len(digits) == 6:
+            return tuple( int( digits[i:i+2], 16 ) for i in ( 0, 2, 4 ) )
+    elif string.replace( " ", "" ) in NAMED_COLORS:
+        return NAMED_COLORS[ string.replace( " ", "" ) ]
+    raise ValueError( "Unknown color '{}'".format( string ) )
+
+def getPalette( colors ):
+    """ Make the palette of an image.
+
+    Args:
+        colors: Map of color ids to color strings, see util/io.py
+    Returns:
+        A tuple of the list of (r, g, b) colors, and a map of color ids to palette indices. Ids that aren't mapped,
+        including unknown colors, are drawn in the default color (index 1).
+    """
+    palette = [ BACKGROUND, DEFAULT_COLOR ]
+    indices = dict()
+    for ( id, color ) in sorted( ( colors or dict() ).items() ):
+        try:
+            rgb = parseColor( color )
+        except ValueError:
+            continue
+        if len(palette) < MAX_COLORS:
+            indices[id] = len(palette)
+            palette.append( rgb )
+    return ( palette, indices )
+
+def getRange( a0, a1, first, stop ):
+    """ Find the points of a segment that may fall between two rows (or columns); see drawBand.
+
+    Args:
+        a0, a1: The rows of the ends of the segment, in pixels
+        first: The first row
+        stop: The row after the last
+    Returns:
+        A (t0, t1) range of the fraction of the segment
+    """
+    if a0 == a1:
+        return ( 0.0, 1.0 ) if first - 0.5 <= a0 < stop - 0.5 else ( 1.0, 0.0 )
+    ( t0, t1 ) = ( ( first - 0.5 - a0 ) / ( a1 - a0 ), ( stop - 0.5 - a0 ) / ( a1 - a0 ) )
+    return ( min( t0, t1 ), max( t0, t1 ) )
+
+def getRanges( a0, a1, first, stop ):
+    """ Same as getRange, for arrays of segments. """
+    flat = a0 == a1
+    with numpy.errstate( divide="ignore", invalid="ignore" ):
+        ta = ( first - 0.5 - a0 ) / ( a1 - a0 )
+        tb = ( stop - 0.5 - a0 ) / ( a1 - a0 )
+    inside = ( first - 0.5 <= a0 ) & ( a0 < stop - 0.5 )
+    return ( numpy.where( flat, numpy.where( inside, 0.0, 1.0 ), numpy.minimum( ta, tb ) ),
+             numpy.where( flat, numpy.where( inside, 1.0, 0.0 ), numpy.maximum( ta, tb ) ) )
+
+def drawBand( x0, y0, x1, y1, colors, top, width, height ):
+    """ Draw segments into a band of rows. Runs in a worker process if the image is rendered in parallel.
+
+    Args:
+        x0, y0, x1, y1: Sequences of the ends of the segments, in pixels (rows grow downward)
+        colors: Sequence of the palette index of every segment
+        top: The first row of the band
+        width: The width of the band, in pixels
+        height: The number of rows of the band
+    Returns:
+        The rows of the band as PNG scanlines, i.e. every row is prefixed w/ a filter type of 0 (none)
+    """
+    if numpy is not None:
+        return drawBandVectorized( x0, y0, x1, y1, colors, top, width, height )
+
+    stride = width + 1
+    pixels = bytearray( stride * height )
+    for ( ax, ay, bx, by, color ) in zip( x0, y0, x1, y1, colors ):
+        ( dx, dy ) = ( bx - ax, by - ay )
+        steps = int( max( abs( dx ), abs( dy ) ) ) + 1
+        # Only the points near the band, widened by a point on each side
+        ( t0, t1 ) = getRange( ay, by, top, top + height )
+        ( u0, u1 ) = getRange( ax, bx, 0, width )
+        ( t0, t1 ) = ( max( t0, u0 ), min( t1, u1 ) )
+        for k in range( max( 0, floor( t0 * steps ) - 1 ), min( steps, ceil( t1 * steps ) + 1 ) + 1 ):
+            t = k / steps
+            row = floor( ay + dy * t + 0.5 ) - top
+            column = floor( ax + dx * t + 0.5 )
+            if 0 <= row < height and 0 <= column < width:
+                pixels[ row * stride + column + 1 ] = color
+    return bytes( pixels )
+
+def drawBandVectorized( x0, y0, x1, y1, colors, top, width, height ):
+    """ Draw segments into a band of rows w/ NumPy. Same as drawBand, which draws one point at a time. """
+    ( x0, y0, x1, y1 ) = ( numpy.asarray( a, dtype=numpy.float64 ) for a in ( x0, y0, x1, y1 ) )
+    colors = numpy.asarray( colors, dtype=numpy.uint8 )
+    pixels = numpy.zeros( ( height, width + 1 ), dtype=numpy.uint8 )
+    if len(x0) == 0:
+        return pixels.tobytes()
+
+    ( dx, dy ) = ( x1 - x0, y1 - y0 )
+    steps = numpy.maximum( numpy.abs( dx ), numpy.abs( dy ) ).astype( numpy.int64 ) + 1
+
+    # Only the points near the band, the same range as drawBand
+    ( t0, t1 ) = getRanges( y0, y1, top, top + height )
+    ( u0, u1 ) = getRanges( x0, x1, 0, width )
+    ( t0, t1 ) = ( numpy.maximum( t0, u0 ), numpy.minimum( t1, u1 ) )
+    first = numpy.maximum( 0, numpy.floor( t0 * steps ).astype( numpy.int64 ) - 1 )
+    last = numpy.minimum( steps, numpy.ceil( t1 * steps ).astype( numpy.int64 ) + 1 )
+    counts = numpy.maximum( 0, last - first + 1 )
+
+    # One entry per point, in the order the segments are drawn
+    segment = numpy.repeat( numpy.arange( len(x0) ), counts )
+    k = numpy.arange( len(segment) ) - numpy.repeat( numpy.cumsum( counts ) - counts, counts ) + first[segment]
+    t = k / steps[segment]
+    rows = numpy.floor( y0[segment] + dy[segment] * t + 0.5 ).astype( numpy.int64 ) - top
+    columns = numpy.floor( x0[segment] + dx[segment] * t + 0.5 ).astype( numpy.int64 )
+    keep = ( rows >= 0 ) & ( rows < height ) & ( columns >= 0 ) & ( columns < width )
+    pixels[ rows[keep], columns[keep] + 1 ] = colors[ segment[keep] ]
+    return pixels.tobytes()
+
+def writeChunk( file, kind, data ):
+    """ Write a PNG chunk.
+
+    Args:
+        file: A file opened in binary mode
+        kind: The 4 byte type of the chunk, e.g. b'IDAT'
+        data: The bytes of the chunk
+    """
+    file.write( struct.pack( ">I", len(data) ) )
+    file.write( kind )
+    file.write( data )
+    file.write( struct.pack( ">I", zlib.crc32( kind + data ) & 0xFFFFFFFF ) )
+
+class Raster( object ):
+
+    def __init__( self, geometry, size=IMAGE_SIZE, colors=None, viewport=None ):
+        """ Constructor. Fits a Geometry (or a region of it) to an image, and sorts its segments into bands.
+
+        Args:
+            geometry: A Geometry object
+            size: The width of the image (or height, if it is taller), in pixels
+            colors: Map of color ids to color strings, see util/io.py
+            viewport: The (xmin, ymin, xmax, ymax) region to draw, or None for the whole Geometry w/ a margin
+        Raises:
+            ValueError: If the size isn't positive
+        """
+        if size < 1:
+            raise ValueError( "The size of an image must be positive, not {}".format( size ) )
+
+        ( xmin, ymin, xmax, ymax ) = getBounds( geometry ) if viewport is None else viewport
+        margin = round( size * MARGIN ) if viewport is None else 0
+        scale = max( 0, size - 1 - 2 * margin ) / max( xmax - xmin, ymax - ymin, 1e-9 )
+        self.width = ceil( ( xmax - xmin ) * scale - 1e-9 ) + 1 + 2 * margin
+        self.height = ceil( ( ymax - ymin ) * scale - 1e-9 ) + 1 + 2 * margin
+        ( self.palette, indices ) = getPalette( colors )
+
+        self.count = ceil( self.height / BAND_HEIGHT )     # Number of bands
+
+        # Pixel coordinates, w/ rows growing downward
+        ( left, bottom ) = ( margin - xmin * scale, margin + ymax * scale )
+        if numpy is not None:
+            self.x0 = left + numpy.frombuffer( geometry.x0, dtype=numpy.float64 ) * scale
+            self.x1 = left + numpy.frombuffer( geometry.x1, dtype=numpy.float64 ) * scale
+            self.y0 = bottom - numpy.frombuffer( geometry.y0, dtype=numpy.float64 ) * scale
+            self.y1 = bottom - numpy.frombuffer( geometry.y1, dtype=numpy.float64 ) * scale
+            lookup = numpy.ones( 1 + max( indices, default=0 ), dtype=numpy.uint8 )
+            for ( id, index ) in indices.items():
+                if id >= 0:
+                    lookup[id] = index
+            ids = numpy.array( geometry.colors, dtype=numpy.int64 )
+            known = ( ids >= 0 ) & ( ids < len(lookup) )
+            self.colors = numpy.where( known, lookup[ numpy.where( known, ids, 0 ) ], 1 ).astype( numpy.uint8 )
+            self.first = numpy.floor( numpy.minimum( self.y0, self.y1 ) - 1 ).astype( numpy.int64 ) // BAND_HEIGHT
+            self.last = numpy.floor( numpy.maximum( self.y0, self.y1 ) + 1 ).astype( numpy.int64 ) // BAND_HEIGHT
+            return
+
+        self.x0 = array( "d", ( left + x * scale for x in geometry.x0 ) )
+        self.x1 = array( "d", ( left + x * scale for x in geometry.x1 ) )
+        self.y0 = array( "d", ( bottom - y * scale for y in geometry.y0 ) )
+        self.y1 = array( "d", ( bottom - y * scale for y in geometry.y1 ) )
+        self.colors = array( "B", ( indices.get( id, 1 ) for id in geometry.colors ) )
+
+        # The segments crossing every band, in drawing order
+        self.bands = [ array( "l" ) for _ in range( self.count ) ]
+        for ( i, ( y0, y1 ) ) in enumerate( zip( self.y0, self.y1 ) ):
+            first = max( 0, floor( min( y0, y1 ) - 1 ) // BAND_HEIGHT )
+            last = min( self.count - 1, floor( max( y0, y1 ) + 1 ) // BAND_HEIGHT )
+            for band in range( first, last + 1 ):
+                self.bands[band].append( i )
+
+    def getBand( self, band ):
+        """ Return the arguments of drawBand for a band: the segments that cross it, in drawing order. """
+        top = band * BAND_HEIGHT
+        args = ( top, self.width, min( BAND_HEIGHT, self.height - top ) )
+        if numpy is not None:
+            segments = numpy.flatnonzero( ( self.first <= band ) & ( self.last >= band ) )
+            return ( self.x0[segments], self.y0[segments], self.x1[segments], self.y1[segments],
+                     self.colors[segments] ) + args
+
+        segments = self.bands[band]
+        return ( [ self.x0[i] for i in segments ], [ self.y0[i] for i in segments ],
+                 [ self.x1[i] for i in segments ], [ self.y1[i] for i in segments ],
+                 [ self.colors[i] for i in segments ] ) + args
+
+    def iterBands( self, workers=1 ):
+        """ Draw every band, in order.
+
+        Args:
+            workers: Number of processes drawing bands
+        Returns:
+            A generator of the scanlines of every band, see drawBand
+        """
+        if workers <= 1:
+            for band in range( self.count ):
+                yield drawBand( *self.getBand( band ) )
+            return
+
+        # Keep a bounded number of bands in flight, so that drawn bands don't pile up ahead of the writer
+        with ProcessPoolExecutor( max_workers=workers ) as pool:
+            pending = deque()
+            for band in range( self.count ):
+                pending.append( pool.submit( drawBand, *self.getBand( band ) ) )
+                if len(pending) >= workers * BANDS_PER_WORKER:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def write( self, filename, workers=1 ):
+        """ Render the image and write it to a PNG file.
+
+        Args:
+            filename: The path of the file
+            workers: Number of processes drawing bands
+        Raises:
+            OSError: If the file can't be written
+        """
+        with open( filename, "wb" ) as file:
+            file.write( PNG_SIGNATURE )
+            # 8 bit indexed color, default compression & filtering, not interlaced
+            writeChunk( file, b"IHDR", struct.pack( ">IIBBBBB", self.width, self.height, 8, 3, 0, 0, 0 ) )
+            writeChunk( file, b"PLTE", bytes( channel for rgb in self.palette for channel in rgb ) )
+
+            compressor = zlib.compressobj( COMPRESS_LEVEL )
+            for scanlines in self.iterBands( workers ):
+                data = compressor.compress( scanlines )
+                if data:
+                    writeChunk( file, b"IDAT", data )
+            writeChunk( file, b"IDAT", compressor.flush() )
+            writeChunk( file, b"IEND", b"" )
+
+def writePng( filename, geometry, size=IMAGE_SIZE, colors=None, workers=1, viewport=None ):
+    """ Render a Geometry to a PNG file.
+
+    Args:
+        filename: The path of the file
+        geometry: A Geometry object
+        size: The width of the image (or height, if it is taller), in pixels
+        colors: Map of color ids to color strings, see util/io.py
+        workers: Number of processes drawing bands
+        viewport: The (xmin, ymin, xmax, ymax) region to draw, or None for the whole Geometry
+    Raises:
+        OSError: If the file can't be written
+        ValueError: If the size isn't positive
+    """
+    Raster( geometry, size, colors, viewport ).write( filename, workers )
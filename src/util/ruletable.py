@@ -0,0 +1,461 @@
+"""
+Compiled rule tables
+A ruleset compiled into flat lookup structures, so that expansion doesn't have to go through
+Rule.getResult -> ProbabilityMask.roll for every character.
+
+For deterministic, context-free lsys objects (most of all.xml) every variable maps to exactly one string,
+so a whole generation can be rewritten in one bulk operation with str.translate.
+Such rulesets are said to have a 'fast path'.
+
+A ruleset without a fast path still benefits from the constant-time variable lookup.
+
+Context-sensitive rulesets need the neighbors of every token, so they are rewritten a whole generation at a time
+as lists of tokens. The neighbors of every token of a generation are found in two linear passes, and each context
+is compiled into a matcher (see classes/context.py), so choosing a production costs about as much as a dictionary
+lookup.
+
+Stochastic, context-free rulesets w/o size modifiers are rewritten in bulk as well: every generation is split on
+its variables, and the results of all the occurrences of a variable are selected in one batch (see util/probmask.py).
+The result of a stochastic rule is selected by the key of the token it rewrites (see util/stream.py), so every
+method that rewrites tokens takes their keys, and returns the keys of the tokens that replace them.
+
+Parametric rulesets (see classes/symbol.py) are compiled into functions of the parameters of each variable, and
+are expanded as tuples of (token, parameters) modules instead of strings. Other rulesets are also compiled into
+arrays of integer opcodes (see util/opcodes.py), which are interpreted w/o being parsed again.
+"""
+
+import re
+
+from util.expand import tokenize, COLOR_TOKEN, SIZE_TOKEN, TURN_TOKENS
+from util.stream import getChildKey, toUniform, toUniforms
+from util.opcodes import Program
+from classes.symbol import symbol, evaluateModules, EVALUATION_ERRORS
+
+CHUNK_LENGTH = 1 << 16      # Longest expansion of a single variable that is rewritten in bulk
+
+def isIgnored( token ):
+    """ Return whether a token is invisible to contexts (turns, color codes and size modifiers). """
+    return token in TURN_TOKENS or token[0] == COLOR_TOKEN or token[0] == SIZE_TOKEN
+
+def getLeftNeighbors( tokens ):
+    """ Find the left neighbor of every token, skipping branches.
+
+    Args:
+        tokens: A list of tokens
+    Returns:
+        A list of indices, the i-th being the index of the left neighbor of tokens[i], or -1 if it has none.
+    """
+    result = [ -1 ] * len(tokens)
+    stack = []
+    last = -1
+    for ( i, token ) in enumerate( tokens ):
+        if token == "[":
+            stack.append( last )
+        elif token == "]":
+            last = stack.pop() if len(stack) > 0 else -1
+        elif not isIgnored( token ):
+            result[i] = last
+            last = i
+    return result
+
+def getRightNeighbors( tokens ):
+    """ Find the right neighbor of every token, skipping branches. The last token of a branch has none.
+
+    Args:
+        tokens: A list of tokens
+    Returns:
+        A list of indices, the i-th being the index of the right neighbor of tokens[i], or -1 if it has none.
+    """
+    result = [ -1 ] * len(tokens)
+    stack = []
+    following = -1
+    for i in range( len(tokens) - 1, -1, -1 ):
+        token = tokens[i]
+        if token == "]":
+            stack.append( following )
+            following = -1
+        elif token == "[":
+            following = stack.pop() if len(stack) > 0 else -1
+        elif not isIgnored( token ):
+            result[i] = following
+            following = i
+    return result
+
+def getNeighbors( tokens, links, i, count ):
+    """ Follow the neighbor links of a token.
+
+    Args:
+        tokens: A list of tokens
+        links: The neighbor indices, from getLeftNeighbors or getRightNeighbors
+        i: The index of the token
+        count: The maximum number of neighbors
+    Returns:
+        A list of up to 'count' neighboring tokens, nearest first.
+    """
+    result = []
+    j = links[i]
+    while j >= 0 and len(result) < count:
+        result.append( tokens[j] )
+        j = links[j]
+    return result
+
+class RuleTable( object ):
+
+    def __init__( self, ruleset ):
+        """ Constructor. Compiles a ruleset.
+
+        Args:
+            ruleset: The map of tokens to rules that transform those tokens.
+        """
+        self.variables = frozenset( var for var in ruleset.keys() if len(var) == 1 )
+        self.results = dict()
+        self.table = None
+        self.lengths = []
+        self.contextSensitive = any( ruleset[var].isContextSensitive() for var in self.variables )
+        self.parametric = any( ruleset[var].isParametric() for var in self.variables )
+        self.productions = dict()
+        self.modules = dict()
+        self.masks = { var: ruleset[var].mask for var in self.variables }
+        self.positions = dict()
+        self.batched = False
+
+        # Every production of every variable, in the order they are tried, w/ their results compiled
+        for var in self.variables:
+            if self.parametric:
+                self.modules[var] = self.compileModules( ruleset[var] )
+            else:
+                self.productions[var] = [ ( context, context.getLength(), mask,
+                                            { item.elem: tuple( tokenize( item.elem ) ) for item in mask.mask } )
+                                          for ( context, mask ) in ruleset[var].getProductions() ]
+        self.stochasticModules = any( len(production[4].mask) > 1
+                                      for productions in self.modules.values() for production in productions )
+
+        for var in self.variables:
+            rule = ruleset[var]
+            if self.parametric or rule.isStochastic() or rule.isContextSensitive() or rule.mask.isEmpty():
+                self.results = None
+                break
+            self.results[var] = rule.mask.mask[0].elem
+
+        # Size modifiers are scoped to the rule string they appear in, bulk rewriting would lose that scope
+        if self.results is not None and \
+                not any( "@" in result for result in self.results.values() ) and \
+                not any( var.isdigit() for var in self.variables ):
+            self.table = str.maketrans( self.results )
+
+        # Likewise for stochastic rulesets, whose results are drawn a generation at a time
+        if self.results is None and not self.parametric and not self.contextSensitive and \
+                not any( "@" in ( item.elem or "" ) for mask in self.masks.values() for item in mask.mask ) and \
+                not any( var.isdigit() for var in self.variables ):
+            self.batched = True
+            self.splitter = re.compile( "([{}])".format( re.escape( "".join( sorted( self.variables ) ) ) ) )
+
+        # Rule strings as opcodes, see util/opcodes.py
+        self.program = None if self.parametric else Program( self )
+
+    def compileModules( self, rule ):
+        """ Compile the productions of a parametric rule.
+
+        Args:
+            rule: A Rule object
+        Returns:
+            A list of (context, neighbor lengths, condition, arity, mask, results, only, signature) tuples, in the
+            order they are tried, where 'condition' is a function of the parameters (or None), 'results' maps each
+            case of the mask to a function of the parameters returning a tuple of modules, 'only' is the function of
+            a mask w/ a single case (or None), and 'signature' is the symbol of the rule.
+        Raises:
+            ValueError: If an expression isn't valid
+        """
+        signature = symbol( rule.token, rule.params )
+        result = []
+        for ( context, mask ) in rule.getProductions():
+            condition = None if context.condition is None else signature.compileCondition( context.condition )
+            results = { item.elem: signature.compileResult( item.elem ) for item in mask.mask }
+            only = results[mask.mask[0].elem] if len(mask.mask) == 1 else None
+            result.append( ( context, context.getLength(), condition, len(rule.params), mask, results, only,
+                             signature ) )
+        return result
+
+    def getProgram( self ):
+        """ Return the opcodes of this ruleset, see util/opcodes.py; None if it is parametric. """
+        return self.program
+
+    def isParametric( self ):
+        """ Return whether this ruleset must be expanded as parametric modules. """
+        return self.parametric
+
+    def hasStochasticModules( self ):
+        """ Return whether a parametric rule has more than one case, so that rewriting a module needs its key. """
+        return self.stochasticModules
+
+    def parseModules( self, string ):
+        """ Evaluate a string of symbols (e.g. an axiom) into a tuple of modules. """
+        return evaluateModules( string )
+
+    def rewriteModule( self, token, params, left=(), right=(), key=0 ):
+        """ Apply the first production of a parametric rule whose context and condition hold.
+
+        Args:
+            token: The token of the module
+            params: The parameter values of the module
+            left: Tokens to the left of the module, nearest first (only needed by context-sensitive rules)
+            right: Tokens to the right of the module, nearest first
+            key: The key of the module, which selects the result of a stochastic rule
+        Returns:
+            A tuple of modules, or None if no production applies (the module is left unchanged).
+        Raises:
+            ValueError: If an expression can't be evaluated w/ the parameters, e.g. a division by zero
+        """
+        for ( context, lengths, condition, arity, mask, results, only, signature ) in self.modules.get( token, () ):
+            if arity != len(params):
+                return None
+            if lengths != ( 0, 0 ) and not context.matches( left, right ):
+                continue
+            try:
+                if condition is not None and not condition( *params ):
+                    continue
+            except EVALUATION_ERRORS as e:
+                raise ValueError( "invalid expression '{}' in {}, w/ parameters {}: {}".format(
+                    context.condition, signature.describe(), params, e ) )
+            if only is not None:
+                ( outcome, function ) = ( None, only )
+            else:
+                outcome = mask.select( toUniform( key ) )
+                function = results.get( outcome )
+            if function is None:
+                return ()
+            try:
+                return function( *params )
+            except EVALUATION_ERRORS as e:
+                raise ValueError( "invalid expression '{}' in {}, w/ parameters {}: {}".format(
+                    mask.mask[0].elem if outcome is None else outcome, signature.describe(), params, e ) )
+        return None
+
+    def getNeighborCounts( self, token ):
+        """ Return the number of (left, right) neighbors needed by the productions of a parametric variable. """
+        lengths = [ production[1] for production in self.modules[token] ]
+        return ( max( l for ( l, r ) in lengths ), max( r for ( l, r ) in lengths ) )
+
+    def rewriteModules( self, modules, keys ):
+        """ Rewrite a whole generation of parametric modules, honoring contexts.
+
+        Args:
+            modules: A generation of the lsys, as a list of (token, params) modules
+            keys: The key of every module
+        Returns:
+            A tuple of the next generation and the keys of its modules.
+        """
+        tokens = [ token for ( token, params ) in modules ]
+        left = getLeftNeighbors( tokens ) if self.contextSensitive else None
+        right = getRightNeighbors( tokens ) if self.contextSensitive else None
+        result = []
+        result_keys = []
+
+        for ( i, ( token, params ) ) in enumerate( modules ):
+            successor = None
+            if token in self.modules:
+                if self.contextSensitive:
+                    ( nleft, nright ) = self.getNeighborCounts( token )
+                    successor = self.rewriteModule( token, params, getNeighbors( tokens, left, i, nleft ),
+                                                    getNeighbors( tokens, right, i, nright ), keys[i] )
+                else:
+                    successor = self.rewriteModule( token, params, key=keys[i] )
+            if successor is None:
+                successor = ( ( token, params ), )
+            result.extend( successor )
+            result_keys.extend( getChildKey( keys[i], j ) for j in range( len(successor) ) )
+
+        return ( result, result_keys )
+
+    def isDeterministic( self ):
+        """ Check whether every variable maps to exactly one string, regardless of its neighbors.
+
+        Returns:
+            True if the results of the rules can be looked up directly. False otherwise.
+        """
+        return self.results is not None
+
+    def isContextSensitive( self ):
+        """ Return whether any rule depends on the neighbors of its token. """
+        return self.contextSensitive
+
+    def isBatched( self ):
+        """ Return whether this ruleset is stochastic, but can still be rewritten in bulk. """
+        return self.batched
+
+    def roll( self, var, key ):
+        """ Choose the result of a context-free variable.
+
+        Args:
+            var: A variable of the lsys
+            key: The key of the variable's token
+        Returns:
+            The result string
+        """
+        return self.masks[var].select( toUniform( key ) ) or ""
+
+    def getChildKeys( self, string, key ):
+        """ Get the keys of the variables of a string.
+
+        Args:
+            string: A rule string, or an axiom
+            key: The key of the token that the string replaced, or the root key of the lsys for an axiom
+        Returns:
+            The list of the keys of the variables of the string, in order.
+        """
+        positions = self.positions.get( string )
+        if positions is None:
+            positions = self.positions[string] = [ i for ( i, c ) in enumerate( string ) if c in self.variables ]
+        return [ getChildKey( key, i ) for i in positions ]
+
+    def hasFastPath( self ):
+        """ Check whether whole generations can be rewritten in bulk.
+
+        Returns:
+            True if the ruleset is deterministic, context-free and has no size modifiers. False otherwise.
+        """
+        return self.table is not None
+
+    def rewrite( self, string ):
+        """ Rewrite a whole generation at once. Only valid if this table has a fast path.
+
+        Args:
+            string: A generation of the lsys
+        Returns:
+            The next generation
+        """
+        return string.translate( self.table )
+
+    def expand( self, string, depth, keys=None ):
+        """ Rewrite a string a given number of times. Only valid if this table has a fast path, or is batched.
+
+        Args:
+            string: A string of symbols
+            depth: Number of generations
+            keys: The keys of the variables of the string, only needed by a batched table
+        Returns:
+            The string after 'depth' generations.
+        """
+        if self.table is None:
+            for _ in range( depth ):
+                ( string, keys ) = self.rewriteBatch( string, keys )
+            return string
+
+        for _ in range( depth ):
+            string = string.translate( self.table )
+        return string
+
+    def rewriteBatch( self, string, keys ):
+        """ Rewrite a whole generation of a stochastic ruleset, selecting the results of each variable in one batch.
+
+        Args:
+            string: A generation of the lsys
+            keys: The keys of the variables of the string, in order
+        Returns:
+            A tuple of the next generation and the keys of its variables.
+        """
+        parts = self.splitter.split( string )     # Variables are at the odd indices
+        uniforms = toUniforms( keys )
+        occurrences = dict()
+        for n in range( len(keys) ):
+            occurrences.setdefault( parts[2*n+1], [] ).append( n )
+        for ( var, indices ) in occurrences.items():
+            for ( n, result ) in zip( indices, self.masks[var].sample( [ uniforms[n] for n in indices ] ) ):
+                parts[2*n+1] = result or ""
+
+        result_keys = []
+        for n in range( len(keys) ):
+            result_keys.extend( self.getChildKeys( parts[2*n+1], keys[n] ) )
+        return ( "".join( parts ), result_keys )
+
+    def rewriteTokens( self, tokens, keys ):
+        """ Rewrite a whole generation, choosing the production of every variable by its neighbors.
+
+        Args:
+            tokens: A generation of the lsys, as a list of tokens
+            keys: The key of every token
+        Returns:
+            A tuple of the next generation, as a list of tokens, and the keys of its tokens.
+        """
+        left = getLeftNeighbors( tokens )
+        right = getRightNeighbors( tokens )
+        result = []
+        result_keys = []
+
+        for ( i, token ) in enumerate( tokens ):
+            successor = ( token, )
+            for ( context, ( nleft, nright ), mask, results ) in self.productions.get( token, () ):
+                if context.matches( getNeighbors( tokens, left, i, nleft ), getNeighbors( tokens, right, i, nright ) ):
+                    successor = results.get( mask.select( toUniform( keys[i] ) ), () )
+                    break
+            result.extend( successor )
+            result_keys.extend( getChildKey( keys[i], j ) for j in range( len(successor) ) )
+
+        return ( result, result_keys )
+
+    def generate( self, string, depth, key ):
+        """ Rewrite a string a given number of times, a generation at a time, honoring contexts.
+
+        Args:
+            string: A string of symbols
+            depth: Number of generations
+            key: The root key of the lsys
+        Returns:
+            The list of tokens after 'depth' generations.
+        """
+        tokens = tokenize( string )
+        keys = [ getChildKey( key, i ) for i in range( len(tokens) ) ]
+        for _ in range( depth ):
+            ( tokens, keys ) = self.rewriteTokens( tokens, keys )
+        return tokens
+
+    def getLength( self, symbol, depth ):
+        """ Get the number of characters that a single symbol expands into; at most, if the ruleset is batched.
+
+        Args:
+            symbol: A symbol of the lsys' alphabet
+            depth: Number of generations
+        Returns:
+            The length of the expansion of 'symbol' after 'depth' generations.
+        """
+        if symbol not in self.variables:
+            return 1
+
+        # Extend the table of lengths up to the required depth
+        while len(self.lengths) <= depth:
+            if len(self.lengths) == 0:
+                self.lengths.append( { var: 1 for var in self.variables } )
+            else:
+                previous = self.lengths[-1]
+                if self.results is not None:
+                    self.lengths.append( { var: sum( previous.get(c, 1) for c in self.results[var] )
+                                           for var in self.variables } )
+                else:
+                    self.lengths.append( { var: max( [ sum( previous.get(c, 1) for c in item.elem or "" )
+                                                       for item in self.masks[var].mask ], default=0 )
+                                           for var in self.variables } )
+
+        return self.lengths[depth][symbol]
+
+    def isBulk( self, symbol, depth ):
+        """ Check whether the expansion of a symbol is short enough to be rewritten in bulk.
+
+        Args:
+            symbol: A variable of the lsys
+            depth: Remaining number of generations
+        Returns:
+            True if the symbol should be rewritten with 'expand'. False otherwise.
+        """
+        return ( self.table is not None or self.batched ) and self.getLength( symbol, depth ) <= CHUNK_LENGTH
+
+    def isShort( self, symbol, depth ):
+        """ Check whether the expansion of a symbol is short enough to be kept in memory whole.
+        Only valid if this table is deterministic.
+
+        Args:
+            symbol: A variable of the lsys
+            depth: Remaining number of generations
+        Returns:
+            True if the expansion has at most CHUNK_LENGTH characters. False otherwise.
+        """
+        return self.getLength( symbol, depth ) <= CHUNK_LENGTH
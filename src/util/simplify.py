@@ -0,0 +1,121 @@
+"""
+Geometry simplification
+Reduce the number of segments of a Geometry (see util/geometry.py) without changing what it looks like.
+
+Two passes are made:
+    Duplicate edges are removed. Every segment is hashed by its two ends (in either order) and its color, w/ the
+    coordinates quantized to a tiny fraction of the size of the drawing, so that ends which only differ by
+    rounding errors hash the same. Only the first of the segments w/ the same hash is kept.
+    Collinear segments are merged. A segment that starts where the previous one ended, goes in the same direction
+    and has the same color extends the previous one, so a run of 'F's becomes a single segment.
+Grid-like lsys objects, which draw the same edges over and over, and long straight runs, shrink by an order of
+magnitude, which makes everything drawn or saved afterwards faster.
+
+If NumPy is installed, both passes are vectorized; otherwise they're done one segment at a time, w/ the same result.
+"""
+
+from math import floor
+
+try:
+    import numpy
+except ImportError:
+    numpy = None            # Optional, only used to simplify w/ array operations
+
+from util.geometry import Geometry
+from util.svg import getBounds
+from util.profiler import profiled
+
+QUANTUM = 1e-7              # Distance under which two points are the same, relative to the size of the drawing
+COLLINEAR = 1e-9            # Largest sine of the angle between two segments that are deemed collinear
+MIN_VECTOR_LENGTH = 64      # Fewest segments worth simplifying w/ NumPy
+
+def getQuantum( geometry ):
+    """ Return the distance under which two points of a Geometry are the same. """
+    ( xmin, ymin, xmax, ymax ) = getBounds( geometry )
+    return max( xmax - xmin, ymax - ymin, 1.0 ) * QUANTUM
+
+def isCollinear( ax, ay, bx, by ):
+    """ Return whether two vectors point in the same direction. """
+    cross = ax * by - ay * bx
+    dot = ax * bx + ay * by
+    return dot > 0 and cross * cross <= COLLINEAR * COLLINEAR * ( ax * ax + ay * ay ) * ( bx * bx + by * by )
+
+@profiled( "simplify" )
+def simplify( geometry ):
+    """ Remove the duplicate edges of a Geometry, and merge its runs of collinear segments.
+
+    Args:
+        geometry: A Geometry object
+    Returns:
+        A new, simplified Geometry
+    """
+    if numpy is not None and len(geometry) >= MIN_VECTOR_LENGTH:
+        return simplifyVectorized( geometry )
+
+    quantum = getQuantum( geometry )
+    quantize = lambda value: floor( value / quantum + 0.5 )
+
+    # Keep the first of every edge
+    seen = set()
+    kept = []
+    for segment in geometry.iterSegments():
+        ( x0, y0, x1, y1, color ) = segment
+        ( a, b ) = ( ( quantize( x0 ), quantize( y0 ) ), ( quantize( x1 ), quantize( y1 ) ) )
+        key = ( min( a, b ), max( a, b ), color )
+        if key not in seen:
+            seen.add( key )
+            kept.append( ( segment, a, b ) )
+
+    # Extend the previous segment w/ every segment that continues it
+    result = Geometry()
+    last = None             # The merged segment, the quantized end & the direction of its last segment
+    for ( segment, a, b ) in kept:
+        ( x0, y0, x1, y1, color ) = segment
+        direction = ( x1 - x0, y1 - y0 )
+        if last is not None:
+            ( merged, end, previous ) = last
+            if a == end and color == merged[4] and isCollinear( *( previous + direction ) ):
+                last = ( ( merged[0], merged[1], x1, y1, color ), b, direction )
+                continue
+            result.add( *merged )
+        last = ( segment, b, direction )
+    if last is not None:
+        result.add( *last[0] )
+    return result
+
+def simplifyVectorized( geometry ):
+    """ Same as simplify, w/ NumPy array operations. """
+    quantum = getQuantum( geometry )
+    ( x0, y0, x1, y1 ) = ( numpy.frombuffer( a, dtype=numpy.float64 ) for a in
+                           ( geometry.x0, geometry.y0, geometry.x1, geometry.y1 ) )
+    colors = numpy.array( geometry.colors, dtype=numpy.int64 )
+    ( qx0, qy0, qx1, qy1 ) = ( numpy.floor( a / quantum + 0.5 ).astype( numpy.int64 ) for a in ( x0, y0, x1, y1 ) )
+
+    # Keep the first of every edge; ends are ordered like tuples, so that both directions hash the same
+    swap = ( qx1 < qx0 ) | ( ( qx1 == qx0 ) & ( qy1 < qy0 ) )
+    keys = numpy.stack( [ numpy.where( swap, qx1, qx0 ), numpy.where( swap, qy1, qy0 ),
+                          numpy.where( swap, qx0, qx1 ), numpy.where( swap, qy0, qy1 ), colors ], axis=1 )
+    ( _, first ) = numpy.unique( keys, axis=0, return_index=True )
+    first.sort()
+    ( x0, y0, x1, y1, colors ) = ( a[first] for a in ( x0, y0, x1, y1, colors ) )
+    ( qx0, qy0, qx1, qy1 ) = ( a[first] for a in ( qx0, qy0, qx1, qy1 ) )
+
+    # A run of segments that continue each other becomes the first's start and the last's end
+    ( dx, dy ) = ( x1 - x0, y1 - y0 )
+    ( ax, ay, bx, by ) = ( dx[:-1], dy[:-1], dx[1:], dy[1:] )
+    cross = ax * by - ay * bx
+    continues = ( qx0[1:] == qx1[:-1] ) & ( qy0[1:] == qy1[:-1] ) & ( colors[1:] == colors[:-1] ) & \
+        ( ax * bx + ay * by > 0 ) & ( cross * cross <= COLLINEAR * COLLINEAR * ( ax * ax + ay * ay ) * ( bx * bx + by * by ) )
+
+    # A segment that continues the previous one merges w/ it, which in turn may merge w/ the one before, and so on;
+    # every run is from a segment that doesn't continue the previous one to the segment before the next such one
+    starts = numpy.flatnonzero( numpy.concatenate( ( [ True ], ~continues ) ) )
+    ends = numpy.concatenate( ( starts[1:] - 1, [ len(x0) - 1 ] ) )
+
+    result = Geometry()
+    result.x0.frombytes( x0[starts].tobytes() )
+    result.y0.frombytes( y0[starts].tobytes() )
+    result.x1.frombytes( x1[ends].tobytes() )
+    result.y1.frombytes( y1[ends].tobytes() )
+    result.colors.extend( colors[starts].tolist() )
+    return result
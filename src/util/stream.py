@@ -0,0 +1,54 @@
+"""
+Counter-based random streams
+Random numbers that are a pure function of a seed and a position, rather than of the order in which they are drawn.
+
+Every token of an expansion is identified by its derivation path: the index of its ancestor in the axiom, the index
+of its ancestor in that ancestor's rule string, and so on. A key is hashed from the seed and the path, one step
+at a time, so the key of a token only depends on the key of its parent and its index in the parent's rule string.
+The choice of a stochastic rule is then a uniform number hashed from the key of the token being rewritten.
+
+So a stochastic lsys expands into the same string whether it is expanded depth-first, a generation at a time, in
+separate chunks or in separate processes, as long as every part starts from the right key.
+
+Keys are mixed w/ the finalizer of SplitMix64 (Steele, Lea & Flood, 2014), which is cheap and passes BigCrush.
+"""
+
+try:
+    import numpy
+except ImportError:
+    numpy = None            # Optional, only used to hash many keys at once
+
+MASK = ( 1 << 64 ) - 1
+GOLDEN = 0x9E3779B97F4A7C15     # Increment of SplitMix64, 2^64 / golden ratio
+SALT = 0xD1B54A32D192ED03       # Separates the uniform of a key from the keys of its children
+MIN_VECTOR_LENGTH = 64          # Fewest keys worth hashing w/ NumPy
+
+def mix( x ):
+    """ Hash a 64 bit integer (the finalizer of SplitMix64). """
+    x = ( ( x ^ ( x >> 30 ) ) * 0xBF58476D1CE4E5B9 ) & MASK
+    x = ( ( x ^ ( x >> 27 ) ) * 0x94D049BB133111EB ) & MASK
+    return x ^ ( x >> 31 )
+
+def getRootKey( seed ):
+    """ Return the key of the axiom of an lsys w/ a given seed. """
+    return mix( ( seed * GOLDEN ) & MASK )
+
+def getChildKey( key, index ):
+    """ Return the key of the token at a given index of the rule string that replaced the token w/ a given key. """
+    return mix( ( key + ( index + 1 ) * GOLDEN ) & MASK )
+
+def toUniform( key ):
+    """ Return a uniform number in [0, 1) for the token w/ a given key. """
+    return ( mix( key ^ SALT ) >> 11 ) * ( 1.0 / ( 1 << 53 ) )
+
+def toUniforms( keys ):
+    """ Return the uniform number of every key of a list, vectorized w/ NumPy if it is installed. """
+    if numpy is None or len(keys) < MIN_VECTOR_LENGTH:
+        return [ toUniform( key ) for key in keys ]
+
+    with numpy.errstate( over="ignore" ):
+        x = numpy.array( keys, dtype=numpy.uint64 ) ^ numpy.uint64( SALT )
+        x = ( x ^ ( x >> numpy.uint64( 30 ) ) ) * numpy.uint64( 0xBF58476D1CE4E5B9 )
+        x = ( x ^ ( x >> numpy.uint64( 27 ) ) ) * numpy.uint64( 0x94D049BB133111EB )
+        x = x ^ ( x >> numpy.uint64( 31 ) )
+    return ( x >> numpy.uint64( 11 ) ).astype( numpy.float64 ) * ( 1.0 / ( 1 << 53 ) )
@@ -0,0 +1,144 @@
+"""
+SVG writer
+Writes the segments of a Geometry (see util/geometry.py) to an SVG file, without going through a turtle canvas.
+
+The file is streamed to disk a chunk of segments at a time, so memory use does not grow w/ the drawing.
+Segments are grouped instead of being written one element each: consecutive segments of the same color share one
+<path> element, and a segment that starts where the last one ended continues its polyline, so most points are
+written once.
+Files whose names end in '.svgz' or '.gz' are compressed w/ gzip, unless told otherwise.
+
+Coordinates are written w/ just enough decimals to resolve a hundred-thousandth of the drawing, and the y axis is
+flipped, since SVG's points down whereas the turtle's points up.
+"""
+
+import gzip
+from math import ceil, log10
+from xml.sax.saxutils import quoteattr
+
+DEFAULT_COLOR = "black"     # Color of segments w/o a color id, or w/ an unknown one
+IMAGE_SIZE = 1000           # Width of the image (or height, if it is taller), in pixels
+MARGIN = 0.02               # Blank space around the drawing, relative to its size
+RESOLUTION = 1e-5           # Smallest distance written, relative to the size of the drawing
+CHUNK_LENGTH = 1 << 12      # Number of segments formatted before they are written
+POINTS_PER_LINE = 16        # Points written on each line of a path
+COMPRESS_LEVEL = 6          # Level of gzip compression; higher levels are much slower, for little gain
+
+def getBounds( geometry ):
+    """ Get the bounding box of a Geometry.
+
+    Returns:
+        A tuple of (xmin, ymin, xmax, ymax); all zeros if there are no segments.
+    """
+    if len(geometry) == 0:
+        return ( 0.0, 0.0, 0.0, 0.0 )
+    return ( min( min( geometry.x0 ), min( geometry.x1 ) ), min( min( geometry.y0 ), min( geometry.y1 ) ),
+             max( max( geometry.x0 ), max( geometry.x1 ) ), max( max( geometry.y0 ), max( geometry.y1 ) ) )
+
+def isCompressed( filename ):
+    """ Return whether a file should be compressed, judging by its name. """
+    return filename.endswith( ".svgz" ) or filename.endswith( ".gz" )
+
+class SvgWriter( object ):
+
+    def __init__( self, filename, bounds, colors=None, compress=None ):
+        """ Constructor. Opens the file and writes the header of the SVG document.
+
+        Args:
+            filename: The path of the file
+            bounds: The (xmin, ymin, xmax, ymax) bounding box of everything that will be written
+            colors: Map of color ids to color strings, see util/io.py
+            compress: Whether to compress the file w/ gzip; by default, if the filename ends in '.svgz' or '.gz'
+        Raises:
+            OSError: If the file can't be opened
+        """
+        if compress is None:
+            compress = isCompressed( filename )
+        if compress:
+            self.file = gzip.open( filename, "wt", compresslevel=COMPRESS_LEVEL, encoding="utf-8" )
+        else:
+            self.file = open( filename, "w", encoding="utf-8" )
+        self.colors = dict() if colors is None else colors
+        self.color = None           # Color id of the open path, or None
+        self.last = None            # Formatted end of the last segment, or None
+        self.end = None             # End of the last segment, as an (x, y) tuple, or None
+        self.points = 0             # Number of points on the current line of the open path
+
+        ( xmin, ymin, xmax, ymax ) = bounds
+        extent = max( xmax - xmin, ymax - ymin, 1e-9 )
+        self.format = "%.{}f".format( max( 0, ceil( -log10( extent * RESOLUTION ) ) ) )
+        margin = extent * MARGIN
+        ( width, height ) = ( xmax - xmin + 2 * margin, ymax - ymin + 2 * margin )
+        scale = IMAGE_SIZE / max( width, height )
+
+        self.file.write( '<?xml version="1.0" encoding="UTF-8"?>\n' )
+        self.file.write( '<svg xmlns="http://www.w3.org/2000/svg" width="{}" height="{}" viewBox="{} {} {} {}">\n'.format(
+            round( width * scale ), round( height * scale ), self.format % ( xmin - margin ),
+            self.format % ( -ymax - margin ), self.format % width, self.format % height ) )
+        self.file.write( '<g fill="none" stroke-width="1" stroke-linecap="round" stroke-linejoin="round">\n' )
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, *args ):
+        self.close()
+
+    def getColor( self, id ):
+        """ Return the color string of a color id. """
+        return self.colors.get( id, DEFAULT_COLOR )
+
+    def write( self, geometry ):
+        """ Append every segment of a Geometry to the document.
+
+        Args:
+            geometry: A Geometry object
+        """
+        buffer = []
+        point = self.format + " " + self.format
+        for ( x0, y0, x1, y1, color ) in geometry.iterSegments():
+            if color != self.color:
+                if self.color is not None:
+                    buffer.append( '"/>\n' )
+                buffer.append( '<path stroke={} vector-effect="non-scaling-stroke" d="'.format(
+                    quoteattr( self.getColor( color ) ) ) )
+                ( self.color, self.last, self.end, self.points ) = ( color, None, None, 0 )
+
+            # Continue the polyline if the segment starts where the last one ended, up to the written precision
+            if ( x0, y0 ) != self.end:
+                start = point % ( x0, 0.0 - y0 )
+                if start != self.last:
+                    buffer.append( "M" + start )
+                    self.points += 1
+            self.last = point % ( x1, 0.0 - y1 )
+            self.end = ( x1, y1 )
+            buffer.append( ( "\n" if self.points >= POINTS_PER_LINE else " " ) + self.last )
+            self.points = 1 if self.points >= POINTS_PER_LINE else self.points + 1
+
+            if len(buffer) >= CHUNK_LENGTH:
+                self.file.write( "".join( buffer ) )
+                buffer = []
+        self.file.write( "".join( buffer ) )
+
+    def close( self ):
+        """ Finish the document and close the file. """
+        if self.color is not None:
+            self.file.write( '"/>\n' )
+            self.color = None
+        self.file.write( "</g>\n</svg>\n" )
+        self.file.close()
+
+def writeSvg( filename, geometry, colors=None, compress=None, viewport=None ):
+    """ Write a Geometry to an SVG file.
+
+    Args:
+        filename: The path of the file
+        geometry: A Geometry object
+        colors: Map of color ids to color strings, see util/io.py
+        compress: Whether to compress the file w/ gzip; by default, if the filename ends in '.svgz' or '.gz'
+        viewport: The (xmin, ymin, xmax, ymax) region shown, or None for the whole Geometry
+    Raises:
+        OSError: If the file can't be written
+    """
+    bounds = getBounds( geometry ) if viewport is None else viewport
+    with SvgWriter( filename, bounds, colors, compress ) as writer:
+        writer.write( geometry )